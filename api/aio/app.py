@@ -0,0 +1,38 @@
+import contextlib
+import os
+
+from flask import Config
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+from starlette.applications import Starlette
+
+from api.aio.routes import not_found, routes
+
+
+def async_database_uri(uri):
+    """Point a ``postgresql://`` URI at the asyncpg driver."""
+    return str(make_url(uri).set(drivername='postgresql+asyncpg'))
+
+
+def create_async_app(config_object='config.RunConfig'):
+    """ASGI application serving the read endpoints on asyncio.
+
+    It shares the models and settings of the Flask app, but runs every query
+    through one SQLAlchemy async engine (asyncpg), so a single process keeps
+    thousands of concurrent requests in flight on one connection pool.
+    Writes stay on the threaded app.
+    """
+    config = Config(os.getcwd())
+    config.from_object(config_object)
+
+    @contextlib.asynccontextmanager
+    async def lifespan(app):
+        app.state.config = config
+        app.state.engine = create_async_engine(
+            async_database_uri(config['SQLALCHEMY_DATABASE_URI']),
+            **config.get('SQLALCHEMY_ENGINE_OPTIONS', {})
+        )
+        yield
+        await app.state.engine.dispose()
+
+    return Starlette(debug=config['DEBUG'], routes=routes, exception_handlers={404: not_found}, lifespan=lifespan)
@@ -0,0 +1,122 @@
+from urllib.parse import urlencode
+
+from sqlalchemy import select
+from starlette.responses import HTMLResponse, Response, StreamingResponse
+from starlette.routing import Route
+from werkzeug.exceptions import NotFound
+
+from api.models.equipment import Equipment, Operation
+from api.models.vessel import Vessel
+from api.pagination import keyset, next_after, parse_list_args, prefers_ndjson
+from api.serialization import dumps, row_encoder, serialized_columns
+
+
+def json_response(value, status_code=200, headers=None):
+    return Response(dumps(value), status_code=status_code, headers=headers, media_type='application/json')
+
+
+def not_found(request=None, exc=None):
+    """The 404 page of the Flask app, for unknown ids and unknown routes."""
+    error = NotFound()
+    return HTMLResponse(error.get_body(), status_code=error.code)
+
+
+async def fetch_by_id(request, model, object_id):
+    """Serialized ``model`` row with ``object_id`` or ``None``.
+
+    Rows are not cached: writes go through the Flask app, whose lookup cache
+    this process cannot see being invalidated.
+    """
+    statement = select(*serialized_columns(model)).where(model.id == object_id)
+    async with request.app.state.engine.connect() as connection:
+        row = (await connection.execute(statement)).first()
+    return row_encoder(model)(row) if row else None
+
+
+def stream_ndjson(request, statement, model, fields=None):
+    """Stream ``statement`` as NDJSON from a server-side cursor."""
+    state = request.app.state
+    encode = row_encoder(model, fields)
+
+    async def generate():
+        async with state.engine.connect() as connection:
+            result = await connection.stream(statement)
+            async for rows in result.partitions(state.config['STREAM_CHUNK_SIZE']):
+                yield b''.join(dumps(encode(row)) + b'\n' for row in rows)
+
+    return StreamingResponse(generate(), media_type='application/x-ndjson')
+
+
+async def paginate(request, model, *criteria):
+    """Keyset page of ``model`` rows matching ``criteria``, as the threaded
+    list endpoints return it (see api.pagination.paginated_response)."""
+    state = request.app.state
+    try:
+        listing = parse_list_args(model, request.query_params, state.config)
+    except ValueError as error:
+        return json_response({'message': str(error)}, 400)
+
+    where, order_by = keyset(model, listing)
+    statement = select(*serialized_columns(model, listing.fields)).where(*criteria, *where).order_by(*order_by)
+
+    limit = listing.limit
+    if prefers_ndjson(request.query_params, request.headers.get('accept')):
+        if 'limit' in request.query_params:
+            statement = statement.limit(limit)
+        return stream_ndjson(request, statement, model, listing.fields)
+
+    async with state.engine.connect() as connection:
+        rows = (await connection.execute(statement.limit(limit + 1))).all()
+    page = rows[:limit]
+
+    encode = row_encoder(model, listing.fields)
+    headers = {}
+    if len(rows) > limit:
+        args = dict(request.query_params, after=next_after(model, listing, page[-1]), limit=limit)
+        headers['Link'] = f'<{request.url.path}?{urlencode(args)}>; rel="next"'
+    return json_response([encode(row) for row in page], headers=headers)
+
+
+async def healthcheck(request):
+    return Response('OK', media_type='text/html')
+
+
+async def list_vessel(request):
+    return await paginate(request, Vessel)
+
+
+async def view_vessel(request):
+    vessel = await fetch_by_id(request, Vessel, request.path_params['vessel_id'])
+    if vessel is None:
+        return not_found()
+    return json_response(vessel)
+
+
+async def list_equipments(request):
+    return await paginate(request, Equipment)
+
+
+async def active_equipment(request):
+    return await paginate(request, Equipment, Equipment.active.is_(True))
+
+
+async def view_equipment(request):
+    equipment = await fetch_by_id(request, Equipment, request.path_params['equipment_id'])
+    if equipment is None:
+        return not_found()
+    return json_response(equipment)
+
+
+async def list_operations(request):
+    return await paginate(request, Operation)
+
+
+routes = [
+    Route('/', healthcheck),
+    Route('/vessel', list_vessel),
+    Route('/vessel/{vessel_id:int}', view_vessel),
+    Route('/equipment', list_equipments),
+    Route('/equipment/active', active_equipment),
+    Route('/equipment/{equipment_id:int}', view_equipment),
+    Route('/equipment/operation', list_operations),
+]
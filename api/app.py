@@ -1,27 +1,48 @@
-from flasgger import Swagger
 from flask import Flask
 
+from api.cache import cache
+from api.commands import idempotency_cli, jobs_cli, operations_cli, partitions_cli
+from api.docs import docs_blueprint
+from api.log import configure_logging
+from api.metrics import configure_metrics
+from api.query_debug import configure_query_debug
+from api.replicas import configure_replicas
 from api.routes.healthcheck import healthcheck_blueprint
 from api.routes.equipment import equipments_blueprint
+from api.routes.jobs import jobs_blueprint
 from api.routes.vessel import vessels_blueprint
 from config import db
 
 
 def create_app(app_name='VESSELS', test_config=False, production_conf=False):
     app = Flask(app_name)
-    swagger = Swagger(app)
-    
+
     if test_config:
         app.config.from_object('config.TestConfig')
+    elif production_conf:
+        app.config.from_object('config.ProductionConfig')
     else:
         app.config.from_object('config.RunConfig')
 
+    configure_logging(app)
+    configure_metrics(app)
+    configure_query_debug(app)
+    configure_replicas(app)
+
     # Register api blueprints
+    app.register_blueprint(docs_blueprint)
     app.register_blueprint(healthcheck_blueprint)
     app.register_blueprint(vessels_blueprint, url_prefix='/vessel')
     app.register_blueprint(equipments_blueprint, url_prefix='/equipment')
+    app.register_blueprint(jobs_blueprint, url_prefix='/jobs')
+
+    app.cli.add_command(partitions_cli)
+    app.cli.add_command(jobs_cli)
+    app.cli.add_command(operations_cli)
+    app.cli.add_command(idempotency_cli)
 
     db.init_app(app)
+    cache.init_app(app)
 
     return app
 
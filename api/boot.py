@@ -0,0 +1,94 @@
+"""Production boot: wait for the database, apply pending migrations, create
+the upcoming partitions of operations, exec.
+
+    python -m api.boot gunicorn -c gunicorn.conf.py wsgi:app
+
+Nothing else runs before the server: requirements are installed in the
+image and the test suite belongs to CI. When the database is already at
+the head revision and has its partitions, checking it costs two queries and
+the app is never built here; only pending work brings in the app and
+Flask-Migrate.
+"""
+import logging
+import os
+import sys
+import time
+
+from alembic.runtime.migration import MigrationContext
+from alembic.script import ScriptDirectory
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+
+from config import ProductionConfig, basedir
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = os.path.join(basedir, 'migrations')
+DATABASE_TIMEOUT = float(os.environ.get('BOOT_DATABASE_TIMEOUT', 60))
+
+
+def wait_for_database(engine, timeout=DATABASE_TIMEOUT):
+    """Return a connection to ``engine``, retrying until ``timeout`` seconds."""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return engine.connect()
+        except OperationalError:
+            if time.monotonic() > deadline:
+                raise
+            logger.info('Waiting for the database to start')
+            time.sleep(1)
+
+
+def pending_migrations(connection):
+    """True when the database is not at the head revision of ``migrations/``."""
+    heads = set(ScriptDirectory(MIGRATIONS_DIR).get_heads())
+    return set(MigrationContext.configure(connection).get_current_heads()) != heads
+
+
+def partitions_missing(connection):
+    """True when a partition of the next ``PARTITION_MONTHS_AHEAD`` months is missing."""
+    from api.partitions import missing_partitions
+
+    return bool(missing_partitions(ProductionConfig.PARTITION_MONTHS_AHEAD, connection=connection))
+
+
+def prepare(pending):
+    """Apply the migrations if ``pending``, then create the missing partitions."""
+    from flask_migrate import Migrate, upgrade as migrate_upgrade
+
+    from api.app import create_app
+    from api.partitions import create_partitions
+    from config import db
+
+    app = create_app(production_conf=True)
+    Migrate(app, db, directory=MIGRATIONS_DIR)
+    with app.app_context():
+        if pending:
+            logger.info('Applying pending migrations')
+            migrate_upgrade()
+        created = create_partitions(app.config['PARTITION_MONTHS_AHEAD'])
+        if created:
+            logger.info('Partitions %s created', ', '.join(created))
+
+
+def main(argv):
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    engine = create_engine(ProductionConfig.SQLALCHEMY_DATABASE_URI)
+    with wait_for_database(engine) as connection:
+        pending = pending_migrations(connection)
+        missing = pending or partitions_missing(connection)
+    engine.dispose()
+
+    if missing:
+        prepare(pending)
+    else:
+        logger.info('Database schema and partitions up to date')
+
+    if argv:
+        os.execvp(argv[0], argv)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,117 @@
+from flask import current_app
+from sqlalchemy import delete, literal_column, tuple_
+from sqlalchemy.dialects.postgresql import insert
+
+from api.utils import chunked
+from config import db
+
+ON_CONFLICT_ACTIONS = ('skip', 'update')
+
+
+def read_batch(data, key):
+    """Return the ``(rows, on_conflict)`` of a batch create request body.
+
+    Raises ValueError on an invalid body and OverflowError when the batch has
+    more than ``BULK_MAX_ITEMS`` rows.
+    """
+    rows = data.get(key) if isinstance(data, dict) else None
+    if not isinstance(rows, list):
+        raise ValueError(f'Body must have a list of {key}')
+
+    max_items = current_app.config['BULK_MAX_ITEMS']
+    if len(rows) > max_items:
+        raise OverflowError(f'At most {max_items} {key} per request')
+
+    on_conflict = data.get('on_conflict', 'skip')
+    if on_conflict not in ON_CONFLICT_ACTIONS:
+        raise ValueError(f"on_conflict must be one of {', '.join(ON_CONFLICT_ACTIONS)}")
+
+    return rows, on_conflict
+
+
+def read_ids(data, key='ids'):
+    """Return the list of ids of a bulk delete request body.
+
+    Raises ValueError on an invalid body and OverflowError when there are
+    more than ``BULK_MAX_ITEMS`` ids.
+    """
+    ids = data.get(key) if isinstance(data, dict) else None
+    if not isinstance(ids, list) or not all(isinstance(value, int) and not isinstance(value, bool) for value in ids):
+        raise ValueError(f'Body must have a list of integer {key}')
+
+    max_items = current_app.config['BULK_MAX_ITEMS']
+    if len(ids) > max_items:
+        raise OverflowError(f'At most {max_items} {key} per request')
+
+    return ids
+
+
+def validate_fields(model, row, fields):
+    """Return an error message if ``row`` lacks one of ``fields`` or a value
+    does not fit its string column, ``None`` otherwise."""
+    if not isinstance(row, dict):
+        return 'Invalid row'
+
+    for field in fields:
+        value = row.get(field)
+        if not isinstance(value, str) or not value:
+            return f'Invalid {field}'
+        column = model.__table__.c.get(field)
+        length = getattr(column.type, 'length', None) if column is not None else None
+        if length and len(value) > length:
+            return f'{field} longer than {length} characters'
+    return None
+
+
+def upsert_by_code(model, rows, on_conflict='skip'):
+    """Insert ``rows`` with ``INSERT ... ON CONFLICT (code) DO NOTHING/UPDATE``.
+
+    ``rows`` are dictionaries of column values. When a code is repeated in
+    the batch the last row wins. With ``on_conflict='update'`` existing rows
+    with other non-key values than the batch get them. Other existing rows
+    are left untouched and reported as skipped.
+    The caller owns the transaction.
+
+    Returns the ``(inserted, updated, skipped)`` lists of codes.
+    """
+    rows = list({row['code']: row for row in rows}.values())
+    inserted, updated = [], []
+
+    for chunk in chunked(rows, current_app.config['BULK_CHUNK_SIZE']):
+        statement = insert(model).values(chunk)
+        columns = [name for name in chunk[0] if name != 'code']
+        if on_conflict == 'update' and columns:
+            table = model.__table__
+            values = {name: statement.excluded[name] for name in columns}
+            changed = tuple_(*(table.c[name] for name in columns)).is_distinct_from(
+                tuple_(*(statement.excluded[name] for name in columns))
+            )
+            statement = statement.on_conflict_do_update(index_elements=['code'], set_=values, where=changed)
+        else:
+            statement = statement.on_conflict_do_nothing(index_elements=['code'])
+
+        # xmax is 0 for freshly inserted tuples and set for updated ones.
+        statement = statement.returning(model.code, literal_column('xmax = 0'))
+        for code, was_inserted in db.session.execute(statement):
+            (inserted if was_inserted else updated).append(code)
+
+    written = set(inserted) | set(updated)
+    skipped = [row['code'] for row in rows if row['code'] not in written]
+    return inserted, updated, skipped
+
+
+def delete_by_ids(model, ids):
+    """``DELETE`` the rows of ``model`` with ``ids``, ``BULK_CHUNK_SIZE`` ids
+    per statement.
+
+    Their children are deleted by the ``ON DELETE CASCADE`` foreign keys in
+    the same statement, without being loaded into the session. The caller
+    owns the transaction.
+
+    Returns the ``(id, code)`` pairs of the deleted rows.
+    """
+    deleted = []
+    for chunk in chunked(set(ids), current_app.config['BULK_CHUNK_SIZE']):
+        statement = delete(model).where(model.id.in_(chunk)).returning(model.id, model.code)
+        deleted.extend(db.session.execute(statement))
+    return deleted
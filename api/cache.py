@@ -0,0 +1,344 @@
+import abc
+import collections
+import json
+import logging
+import os
+import select
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+
+logger = logging.getLogger(__name__)
+
+MISSING = object()
+
+
+class CacheBackend(abc.ABC):
+    """Storage behind :class:`Cache`. Values are JSON compatible.
+
+    ``local`` backends are private to the process, which has to be told of
+    the writes of the others.
+    """
+
+    local = False
+
+    @abc.abstractmethod
+    def get(self, key):
+        """Return the value stored under ``key`` or ``MISSING``."""
+
+    @abc.abstractmethod
+    def set(self, key, value):
+        pass
+
+    @abc.abstractmethod
+    def delete(self, *keys):
+        pass
+
+    @abc.abstractmethod
+    def delete_prefix(self, prefix):
+        pass
+
+    @abc.abstractmethod
+    def clear(self):
+        pass
+
+    def __len__(self):
+        return 0
+
+
+class NullCache(CacheBackend):
+    """Backend that stores nothing, to switch caching off."""
+
+    def get(self, key):
+        return MISSING
+
+    def set(self, key, value):
+        pass
+
+    def delete(self, *keys):
+        pass
+
+    def delete_prefix(self, prefix):
+        pass
+
+    def clear(self):
+        pass
+
+
+class LRUCache(CacheBackend):
+    """Thread safe in-process LRU cache whose entries expire after ``ttl`` seconds.
+
+    Every worker process has its own copy, which :class:`Cache` keeps up to
+    date with the writes of the others through an :class:`InvalidationListener`.
+    """
+
+    local = True
+
+    def __init__(self, maxsize=10000, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return MISSING
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return MISSING
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def delete_prefix(self, prefix):
+        with self._lock:
+            for key in [key for key in self._data if key.startswith(prefix)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class RedisCache(CacheBackend):
+    """Backend shared by every worker, stored in Redis.
+
+    Needs the optional ``redis`` package.
+    """
+
+    def __init__(self, url, ttl=60, prefix='vessels:'):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError('CACHE_BACKEND=redis needs the redis package installed')
+
+        self.ttl = ttl
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        value = self._client.get(self.prefix + key)
+        return MISSING if value is None else json.loads(value)
+
+    def set(self, key, value):
+        self._client.set(self.prefix + key, json.dumps(value), ex=self.ttl)
+
+    def delete(self, *keys):
+        if keys:
+            self._client.delete(*(self.prefix + key for key in keys))
+
+    def delete_prefix(self, prefix):
+        for key in self._client.scan_iter(match=self.prefix + prefix + '*'):
+            self._client.delete(key)
+
+    def clear(self):
+        for key in self._client.scan_iter(match=self.prefix + '*'):
+            self._client.delete(key)
+
+
+class InvalidationListener(object):
+    """Thread of a process calling ``on_notify(payload)`` for every PostgreSQL
+    notification sent on ``channel``.
+
+    It listens on a connection of its own, opened by ``connect``. Whatever
+    was sent while that connection was down is lost, so ``on_connect()`` is
+    called each time it is opened, before any notification.
+    """
+
+    def __init__(self, connect, channel, on_notify, on_connect, timeout=1):
+        self.connect = connect
+        self.channel = channel
+        self.on_notify = on_notify
+        self.on_connect = on_connect
+        self.timeout = timeout
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def start(self):
+        """Start the thread, again in a process forked since."""
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name=f'{self.channel}-listener', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join()
+
+    def _listen(self):
+        connection = self.connect()
+        try:
+            connection.autocommit = True
+            with connection.cursor() as cursor:
+                cursor.execute(f'LISTEN {self.channel}')
+            self.on_connect()
+            while not self._stopped.is_set():
+                if select.select([connection], [], [], self.timeout)[0]:
+                    connection.poll()
+                    while connection.notifies:
+                        self.on_notify(connection.notifies.pop(0).payload)
+        finally:
+            connection.close()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                self._listen()
+            except Exception:
+                logger.warning('Listening on %s failed', self.channel, exc_info=True)
+                self._stopped.wait(self.timeout)
+
+
+class Cache(object):
+    """Read-through cache bound to the application, like ``db``.
+
+    The backend is chosen by ``CACHE_BACKEND`` (``memory``, ``redis`` or
+    ``none``). Keys are ``<namespace>:<id>`` and entries are dropped a whole
+    namespace at a time by :meth:`invalidate`, by the process that wrote and,
+    for backends local to each process, by the listener of every other one
+    (see :meth:`listen`). A load that started before an invalidation of its
+    namespace is returned but not stored, as it may have read the old row.
+
+    Entries may also be stored with a version, and an entry stored under
+    another version than the one asked for is a miss. Hits and misses are
+    counted per application.
+    """
+
+    def init_app(self, app):
+        backend = app.config.get('CACHE_BACKEND', 'memory')
+        ttl = app.config.get('CACHE_TTL', 60)
+
+        if backend == 'memory':
+            storage = LRUCache(maxsize=app.config.get('CACHE_MAXSIZE', 10000), ttl=ttl)
+        elif backend == 'redis':
+            storage = RedisCache(app.config['CACHE_REDIS_URL'], ttl=ttl)
+        elif backend == 'none':
+            storage = NullCache()
+        else:
+            raise ValueError(f'Unknown CACHE_BACKEND {backend}')
+
+        app.extensions['cache'] = {
+            'backend': storage,
+            'hits': 0,
+            'misses': 0,
+            'lock': threading.Lock(),
+            'generations': collections.Counter(),
+            'generations_lock': threading.Lock(),
+            'listener': None
+        }
+
+    @property
+    def _state(self):
+        return current_app.extensions['cache']
+
+    @property
+    def backend(self):
+        return self._state['backend']
+
+    def _count(self, counter):
+        state = self._state
+        with state['lock']:
+            state[counter] += 1
+
+    def get_or_load(self, key, loader, version=None, store=True):
+        """Return the value of ``key`` cached at ``version``, calling ``loader``
+        on a miss.
+
+        ``None`` results are not cached, nor anything when ``store`` is off.
+        """
+        state = self._state
+        entry = state['backend'].get(key)
+        if entry is not MISSING and entry[0] == version:
+            self._count('hits')
+            return entry[1]
+
+        self._count('misses')
+        namespace = key.partition(':')[0]
+        generation = state['generations'].setdefault(namespace, 0)
+        value = loader()
+        if value is not None and store:
+            with state['generations_lock']:
+                if state['generations'][namespace] == generation:
+                    state['backend'].set(key, [version, value])
+        return value
+
+    @staticmethod
+    def _invalidate(state, namespaces=None):
+        with state['generations_lock']:
+            if namespaces is None:
+                for namespace in state['generations']:
+                    state['generations'][namespace] += 1
+                state['backend'].clear()
+                return
+            for namespace in namespaces:
+                state['generations'][namespace] += 1
+                state['backend'].delete_prefix(f'{namespace}:')
+
+    def invalidate(self, *namespaces):
+        """Drop every entry of ``namespaces``."""
+        self._invalidate(self._state, namespaces)
+
+    def listen(self, channel, connect, namespaces):
+        """Drop the entries of the namespace named by each notification sent
+        on ``channel``, among ``namespaces``, when the backend is local to
+        the process.
+
+        The listener of the process is started on first call, with a
+        connection opened by ``connect``.
+        """
+        state = self._state
+        if not state['backend'].local:
+            return
+        with state['lock']:
+            listener = state['listener']
+            if listener is None:
+                def on_notify(namespace):
+                    if namespace in namespaces:
+                        self._invalidate(state, [namespace])
+
+                listener = state['listener'] = InvalidationListener(
+                    connect, channel, on_notify, lambda: self._invalidate(state)
+                )
+        listener.start()
+
+    def delete(self, *keys):
+        self.backend.delete(*keys)
+
+    def clear(self):
+        self._invalidate(self._state)
+
+    def stats(self):
+        state = self._state
+        return {
+            'backend': type(state['backend']).__name__,
+            'size': len(state['backend']),
+            'hits': state['hits'],
+            'misses': state['misses']
+        }
+
+
+cache = Cache()
@@ -0,0 +1,91 @@
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from api.export import FORMATS, export_operations, parse_columns, parse_format
+from api.filters import filter_criteria
+from api.idempotency import purge_expired
+from api.jobs import start_workers
+from api.models.equipment import Operation
+from api.partitions import create_partitions, detach_partitions, partitions
+from api.utils import parse_timestamp
+
+partitions_cli = AppGroup('partitions', help='Manage the monthly partitions of operations.')
+jobs_cli = AppGroup('jobs', help='Run the background jobs.')
+operations_cli = AppGroup('operations', help='Export the operations.')
+idempotency_cli = AppGroup('idempotency', help='Manage the stored Idempotency-Key responses.')
+
+
+@partitions_cli.command('list')
+def list_partitions():
+    """List the monthly partitions attached to operations."""
+    for month in partitions():
+        click.echo(f'{month:%Y-%m}')
+
+
+@partitions_cli.command('create')
+@click.option('--months-ahead', default=3, show_default=True, help='Months to create after the current one.')
+def create_partitions_command(months_ahead):
+    """Create the partitions of the current and next months."""
+    for name in create_partitions(months_ahead):
+        click.echo(f'created {name}')
+
+
+@partitions_cli.command('detach')
+@click.option('--before', required=True, help='Detach partitions entirely before this date (YYYY-MM-DD).')
+@click.option('--drop', is_flag=True, help='Drop the detached partitions instead of keeping them for archival.')
+def detach_partitions_command(before, drop):
+    """Retire the partitions older than --before, rebuilding the cost rollup."""
+    try:
+        before = parse_timestamp(before)
+    except ValueError:
+        raise click.BadParameter('must be an ISO 8601 date', param_hint='--before')
+    for name in detach_partitions(before, drop):
+        click.echo(f"{'dropped' if drop else 'detached'} {name}")
+
+
+@jobs_cli.command('worker')
+@click.option('--processes', type=int, help='Worker processes, JOB_WORKERS by default.')
+@click.option('--poll-interval', type=float, help='Seconds between polls of an empty queue, JOB_POLL_INTERVAL by default.')
+@click.option('--burst', is_flag=True, help='Exit once the queue is empty.')
+def worker_command(processes, poll_interval, burst):
+    """Run queued jobs in a pool of worker processes."""
+    config = current_app.config
+    start_workers(
+        current_app._get_current_object(),
+        processes or config['JOB_WORKERS'],
+        poll_interval or config['JOB_POLL_INTERVAL'],
+        burst
+    )
+
+
+@operations_cli.command('export')
+@click.option('--format', 'export_format', type=click.Choice(list(FORMATS)), default='csv', show_default=True)
+@click.option('--fields', help='Comma separated columns to export, all by default.')
+@click.option('--filter', 'filters', multiple=True, metavar='NAME=VALUE',
+              help='Filter of GET /equipment/operation, such as vessel_code=MV102 or since=2021-01-01. Repeatable.')
+@click.option('--output', type=click.File('wb'), default='-', help='File to write, the standard output by default.')
+def export_operations_command(export_format, fields, filters, output):
+    """Export operations with their equipment and vessel codes."""
+    try:
+        parse_format(export_format)
+    except LookupError as error:
+        raise click.UsageError(str(error))
+    try:
+        names = parse_columns(fields)
+    except ValueError as error:
+        raise click.BadParameter(str(error), param_hint='--fields')
+    args = dict(item.partition('=')[::2] for item in filters)
+    try:
+        criteria = filter_criteria(Operation, args)
+    except ValueError as error:
+        raise click.BadParameter(str(error), param_hint='--filter')
+
+    for chunk in export_operations(names, criteria, export_format):
+        output.write(chunk)
+
+
+@idempotency_cli.command('purge')
+def purge_command():
+    """Delete the Idempotency-Key responses past IDEMPOTENCY_TTL."""
+    click.echo(f'purged {purge_expired()} keys')
@@ -0,0 +1,328 @@
+from sqlalchemy import Float, and_, cast, tuple_
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.sql import func
+
+from api.models.equipment import Equipment, Operation, OperationCost
+from api.models.vessel import Vessel
+from api.utils import parse_timestamp
+from config import db
+
+
+def parse_period(args):
+    """Parse the ``since`` and ``until`` ISO 8601 entries of the query ``args``.
+
+    Raises ValueError with a client facing message on invalid values.
+    """
+    try:
+        since, until = (parse_timestamp(args[key]) if args.get(key) else None for key in ('since', 'until'))
+    except ValueError:
+        raise ValueError('since and until must be ISO 8601 dates or datetimes')
+    if since is not None and until is not None and since >= until:
+        raise ValueError('since must be before until')
+    return since, until
+
+
+def period(since=None, until=None):
+    """Criteria keeping the operations performed in ``[since, until)``.
+
+    Comparing ``performed_at`` with constants lets PostgreSQL prune the
+    monthly partitions outside of the period.
+    """
+    criteria = []
+    if since is not None:
+        criteria.append(Operation.performed_at >= since)
+    if until is not None:
+        criteria.append(Operation.performed_at < until)
+    return criteria
+
+
+def total_cost(column, value, fresh=False, since=None, until=None):
+    """Sum the cost of the operations of the equipments where ``column == value``.
+
+    Reads the ``operation_costs`` rollup unless ``fresh`` asks for a live
+    aggregate over the operations, as a ``since``/``until`` period does.
+    Without operations the total is the integer 0, like ``sum([])``.
+    """
+    criteria = period(since, until)
+    if fresh or criteria:
+        query = (
+            db.session.query(func.sum(Operation.cost))
+            .join(Equipment, Operation.equipment_id == Equipment.id)
+            .filter(*criteria)
+        )
+    else:
+        query = (
+            db.session.query(func.sum(OperationCost.total))
+            .join(Equipment, OperationCost.equipment_id == Equipment.id)
+        )
+    total = query.filter(column == value).scalar()
+    return 0 if total is None else total
+
+
+def summarize(count, total, minimum, maximum):
+    return {
+        'count': count,
+        'total': total,
+        'average': total / count if count else None,
+        'min': minimum,
+        'max': maximum
+    }
+
+
+def cost_groups(column, values, fresh=False, since=None, until=None):
+    """Query ``(code, name, type, count, total, min, max)`` rows for every
+    equipment where ``column`` is in ``values``, one per operation type.
+
+    Both paths group operations without a type under ``''`` and only count
+    the operations with a cost, as the rollup does. Equipments without
+    operations (in the ``since``/``until`` period, which implies ``fresh``)
+    come back once with no count.
+    """
+    criteria = period(since, until)
+    if fresh or criteria:
+        type_ = func.coalesce(Operation.type, '')
+        query = (
+            db.session.query(
+                Equipment.code,
+                Equipment.name,
+                type_,
+                func.count(Operation.cost),
+                func.coalesce(func.sum(Operation.cost), 0.0),
+                func.min(Operation.cost),
+                func.max(Operation.cost)
+            )
+            .outerjoin(Operation, and_(Operation.equipment_id == Equipment.id, *criteria))
+            .group_by(Equipment.code, Equipment.name, type_)
+            .order_by(Equipment.code, type_)
+        )
+    else:
+        query = (
+            db.session.query(
+                Equipment.code,
+                Equipment.name,
+                OperationCost.type,
+                OperationCost.count,
+                OperationCost.total,
+                OperationCost.min_cost,
+                OperationCost.max_cost
+            )
+            .outerjoin(OperationCost, OperationCost.equipment_id == Equipment.id)
+            .order_by(Equipment.code, OperationCost.type)
+        )
+    return query.filter(column.in_(values))
+
+
+def cost_breakdown(column, values, fresh=False, since=None, until=None):
+    """Cost statistics of every equipment where ``column`` is in ``values``.
+
+    Count, sum, min and max come per equipment and operation type from the
+    rollup (or one grouped query when ``fresh``); the per-equipment totals
+    are folded from those groups. Equipments without operations with a cost
+    are listed with a zero count.
+    """
+    groups = {}
+    for code, name, type_, count, total, minimum, maximum in cost_groups(column, values, fresh, since, until):
+        equipment = groups.setdefault(code, {'code': code, 'name': name, 'groups': []})
+        if count:
+            equipment['groups'].append((type_, count, total, minimum, maximum))
+
+    breakdown = []
+    for equipment in groups.values():
+        types = equipment.pop('groups')
+        count = sum(group[1] for group in types)
+        equipment.update(summarize(
+            count,
+            sum(group[2] for group in types),
+            min((group[3] for group in types), default=None),
+            max((group[4] for group in types), default=None)
+        ))
+        equipment['types'] = {group[0]: summarize(*group[1:]) for group in types}
+        breakdown.append(equipment)
+
+    return breakdown
+
+
+def vessel_average_costs(fresh=False, since=None, until=None):
+    """Query ``(vessel code, average operation cost)`` for every vessel with
+    operations, in the ``since``/``until`` period when one is given.
+
+    Operations without a cost are left out of the average, which is NULL
+    when none has one.
+    """
+    criteria = period(since, until)
+    if fresh or criteria:
+        return (
+            Operation.query.join(Equipment).join(Vessel)
+            .with_entities(Vessel.code, func.avg(Operation.cost))
+            .filter(*criteria)
+            .group_by(Vessel.code)
+        )
+    return (
+        db.session.query(Vessel.code, func.sum(OperationCost.total) / cast(func.nullif(func.sum(OperationCost.count), 0), Float))
+        .join(Equipment, Equipment.vessel_id == Vessel.id)
+        .join(OperationCost, OperationCost.equipment_id == Equipment.id)
+        .group_by(Vessel.code)
+    )
+
+
+STATS_DIMENSIONS = {
+    'vessel_code': Vessel.code,
+    'equipment_code': Equipment.code,
+    'name': Equipment.name,
+    'location': Equipment.location,
+    'type': Operation.type,
+}
+
+DEFAULT_PERCENTILES = (0.5, 0.9, 0.99)
+MAX_PERCENTILES = 10
+DEFAULT_TOP = 3
+MAX_TOP = 100
+
+
+def parse_group_by(values):
+    """Grouping sets named by ``group_by`` parameters, each a comma separated
+    list of dimensions: ``['vessel_code,type', 'location']`` asks for costs
+    per vessel and type and, in the same query, per location.
+
+    A set repeated in another order, such as ``location,type`` after
+    ``type,location``, is the same grouping set and is only kept as first
+    spelled.
+
+    Raises ValueError with a client facing message on invalid values.
+    """
+    group_sets = []
+    for value in values or ['vessel_code']:
+        names = tuple(dict.fromkeys(value.split(',')))
+        unknown = set(names) - set(STATS_DIMENSIONS)
+        if unknown:
+            raise ValueError(f'group_by must be made of: {", ".join(STATS_DIMENSIONS)}')
+        group_sets.append(names)
+    return unique_sets(group_sets)
+
+
+def unique_sets(group_sets):
+    """``group_sets`` without the ones naming the dimensions of an earlier set."""
+    unique = {}
+    for group_set in group_sets:
+        unique.setdefault(frozenset(group_set), group_set)
+    return list(unique.values())
+
+
+def parse_percentiles(value):
+    """Fractions named by a comma separated ``percentiles`` value such as
+    ``0.5,0.9,0.99``, those by default.
+
+    Raises ValueError with a client facing message on invalid values.
+    """
+    if not value:
+        return DEFAULT_PERCENTILES
+    try:
+        fractions = tuple(sorted({float(fraction) for fraction in value.split(',')}))
+    except ValueError:
+        raise ValueError('percentiles must be numbers between 0 and 1')
+    if not all(0 <= fraction <= 1 for fraction in fractions):
+        raise ValueError('percentiles must be numbers between 0 and 1')
+    if len(fractions) > MAX_PERCENTILES:
+        raise ValueError(f'at most {MAX_PERCENTILES} percentiles')
+    return fractions
+
+
+def parse_top(value):
+    """Number of equipments asked for by a ``top`` value, 3 by default."""
+    if value is None:
+        return DEFAULT_TOP
+    try:
+        top = int(value)
+    except ValueError:
+        top = -1
+    if not 0 <= top <= MAX_TOP:
+        raise ValueError(f'top must be an integer between 0 and {MAX_TOP}')
+    return top
+
+
+def percentile_name(fraction):
+    return f'p{fraction * 100:g}'
+
+
+def cost_stats(group_sets, fractions=DEFAULT_PERCENTILES, criteria=()):
+    """Cost statistics of the operations matching ``criteria`` for every
+    group of every grouping set, keyed by the comma separated set.
+
+    A single ``GROUP BY GROUPING SETS`` query computes count, total, average,
+    min, max and the ``fractions`` percentiles (``percentile_cont``) of all
+    the sets; ``grouping()`` tells which set each row belongs to, so sets of
+    the same dimensions are only grouped once.
+    """
+    group_sets = unique_sets(group_sets)
+    names = list(dict.fromkeys(name for group_set in group_sets for name in group_set))
+    columns = [STATS_DIMENSIONS[name] for name in names]
+    masks = {
+        sum(1 << (len(names) - 1 - index) for index, name in enumerate(names) if name not in group_set): group_set
+        for group_set in group_sets
+    }
+
+    query = (
+        db.session.query(
+            func.grouping(*columns),
+            *columns,
+            func.count(Operation.cost),
+            func.sum(Operation.cost),
+            func.min(Operation.cost),
+            func.max(Operation.cost),
+            func.percentile_cont(cast(postgresql.array(fractions), postgresql.ARRAY(Float)))
+            .within_group(Operation.cost)
+        )
+        .join(Equipment, Operation.equipment_id == Equipment.id)
+        .join(Vessel, Equipment.vessel_id == Vessel.id)
+        .filter(*criteria)
+        .group_by(func.grouping_sets(*(tuple_(*(STATS_DIMENSIONS[name] for name in group_set)) for group_set in group_sets)))
+        .order_by(func.grouping(*columns), *columns)
+    )
+
+    stats = {','.join(group_set): [] for group_set in group_sets}
+    for mask, *row in query:
+        group_set = masks[mask]
+        values = dict(zip(names, row[:len(names)]))
+        count, total, minimum, maximum, percentiles = row[len(names):]
+        group = {name: values[name] for name in group_set}
+        group.update(summarize(count, total, minimum, maximum))
+        # percentile_cont() is NULL for a group without any cost.
+        if percentiles is None:
+            percentiles = [None] * len(fractions)
+        group.update((percentile_name(fraction), value) for fraction, value in zip(fractions, percentiles))
+        stats[','.join(group_set)].append(group)
+    return stats
+
+
+def top_equipments(limit, criteria=()):
+    """The ``limit`` equipments with the highest operation costs of every
+    vessel, ranked with a ``row_number()`` window over the per-equipment
+    totals of the operations matching ``criteria``. Equipments whose
+    operations have no cost are left out."""
+    total = func.sum(Operation.cost)
+    ranked = (
+        db.session.query(
+            Vessel.code.label('vessel_code'),
+            Equipment.code.label('code'),
+            Equipment.name.label('name'),
+            func.count(Operation.id).label('count'),
+            total.label('total'),
+            func.row_number().over(partition_by=Vessel.code, order_by=(total.desc(), Equipment.code)).label('rank')
+        )
+        .join(Equipment, Operation.equipment_id == Equipment.id)
+        .join(Vessel, Equipment.vessel_id == Vessel.id)
+        .filter(*criteria)
+        .group_by(Vessel.code, Equipment.code, Equipment.name)
+        .having(total.isnot(None))
+        .subquery()
+    )
+    query = (
+        db.session.query(ranked.c.vessel_code, ranked.c.code, ranked.c.name, ranked.c.count, ranked.c.total)
+        .filter(ranked.c.rank <= limit)
+        .order_by(ranked.c.vessel_code, ranked.c.rank)
+    )
+
+    top = {}
+    for vessel_code, code, name, count, total_cost in query:
+        top.setdefault(vessel_code, []).append({'code': code, 'name': name, 'count': count, 'total': total_cost})
+    return top
@@ -0,0 +1,64 @@
+"""Swagger UI and spec, loaded on the first request to them.
+
+The blueprint serves the URLs ``Swagger(app)`` would (``/apidocs/``,
+``/apispec_1.json`` and ``/flasgger_static/``), but flasgger and the
+libraries it pulls in are only imported, and the spec only built from the
+view docstrings, when the docs are first requested. Workers that never
+serve them skip that cost at boot.
+"""
+import importlib.util
+import os
+import threading
+
+from flask import Blueprint, current_app, jsonify, redirect, url_for
+
+FLASGGER_DIR = importlib.util.find_spec('flasgger').submodule_search_locations[0]
+SPEC_ENDPOINT = 'apispec_1'
+
+# Named like the blueprint of flasgger, whose templates link to
+# ``flasgger.static`` and ``flasgger.apispec_1``.
+docs_blueprint = Blueprint(
+    'flasgger',
+    __name__,
+    template_folder=os.path.join(FLASGGER_DIR, 'ui3', 'templates'),
+    static_folder=os.path.join(FLASGGER_DIR, 'ui3', 'static'),
+    static_url_path='/flasgger_static'
+)
+
+_lock = threading.Lock()
+
+
+def swagger():
+    """The flasgger ``Swagger`` of the current app, created on first use.
+
+    It is configured without being registered on the app: the routes are
+    those of this blueprint, declared at boot.
+    """
+    app = current_app._get_current_object()
+    with _lock:
+        instance = app.extensions.get('swagger')
+        if instance is None:
+            from flasgger import Swagger
+
+            instance = Swagger()
+            instance.app = app
+            instance.load_config(app)
+            app.extensions['swagger'] = instance
+    return instance
+
+
+@docs_blueprint.route('/apidocs/')
+def apidocs():
+    from flasgger.base import APIDocsView
+
+    return APIDocsView(view_args={'config': swagger().config}).get()
+
+
+@docs_blueprint.route('/apidocs/index.html')
+def apidocs_index():
+    return redirect(url_for('flasgger.apidocs'))
+
+
+@docs_blueprint.route('/apispec_1.json')
+def apispec_1():
+    return jsonify(swagger().get_apispecs(SPEC_ENDPOINT))
@@ -0,0 +1,187 @@
+"""Columnar export of the operations for analytics.
+
+Operations are read with the codes of their equipment and vessel from a
+server-side cursor, ``EXPORT_CHUNK_SIZE`` rows at a time, and each chunk is
+encoded as it arrives: CSV rows, an Arrow IPC record batch or a Parquet row
+group. Memory use does not depend on the size of the export.
+
+Arrow and Parquet need pyarrow, which is optional and only imported by the
+first export in those formats, keeping it out of the boot of the workers.
+"""
+import csv
+import importlib.util
+import io
+
+from flask import current_app
+from sqlalchemy import select
+
+from api.models.equipment import Equipment, Operation
+from api.models.vessel import Vessel
+from config import db
+
+COLUMNS = {
+    'id': Operation.id,
+    'equipment_id': Operation.equipment_id,
+    'equipment_code': Equipment.code,
+    'vessel_code': Vessel.code,
+    'type': Operation.type,
+    'cost': Operation.cost,
+    'performed_at': Operation.performed_at,
+}
+
+FORMATS = {
+    'csv': 'text/csv',
+    'arrow': 'application/vnd.apache.arrow.stream',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+EXTENSIONS = {'csv': 'csv', 'arrow': 'arrows', 'parquet': 'parquet'}
+
+HAS_PYARROW = importlib.util.find_spec('pyarrow') is not None
+
+
+def parse_columns(value):
+    """Column names asked for by a comma separated ``fields`` value, in the
+    order given, or all of them."""
+    if not value:
+        return list(COLUMNS)
+
+    names = list(dict.fromkeys(value.split(',')))
+    unknown = set(names) - set(COLUMNS)
+    if unknown:
+        raise ValueError(f'unknown fields: {", ".join(sorted(unknown))}')
+    return names
+
+
+def parse_format(value):
+    """Export format named by ``value``, CSV by default.
+
+    Raises ValueError for unknown formats and LookupError for the ones that
+    need pyarrow when it is not installed.
+    """
+    value = value or 'csv'
+    if value not in FORMATS:
+        raise ValueError(f'format must be one of: {", ".join(FORMATS)}')
+    if value != 'csv' and not HAS_PYARROW:
+        raise LookupError(f'{value} export needs pyarrow installed on the server')
+    return value
+
+
+def export_statement(names, criteria=()):
+    return (
+        select(*(COLUMNS[name].label(name) for name in names))
+        .select_from(Operation)
+        .outerjoin(Equipment, Operation.equipment_id == Equipment.id)
+        .outerjoin(Vessel, Equipment.vessel_id == Vessel.id)
+        .where(*criteria)
+        .order_by(Operation.id)
+    )
+
+
+def arrow_schema(names):
+    import pyarrow
+
+    types = {
+        'id': pyarrow.int64(),
+        'equipment_id': pyarrow.int64(),
+        'equipment_code': pyarrow.string(),
+        'vessel_code': pyarrow.string(),
+        'type': pyarrow.string(),
+        'cost': pyarrow.float64(),
+        'performed_at': pyarrow.timestamp('us', tz='UTC'),
+    }
+    return pyarrow.schema([(name, types[name]) for name in names])
+
+
+def record_batch(schema, rows):
+    import pyarrow
+
+    columns = list(zip(*rows)) if rows else [()] * len(schema)
+    arrays = [pyarrow.array(values, type=field.type) for values, field in zip(columns, schema)]
+    return pyarrow.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+class ChunkSink(io.RawIOBase):
+    """Write-only file handing out what was written since the last
+    :meth:`take`. ``tell`` keeps counting from the start of the stream, as
+    the Parquet footer records absolute offsets."""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def take(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def encode_csv(names, batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(names)
+    for rows in batches:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue().encode()
+
+
+def encode_arrow(names, batches):
+    import pyarrow.ipc
+
+    schema = arrow_schema(names)
+    sink = ChunkSink()
+    with pyarrow.ipc.new_stream(sink, schema) as writer:
+        for rows in batches:
+            writer.write_batch(record_batch(schema, rows))
+            yield sink.take()
+    yield sink.take()
+
+
+def encode_parquet(names, batches):
+    import pyarrow.parquet
+
+    schema = arrow_schema(names)
+    sink = ChunkSink()
+    with pyarrow.parquet.ParquetWriter(sink, schema) as writer:
+        for rows in batches:
+            writer.write_batch(record_batch(schema, rows))
+            yield sink.take()
+    yield sink.take()
+
+
+ENCODERS = {'csv': encode_csv, 'arrow': encode_arrow, 'parquet': encode_parquet}
+
+
+def export_operations(names, criteria=(), export_format='csv', on_rows=None):
+    """Yield the operations matching ``criteria`` encoded in ``export_format``,
+    one chunk of bytes per ``EXPORT_CHUNK_SIZE`` rows.
+
+    ``on_rows(count)`` is called for every chunk of rows read.
+    """
+    chunk_size = current_app.config['EXPORT_CHUNK_SIZE']
+
+    def batches():
+        result = db.session.execute(export_statement(names, criteria), execution_options={'stream_results': True})
+        for rows in result.partitions(chunk_size):
+            if on_rows is not None:
+                on_rows(len(rows))
+            yield rows
+
+    for chunk in ENCODERS[export_format](names, batches()):
+        if chunk:
+            yield chunk
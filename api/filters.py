@@ -0,0 +1,103 @@
+"""Query parameters accepted by the list endpoints.
+
+Each model declares the filters it can be narrowed with and the columns it
+can be sorted by. Every filter and sort key is backed by an index, or by the
+monthly partitions for the operations period, so no combination of
+parameters makes a list request scan a whole table.
+"""
+from sqlalchemy import select
+
+from api.models.equipment import Equipment, Operation
+from api.models.vessel import Vessel
+from api.serialization import serialized_columns
+from api.utils import parse_timestamp
+
+
+def parse_bool(name, value):
+    if value not in ('true', 'false'):
+        raise ValueError(f'{name} must be true or false')
+    return value == 'true'
+
+
+def parse_float(name, value):
+    try:
+        return float(value)
+    except ValueError:
+        raise ValueError(f'{name} must be a number')
+
+
+def parse_datetime(name, value):
+    try:
+        return parse_timestamp(value)
+    except ValueError:
+        raise ValueError(f'{name} must be an ISO 8601 date or datetime')
+
+
+def vessel_ids(code):
+    return select(Vessel.id).where(Vessel.code == code)
+
+
+def equipment_ids(*criteria):
+    return select(Equipment.id).where(*criteria)
+
+
+FILTERS = {
+    Equipment: {
+        'vessel_code': lambda value: Equipment.vessel_id.in_(vessel_ids(value)),
+        'location': lambda value: Equipment.location == value,
+        'name': lambda value: Equipment.name == value,
+        'active': lambda value: Equipment.active.is_(parse_bool('active', value)),
+    },
+    Operation: {
+        'vessel_code': lambda value: Operation.equipment_id.in_(equipment_ids(Equipment.vessel_id.in_(vessel_ids(value)))),
+        'code': lambda value: Operation.equipment_id.in_(equipment_ids(Equipment.code == value)),
+        'type': lambda value: Operation.type == value,
+        'min_cost': lambda value: Operation.cost >= parse_float('min_cost', value),
+        'max_cost': lambda value: Operation.cost <= parse_float('max_cost', value),
+        'since': lambda value: Operation.performed_at >= parse_datetime('since', value),
+        'until': lambda value: Operation.performed_at < parse_datetime('until', value),
+    },
+}
+
+SORTS = {
+    Equipment: ('id', 'code', 'name', 'location'),
+    Operation: ('id', 'cost'),
+}
+
+
+def filter_criteria(model, args):
+    """SQL criteria for the filters of ``model`` present in the query ``args``.
+
+    Raises ValueError with a client facing message on invalid values.
+    """
+    return [build(args[name]) for name, build in FILTERS.get(model, {}).items() if name in args]
+
+
+def parse_sort(model, value):
+    """Return the ``(column, descending)`` named by a ``sort`` parameter
+    such as ``name`` or ``-cost``, defaulting to ascending ids.
+    """
+    if not value:
+        return model.id, False
+
+    sorts = SORTS.get(model, ('id',))
+    descending = value.startswith('-')
+    name = value[1:] if descending else value
+    if name not in sorts:
+        raise ValueError(f'sort must be one of: {", ".join(sorts)}')
+    return getattr(model, name), descending
+
+
+def parse_fields(model, value, required=()):
+    """Set of column names asked for by a ``fields`` parameter, ``None``
+    when all of them are. The ``required`` names are always included.
+    """
+    if not value:
+        return None
+
+    names = {column.name for column in serialized_columns(model)}
+    fields = set(value.split(','))
+    unknown = fields - names
+    if unknown:
+        raise ValueError(f'unknown fields: {", ".join(sorted(unknown))}')
+    return frozenset(fields.union(required))
@@ -0,0 +1,121 @@
+"""Conditional request support.
+
+Representations are versioned by the ``table_versions`` rows of the tables
+they are built from (see api.models.table_version), so a client or reverse
+proxy revalidating a response costs one primary key lookup and a 304.
+Versions are bumped right after the writes commit, so a validator can only
+lag behind its body, never be ahead of it. The
+lookup cache reuses those versions (see api.lookups), so a body served from
+it is never older than its validator.
+
+Rows with a ``version`` column are served with it as their ETag (see
+:func:`row_response`), the value writes to them take in ``If-Match``.
+"""
+import functools
+import hashlib
+from datetime import datetime, timezone
+
+from flask import current_app, g, jsonify, make_response, request
+
+from api.models.table_version import TableVersion
+from config import db
+
+
+def table_versions(tables):
+    """Return the ``(versions, last_modified)`` of ``tables``.
+
+    Tables never written to have version 0 and no modification time.
+    """
+    query = db.session.query(TableVersion.name, TableVersion.version, TableVersion.updated_at)
+    rows = {name: (version, updated_at) for name, version, updated_at in query.filter(TableVersion.name.in_(tables))}
+    versions = tuple(rows.get(table, (0, None))[0] for table in tables)
+    modified = [updated_at for _, updated_at in rows.values()]
+    return versions, max(modified) if modified else None
+
+
+def representation_etag(versions):
+    """Weak ETag of the current request URL and negotiated type at ``versions``."""
+    key = f'{request.full_path}|{request.headers.get("Accept", "")}|{versions}'
+    return hashlib.blake2b(key.encode(), digest_size=12).hexdigest()
+
+
+def not_modified(etag, last_modified):
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if last_modified is not None and request.if_modified_since is not None:
+        # HTTP dates drop the fraction of a second, so the Last-Modified a
+        # client sends back is compared at that precision. A date still to
+        # come is invalid. ETags have no such granularity and win when both
+        # are sent.
+        return last_modified.replace(microsecond=0) <= request.if_modified_since <= datetime.now(timezone.utc)
+    return False
+
+
+def conditional(*tables):
+    """Answer ``If-None-Match``/``If-Modified-Since`` requests of a GET view
+    built from ``tables`` with a 304, before the view runs.
+
+    Successful responses get an ETag, Last-Modified and a Cache-Control header
+    letting shared caches reuse them for ``HTTP_CACHE_MAX_AGE`` seconds while
+    clients revalidate on every request. The versions are kept in
+    ``g.table_versions`` for the view to read its data at them.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            versions, last_modified = table_versions(tables)
+            etag = representation_etag(versions)
+            g.table_versions = dict(zip(tables, versions))
+
+            if not_modified(etag, last_modified):
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag, weak=True)
+            if last_modified is not None:
+                response.last_modified = last_modified
+            return shared_cacheable(response)
+        return wrapper
+    return decorator
+
+
+def shared_cacheable(response):
+    """Let shared caches reuse ``response`` for ``HTTP_CACHE_MAX_AGE`` seconds
+    while clients revalidate it on every request."""
+    response.cache_control.public = True
+    response.cache_control.max_age = 0
+    response.cache_control.s_maxage = current_app.config['HTTP_CACHE_MAX_AGE']
+    response.vary.add('Accept')
+    return response
+
+
+def row_response(row):
+    """Response of the serialized ``row`` with its ``version`` column as a
+    strong ETag, a 304 when ``If-None-Match`` lists it.
+
+    The ETag is the entity tag ``If-Match`` takes on writes to the row.
+    """
+    etag = str(row['version'])
+    if request.if_none_match.contains_weak(etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = jsonify(row)
+    response.set_etag(etag)
+    return shared_cacheable(response)
+
+
+def if_match_versions():
+    """Row versions listed by the ``If-Match`` header, ``None`` when it is
+    absent or ``*``.
+
+    Raises ValueError when a listed entity tag is not a version number.
+    """
+    if not request.if_match or request.if_match.star_tag:
+        return None
+    try:
+        return {int(tag) for tag in request.if_match.as_set()}
+    except ValueError:
+        raise ValueError('If-Match must list row versions, such as "3"')
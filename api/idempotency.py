@@ -0,0 +1,165 @@
+"""``Idempotency-Key`` support for the create endpoints.
+
+A client retrying a POST sends the key of the first attempt. The first
+request reserves the key in ``idempotency_keys``, then runs the view in a
+SAVEPOINT the commit of the view only releases. The response is stored and
+committed in the same transaction as the write, so a key is never left
+without its response. A retry gets that response back, marked
+``Idempotent-Replayed: true``, without running the view. A retry arriving
+while the first request is still writing waits on the row lock of the key.
+
+Keys are scoped to the endpoint and expire after ``IDEMPOTENCY_TTL``
+seconds. The same key sent with a different request is answered with 422.
+"""
+import functools
+import hashlib
+from datetime import timedelta
+
+from flask import current_app, make_response, request
+from sqlalchemy import delete, event, func, update
+from sqlalchemy.dialects.postgresql import insert
+
+from api.models.idempotency_key import IdempotencyKey
+from api.replicas import RoutingSession
+from config import db
+
+HEADER = 'Idempotency-Key'
+KEY_MAX_LENGTH = IdempotencyKey.__table__.c.key.type.length
+
+
+def request_hash():
+    """SHA-256 of the method, URL and body of the current request."""
+    digest = hashlib.sha256(f'{request.method} {request.full_path}\n'.encode())
+    digest.update(request.get_data())
+    return digest.digest()
+
+
+def reserve(key, endpoint, fingerprint):
+    """Insert ``key`` in the current transaction and return True, or return
+    False when a live request already holds it.
+
+    An expired key is taken over in the same statement.
+    """
+    statement = insert(IdempotencyKey).values(
+        key=key,
+        endpoint=endpoint,
+        request_hash=fingerprint,
+        expires_at=func.now() + timedelta(seconds=current_app.config['IDEMPOTENCY_TTL'])
+    )
+    statement = statement.on_conflict_do_update(
+        index_elements=['key', 'endpoint'],
+        set_={
+            'request_hash': statement.excluded.request_hash,
+            'status_code': None,
+            'body': None,
+            'created_at': func.now(),
+            'expires_at': statement.excluded.expires_at
+        },
+        where=IdempotencyKey.expires_at <= func.now()
+    ).returning(IdempotencyKey.key)
+    return db.session.execute(statement).first() is not None
+
+
+def store(key, endpoint, response):
+    """Record ``response`` under ``key``, in the transaction of the write.
+
+    Responses that cannot be replayed drop the reservation instead: their
+    retries run again.
+    """
+    key_row = (IdempotencyKey.key == key, IdempotencyKey.endpoint == endpoint)
+    if response.status_code >= 500 or not response.is_json:
+        statement = delete(IdempotencyKey).where(*key_row)
+    else:
+        statement = update(IdempotencyKey).where(*key_row).values(
+            status_code=response.status_code, body=response.get_json()
+        )
+    db.session.execute(statement.execution_options(synchronize_session=False))
+
+
+def replay(stored, fingerprint):
+    if stored.request_hash != fingerprint:
+        return {'message': f'{HEADER} already used with a different request'}, 422
+    if stored.status_code is None:
+        return {'message': f'A request with this {HEADER} is in progress'}, 409, {'Retry-After': '1'}
+    return stored.body, stored.status_code, {'Idempotent-Replayed': 'true'}
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def note_released(session):
+    """Tell :func:`idempotent` the view committed, releasing its savepoint."""
+    savepoint = session.info.get('idempotent_savepoint')
+    if savepoint is not None and session.get_nested_transaction() is savepoint:
+        session.info['idempotent_released'] = True
+
+
+def run_in_savepoint(view, *args, **kwargs):
+    """Response of ``view`` run in a SAVEPOINT, and whether it committed.
+
+    A session in 1.x style only releases the innermost SAVEPOINT on commit,
+    so the write of the view stays in the transaction of the reservation.
+    """
+    session = db.session()
+    session.info['idempotent_savepoint'] = session.begin_nested()
+    try:
+        response = make_response(view(*args, **kwargs))
+    finally:
+        session.info.pop('idempotent_savepoint')
+        released = session.info.pop('idempotent_released', False)
+    return response, released
+
+
+def idempotent(view):
+    """Make the POST ``view`` safe to retry with an ``Idempotency-Key``.
+
+    The view must write in a single transaction it commits itself. Requests
+    without the header run the view as usual.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get(HEADER)
+        if key is None:
+            return view(*args, **kwargs)
+        if not 0 < len(key) <= KEY_MAX_LENGTH:
+            return {'message': f'{HEADER} must have 1 to {KEY_MAX_LENGTH} characters'}, 400
+
+        endpoint = request.endpoint
+        fingerprint = request_hash()
+        while not reserve(key, endpoint, fingerprint):
+            stored = db.session.get(IdempotencyKey, (key, endpoint))
+            if stored is not None:
+                db.session.rollback()
+                return replay(stored, fingerprint)
+            # The key expired and was purged between the two statements.
+
+        try:
+            response, committed = run_in_savepoint(view, *args, **kwargs)
+        except BaseException:
+            rollback_all()
+            raise
+        if not committed:
+            rollback_all()
+            return response
+        store(key, endpoint, response)
+        db.session.commit()
+        return response
+    return wrapper
+
+
+def rollback_all():
+    """Roll back the transaction of the reservation, savepoint included,
+    which ``Session.rollback()`` would leave open."""
+    transaction = db.session().get_transaction()
+    if transaction is not None:
+        transaction.rollback()
+
+
+def purge_expired():
+    """Delete the expired keys and return how many there were."""
+    statement = (
+        delete(IdempotencyKey)
+        .where(IdempotencyKey.expires_at <= func.now())
+        .execution_options(synchronize_session=False)
+    )
+    result = db.session.execute(statement)
+    db.session.commit()
+    return result.rowcount
@@ -0,0 +1,196 @@
+import csv
+import io
+import itertools
+import json
+import math
+from datetime import datetime, timezone
+
+from flask import current_app, request
+from sqlalchemy import insert
+
+from api.models.equipment import Equipment, Operation
+from api.utils import chunked, parse_timestamp
+from config import db
+
+OPERATION_COLUMNS = ('equipment_id', 'type', 'cost', 'performed_at')
+TYPE_MAX_LENGTH = Operation.__table__.c.type.type.length
+
+
+class IngestError(ValueError):
+    """The uploaded batch could not be read at all."""
+
+
+def read_operation_rows():
+    """Yield ``(row_number, row)`` pairs from the request body.
+
+    JSON arrays, NDJSON (``application/x-ndjson``) and CSV (``text/csv``,
+    with a ``code,type,cost`` header and an optional ``performed_at``
+    column) bodies are accepted. Row numbers start
+    at 1 and follow the order of the upload.
+
+    Raises IngestError when the body cannot be read: an unsupported content
+    type, a JSON body that is not an array, or a row that is not UTF-8 or
+    not valid CSV.
+    """
+    mimetype = request.mimetype
+
+    if mimetype == 'application/json':
+        rows = request.get_json(silent=True)
+        if not isinstance(rows, list):
+            raise IngestError('Body must be a JSON array of operations')
+        yield from enumerate(rows, start=1)
+    elif mimetype == 'application/x-ndjson':
+        row_number = 0
+        for line in request.stream:
+            if not line.strip():
+                continue
+            row_number += 1
+            try:
+                line = line.decode('utf-8')
+            except UnicodeDecodeError:
+                raise IngestError(f'Row {row_number} is not valid UTF-8')
+            try:
+                yield row_number, json.loads(line)
+            except ValueError:
+                yield row_number, None
+    elif mimetype == 'text/csv':
+        yield from read_csv_rows(request.stream)
+    else:
+        raise IngestError(f'Unsupported content type {mimetype}')
+
+
+def read_csv_rows(stream):
+    """Yield ``(row_number, row)`` pairs from the lines of a CSV upload.
+
+    Lines are decoded one at a time so a decoding error names its row, and
+    the reader is strict so an unterminated quote is an error instead of
+    swallowing the rest of the upload.
+    """
+    rows = csv.DictReader((line.decode('utf-8') for line in stream), strict=True)
+    for row_number in itertools.count(1):
+        try:
+            row = next(rows)
+        except StopIteration:
+            return
+        except UnicodeDecodeError:
+            raise IngestError(f'Row {row_number} is not valid UTF-8')
+        except csv.Error as error:
+            raise IngestError(f'Row {row_number} is not valid CSV: {error}')
+        yield row_number, row
+
+
+def validate_operation(row, equipment_ids, performed_at):
+    """Return ``(values, error)`` for one uploaded row, performed at
+    ``performed_at`` unless the row has its own ``performed_at``."""
+    if not isinstance(row, dict):
+        return None, 'Invalid row'
+
+    try:
+        code, type_, cost = row['code'], row['type'], row['cost']
+    except KeyError as key:
+        return None, f'Missing field {key}'
+
+    if not isinstance(code, str) or code not in equipment_ids:
+        return None, f'Equipment {code} not found'
+    if not isinstance(type_, str) or not 0 < len(type_) <= TYPE_MAX_LENGTH:
+        return None, 'Invalid type'
+    # float() takes booleans as 0 and 1.
+    if isinstance(cost, bool):
+        return None, 'Invalid cost'
+    try:
+        cost = float(cost)
+    except (TypeError, ValueError):
+        return None, 'Invalid cost'
+    if not math.isfinite(cost):
+        return None, 'Invalid cost'
+    if row.get('performed_at'):
+        try:
+            performed_at = parse_timestamp(row['performed_at'])
+        except ValueError:
+            return None, 'Invalid performed_at'
+
+    return (equipment_ids[code], type_, cost, performed_at), None
+
+
+def resolve_equipment_ids(codes):
+    """Map every known equipment code in ``codes`` to its id."""
+    equipment_ids = {}
+    for chunk in chunked(codes, current_app.config['BULK_CHUNK_SIZE']):
+        query = db.session.query(Equipment.code, Equipment.id).filter(Equipment.code.in_(chunk))
+        equipment_ids.update(query)
+    return equipment_ids
+
+
+def row_code(row):
+    if isinstance(row, dict) and isinstance(row.get('code'), str):
+        return row['code']
+    return None
+
+
+def copy_operations(rows):
+    """Insert ``rows`` with PostgreSQL ``COPY ... FROM STDIN``."""
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+
+    connection = db.session.connection().connection
+    with connection.cursor() as cursor:
+        cursor.copy_expert(
+            f"COPY {Operation.__tablename__} ({', '.join(OPERATION_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+            buffer
+        )
+
+
+def insert_operations(rows):
+    """Insert ``rows`` with one multi-row ``INSERT`` per chunk."""
+    db.session.execute(insert(Operation), [dict(zip(OPERATION_COLUMNS, row)) for row in rows])
+
+
+def ingest_operations(uploaded):
+    """Validate and insert a batch of uploaded operations.
+
+    ``uploaded`` yields ``(row_number, row)`` pairs, as
+    :func:`read_operation_rows` does.
+
+    Rows are read ``INGEST_CHUNK_SIZE`` at a time, so memory use does not
+    depend on the size of the upload. The equipment codes of a chunk not
+    seen in earlier ones are resolved with a single query, and its valid
+    rows are written with the ``INGEST_METHOD`` strategy (``copy`` or
+    ``insert``) before the next chunk is read. Invalid rows are skipped and
+    reported. The caller owns the transaction, and rolls back the chunks
+    already written when an upload goes over ``INGEST_MAX_ROWS``.
+
+    Returns ``(inserted, failed, errors)`` where ``errors`` lists the first
+    ``INGEST_MAX_ERRORS`` of the ``failed`` rows as
+    ``{'row': row_number, 'message': ...}`` dictionaries.
+    """
+    config = current_app.config
+    max_rows, max_errors = config['INGEST_MAX_ROWS'], config['INGEST_MAX_ERRORS']
+    write = copy_operations if config['INGEST_METHOD'] == 'copy' else insert_operations
+
+    # Rows without a performed_at all get the time the batch was received.
+    received_at = datetime.now(timezone.utc)
+    equipment_ids, resolved = {}, set()
+    inserted, failed, errors = 0, 0, []
+    for chunk in chunked(uploaded, config['INGEST_CHUNK_SIZE']):
+        if chunk[-1][0] > max_rows:
+            raise OverflowError(f'At most {max_rows} operations per request')
+
+        codes = {row_code(row) for _, row in chunk} - resolved - {None}
+        equipment_ids.update(resolve_equipment_ids(codes))
+        resolved.update(codes)
+
+        valid = []
+        for row_number, row in chunk:
+            values, error = validate_operation(row, equipment_ids, received_at)
+            if error:
+                failed += 1
+                if len(errors) < max_errors:
+                    errors.append({'row': row_number, 'message': error})
+            else:
+                valid.append(values)
+        if valid:
+            write(valid)
+        inserted += len(valid)
+
+    return inserted, failed, errors
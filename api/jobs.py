@@ -0,0 +1,257 @@
+"""Background jobs queued in PostgreSQL.
+
+Endpoints :func:`enqueue` a row in ``jobs`` and answer ``202 Accepted`` with
+its id. ``flask jobs worker`` processes claim queued rows with ``FOR UPDATE
+SKIP LOCKED``, so any number of them share the queue without a broker and
+without two of them running the same job. Clients follow a job at
+``GET /jobs/<id>``.
+
+A job kind is a function registered with :func:`handler`. It gets the job
+payload and a ``progress(done, total)`` callback, runs in the app context of
+the worker, commits its own writes and returns a JSON compatible result.
+While it runs, the worker renews the ``updated_at`` of the job every
+``JOB_HEARTBEAT_SECONDS``, whether the handler reports progress or not.
+
+Between jobs, workers also create the upcoming partitions of operations
+every ``PARTITION_CHECK_INTERVAL`` seconds (see api.partitions).
+"""
+import contextlib
+import logging
+import multiprocessing
+import threading
+import time
+
+from flask import current_app, url_for
+from sqlalchemy import case, func, select, text, update
+from sqlalchemy.exc import DBAPIError
+
+from api.models.job import Job
+from api.partitions import create_partitions
+from config import db
+
+logger = logging.getLogger(__name__)
+
+HANDLERS = {}
+
+
+class JobError(Exception):
+    """Expected failure of a job, reported to the client with ``result``."""
+
+    def __init__(self, message, result=None):
+        super().__init__(message)
+        self.result = result
+
+
+def handler(kind):
+    """Register the decorated function as the handler of ``kind`` jobs."""
+    def decorator(function):
+        HANDLERS[kind] = function
+        return function
+    return decorator
+
+
+def enqueue(kind, payload):
+    """Queue a ``kind`` job and commit, so workers can claim it right away."""
+    job = Job(kind=kind, payload=payload)
+    db.session.add(job)
+    db.session.commit()
+    logger.info('Job %d queued', job.id, extra={'job_id': job.id, 'kind': kind})
+    return job
+
+
+def accepted(job):
+    """``202 Accepted`` response pointing at the status of ``job``."""
+    location = url_for('jobs.view_job', job_id=job.id)
+    return {'message': 'Accepted', 'job_id': job.id}, 202, {'Location': location}
+
+
+def claim():
+    """Mark the oldest queued job as running and return its ``(id, kind,
+    payload)``, or ``None`` when there is nothing to run.
+
+    Rows locked by another worker's claim are skipped instead of waited for.
+    """
+    queued = (
+        select(Job.id)
+        .where(Job.status == 'queued')
+        .order_by(Job.id)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    statement = (
+        update(Job)
+        .where(Job.id == queued)
+        .values(status='running', attempts=Job.attempts + 1, started_at=func.now(), updated_at=func.now())
+        .returning(Job.id, Job.kind, Job.payload)
+        .execution_options(synchronize_session=False)
+    )
+    job = db.session.execute(statement).first()
+    db.session.commit()
+    return job
+
+
+def progress_reporter(job_id):
+    """``progress(done, total)`` callback of a job.
+
+    It writes on a connection of its own, so the progress is visible while
+    the handler's transaction is still open.
+    """
+    def progress(done, total):
+        with db.engine.begin() as connection:
+            connection.execute(
+                update(Job)
+                .where(Job.id == job_id)
+                .values(progress=done / total if total else 1.0, updated_at=func.now())
+            )
+    return progress
+
+
+@contextlib.contextmanager
+def heartbeat(job_id):
+    """Renew the ``updated_at`` of the running job ``job_id`` every
+    ``JOB_HEARTBEAT_SECONDS`` until the block exits, so :func:`requeue_stale`
+    tells a long handler from a dead worker.
+
+    A thread of the worker writes it on a connection of its own.
+    """
+    engine = db.engine
+    interval = current_app.config['JOB_HEARTBEAT_SECONDS']
+    stopped = threading.Event()
+
+    def beat():
+        while not stopped.wait(interval):
+            try:
+                with engine.begin() as connection:
+                    connection.execute(
+                        update(Job)
+                        .where(Job.id == job_id, Job.status == 'running')
+                        .values(updated_at=func.now())
+                    )
+            except DBAPIError:
+                logger.warning('Heartbeat of job %d failed', job_id, exc_info=True, extra={'job_id': job_id})
+
+    thread = threading.Thread(target=beat, name=f'job-{job_id}-heartbeat', daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stopped.set()
+        thread.join()
+
+
+def finish(job_id, status, result=None, error=None):
+    values = {'status': status, 'result': result, 'error': error, 'updated_at': func.now(), 'finished_at': func.now()}
+    if status == 'succeeded':
+        values['progress'] = 1.0
+    statement = update(Job).where(Job.id == job_id).values(**values).execution_options(synchronize_session=False)
+    db.session.execute(statement)
+    db.session.commit()
+
+
+def run_next():
+    """Claim and run one job. Returns its id, or ``None`` when the queue is empty."""
+    job = claim()
+    if job is None:
+        return None
+
+    job_id, kind, payload = job
+    extra = {'job_id': job_id, 'kind': kind}
+    started = time.perf_counter()
+    try:
+        with heartbeat(job_id):
+            result = HANDLERS[kind](payload, progress_reporter(job_id))
+    except JobError as error:
+        db.session.rollback()
+        logger.info('Job %d failed: %s', job_id, error, extra=extra)
+        finish(job_id, 'failed', error.result, str(error))
+    except Exception:
+        db.session.rollback()
+        logger.exception('Job %d failed', job_id, extra=extra)
+        finish(job_id, 'failed', error='An unhandled exception occurred.')
+    else:
+        finish(job_id, 'succeeded', result)
+        logger.info('Job %d succeeded in %.1f s', job_id, time.perf_counter() - started, extra=extra)
+    return job_id
+
+
+def requeue_stale():
+    """Queue again the running jobs without a heartbeat for ``JOB_STALE_SECONDS``,
+    whose worker most likely died, or fail them after ``JOB_MAX_ATTEMPTS``."""
+    exhausted = Job.attempts >= current_app.config['JOB_MAX_ATTEMPTS']
+    statement = (
+        update(Job)
+        .where(
+            Job.status == 'running',
+            Job.updated_at < func.now() - text(f"interval '{current_app.config['JOB_STALE_SECONDS']} seconds'")
+        )
+        .values(
+            status=case((exhausted, 'failed'), else_='queued'),
+            error=case((exhausted, 'The worker running the job stopped responding.'), else_=None),
+            finished_at=case((exhausted, func.now()), else_=None)
+        )
+        .returning(Job.id)
+        .execution_options(synchronize_session=False)
+    )
+    stale = db.session.execute(statement).scalars().all()
+    db.session.commit()
+    if stale:
+        logger.warning('%d stale jobs requeued or failed', len(stale), extra={'job_ids': stale})
+    return stale
+
+
+def maintain_partitions():
+    """Create the partitions of the next ``PARTITION_MONTHS_AHEAD`` months.
+
+    A failure is logged, not raised: the next check tries again, and rows
+    keep landing in the default partition meanwhile.
+    """
+    try:
+        created = create_partitions(current_app.config['PARTITION_MONTHS_AHEAD'])
+    except DBAPIError:
+        db.session.rollback()
+        logger.warning('Creating the upcoming partitions failed', exc_info=True)
+        return
+    if created:
+        logger.info('Partitions %s created', ', '.join(created))
+
+
+def work(app, poll_interval, burst=False):
+    """Run jobs until stopped, or until the queue is empty with ``burst``."""
+    with app.app_context():
+        next_check = time.monotonic()
+        while True:
+            if time.monotonic() >= next_check:
+                maintain_partitions()
+                next_check = time.monotonic() + app.config['PARTITION_CHECK_INTERVAL']
+            requeue_stale()
+            job_id = run_next()
+            db.session.remove()
+            if job_id is None:
+                if burst:
+                    return
+                time.sleep(poll_interval)
+
+
+def start_workers(app, processes, poll_interval, burst=False):
+    """Run ``processes`` worker processes and wait for them.
+
+    Workers are forked: the connections of the parent are disposed first,
+    so no connection is shared between processes.
+    """
+    with app.app_context():
+        db.engine.dispose()
+
+    context = multiprocessing.get_context('fork')
+    workers = [
+        context.Process(target=work, args=(app, poll_interval, burst), name=f'jobs-worker-{index}')
+        for index in range(processes)
+    ]
+    for worker in workers:
+        worker.start()
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        for worker in workers:
+            worker.terminate()
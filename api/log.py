@@ -0,0 +1,110 @@
+import atexit
+import json
+import logging
+import queue
+import sys
+import time
+import uuid
+from logging.handlers import QueueHandler, QueueListener
+
+from flask import g, has_request_context, request
+
+# Attributes every LogRecord has; anything else was passed through ``extra``.
+RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'request_id'}
+
+_listener = None
+
+
+class RequestIdFilter(logging.Filter):
+    """Stamp records with the id of the request being served, if any."""
+
+    def filter(self, record):
+        record.request_id = g.get('request_id') if has_request_context() else None
+        return True
+
+
+class DeferredQueueHandler(QueueHandler):
+    """QueueHandler leaving all formatting to the listener thread.
+
+    The stdlib ``prepare`` merges the message with its args and renders the
+    traceback on the calling thread, then drops ``exc_info``, so formatters
+    of the listener never see the exception. Records are queued as they are.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    """Format records as one JSON object per line."""
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'request_id': getattr(record, 'request_id', None)
+        }
+        entry.update((key, value) for key, value in vars(record).items() if key not in RECORD_ATTRIBUTES)
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging(app):
+    """Set up the ``api`` loggers once per process.
+
+    Records are handed unformatted to a DeferredQueueHandler on the request
+    thread, then formatted and written by a QueueListener thread, so neither
+    formatting nor log I/O slows a request down.
+    """
+    global _listener
+
+    logger = logging.getLogger('api')
+    logger.setLevel(app.config.get('LOG_LEVEL', 'INFO'))
+
+    if _listener is None:
+        stream_handler = logging.StreamHandler(sys.stdout)
+        if app.config.get('LOG_FORMAT', 'json') == 'json':
+            stream_handler.setFormatter(JsonFormatter())
+        else:
+            stream_handler.setFormatter(logging.Formatter(
+                '%(levelname)s - %(asctime)s [%(request_id)s] (%(name)s:%(funcName)s): %(message)s'
+            ))
+
+        log_queue = queue.SimpleQueue()
+        queue_handler = DeferredQueueHandler(log_queue)
+        queue_handler.addFilter(RequestIdFilter())
+
+        logger.addHandler(queue_handler)
+        logger.propagate = False
+
+        _listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)
+
+    request_logger = logging.getLogger('api.requests')
+
+    @app.before_request
+    def start_request():
+        g.request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def log_request(response):
+        if 'request_id' not in g:
+            return response
+
+        response.headers['X-Request-ID'] = g.request_id
+        if request_logger.isEnabledFor(logging.INFO):
+            request_logger.info('%s %s %s', request.method, request.path, response.status_code, extra={
+                'method': request.method,
+                'path': request.path,
+                'endpoint': request.endpoint,
+                'status': response.status_code,
+                'latency_ms': round((time.perf_counter() - g.request_started) * 1000, 3),
+                'db_statements': g.get('db_statements'),
+                'db_ms': round(g.get('db_seconds', 0.0) * 1000, 3)
+            })
+        return response
@@ -0,0 +1,79 @@
+"""Vessel and equipment lookups.
+
+Serialized rows and ids by code are cached for ``CACHE_TTL`` seconds, keyed
+by the name of their table, and a hit costs no query. Every commit writing a
+table drops its entries in the process that made it (see
+api.models.table_version). The other processes are told by the NOTIFY the
+table triggers send on update or delete, and their listener drops them too.
+
+Lookups reading a replica may get a row the primary has changed since, its
+invalidation already received: they use the entries but store nothing. In a
+:func:`api.http_cache.conditional` view, entries are stamped with the table
+version its validator was built from, so a hit is exactly the representation
+of its ETag.
+"""
+from flask import g, has_request_context
+
+from api.cache import cache
+from api.models.equipment import Equipment
+from api.models.table_version import WRITES_CHANNEL, write_observers
+from api.models.vessel import Vessel
+from config import db
+
+CACHED_TABLES = (Vessel.__tablename__, Equipment.__tablename__)
+
+
+def listener_connection(engine):
+    """Connection to ``engine`` taken out of its pool, for the cache listener."""
+    connection = engine.raw_connection()
+    connection.detach()
+    return connection.connection
+
+
+def lookup(table, key, load):
+    """Cached result of ``load()`` under ``<table>:<key>``."""
+    engine = db.engine
+    cache.listen(WRITES_CHANNEL, lambda: listener_connection(engine), CACHED_TABLES)
+
+    versions = g.get('table_versions', {}) if has_request_context() else {}
+    version = versions.get(table)
+    store = version is not None or not db.session().reads_replica()
+    return cache.get_or_load(f'{table}:{key}', load, version, store)
+
+
+def get_vessel(vessel_id):
+    """Serialized vessel with ``vessel_id``, or ``None``."""
+    def load():
+        vessel = Vessel.query.get(vessel_id)
+        return vessel.to_dict() if vessel else None
+    return lookup(Vessel.__tablename__, vessel_id, load)
+
+
+def vessel_id_by_code(code):
+    """Id of the vessel with ``code``, or ``None``."""
+    def load():
+        return db.session.query(Vessel.id).filter_by(code=code).scalar()
+    return lookup(Vessel.__tablename__, f'code:{code}', load)
+
+
+def get_equipment(equipment_id):
+    """Serialized equipment with ``equipment_id``, or ``None``."""
+    def load():
+        equipment = Equipment.query.get(equipment_id)
+        return equipment.to_dict() if equipment else None
+    return lookup(Equipment.__tablename__, equipment_id, load)
+
+
+def equipment_id_by_code(code):
+    """Id of the equipment with ``code``, or ``None``."""
+    def load():
+        return db.session.query(Equipment.id).filter_by(code=code).scalar()
+    return lookup(Equipment.__tablename__, f'code:{code}', load)
+
+
+def invalidate(tables):
+    """Drop the cached entries of the ``tables`` a commit just wrote."""
+    cache.invalidate(*(table for table in tables if table in CACHED_TABLES))
+
+
+write_observers.append(invalidate)
@@ -0,0 +1,341 @@
+"""Request metrics, served in the Prometheus text format.
+
+Recording a request costs a few dict updates under one lock, so the
+instrumentation stays on in production. Each process keeps its own registry.
+With ``METRICS_DIR`` set, as under gunicorn, every process also writes its
+series to a file of that directory each ``METRICS_FLUSH_INTERVAL`` seconds,
+and ``/metrics`` serves the sum of the files, so any worker answers for all
+of them. The series of exited workers are folded into an archive file, so
+counters never go back when workers are recycled.
+"""
+import atexit
+import bisect
+import fcntl
+import glob
+import json
+import os
+import threading
+import time
+import uuid
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+
+from api.cache import cache
+from config import db
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+STATEMENT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+POOL_WAIT_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5)
+
+# name: (type, help, histogram buckets)
+METRICS = {
+    'api_requests_total': ('counter', 'Requests served, by endpoint and status.', None),
+    'api_request_duration_seconds': ('histogram', 'Request latency, by endpoint.', LATENCY_BUCKETS),
+    'api_db_statements': ('histogram', 'SQL statements executed per request, by endpoint.', STATEMENT_BUCKETS),
+    'api_db_seconds_total': ('counter', 'Time spent executing SQL statements, by endpoint.', None),
+    'api_rows_serialized_total': ('counter', 'Rows encoded by the list endpoints, by endpoint.', None),
+    'api_response_bytes_total': ('counter', 'Response body bytes sent, by endpoint.', None),
+    'api_db_pool_wait_seconds': ('histogram', 'Time spent checking a connection out of the pool.', POOL_WAIT_BUCKETS),
+    'api_db_pool_checked_out': ('gauge', 'Connections currently checked out.', None),
+    'api_db_pool_overflow': ('gauge', 'Connections open beyond the pool size.', None),
+    'api_cache_entries': ('gauge', 'Entries held by the lookup cache.', None),
+    'api_cache_hits_total': ('counter', 'Lookup cache hits.', None),
+    'api_cache_misses_total': ('counter', 'Lookup cache misses.', None),
+}
+
+ARCHIVE = 'archive.json'
+
+_lock = threading.Lock()
+
+
+class Registry:
+    """Counters, gauges and histograms keyed by metric name and label pairs."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.series = {}
+
+    def inc(self, name, labels, amount=1):
+        key = (name, labels)
+        with self.lock:
+            self.series[key] = self.series.get(key, 0) + amount
+
+    def observe(self, name, labels, value):
+        buckets = METRICS[name][2]
+        key = (name, labels)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                # One count per bucket, one for +Inf, then the sum.
+                series = self.series[key] = [0] * (len(buckets) + 2)
+            series[bisect.bisect_left(buckets, value)] += 1
+            series[-1] += value
+
+    def set(self, name, labels, value):
+        with self.lock:
+            self.series[(name, labels)] = value
+
+    def snapshot(self):
+        with self.lock:
+            return {key: list(value) if isinstance(value, list) else value for key, value in self.series.items()}
+
+
+def render_series(series):
+    """``series`` as returned by :meth:`Registry.snapshot`, in the text format."""
+    lines = []
+    for name, (kind, description, buckets) in METRICS.items():
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} {kind}')
+        for (series_name, labels), value in series.items():
+            if series_name != name:
+                continue
+            if kind != 'histogram':
+                lines.append(f'{name}{format_labels(labels)} {value}')
+                continue
+            cumulative = 0
+            for bound, count in zip(buckets + ('+Inf',), value):
+                cumulative += count
+                lines.append(f'{name}_bucket{format_labels(labels + (("le", bound),))} {cumulative}')
+            lines.append(f'{name}_sum{format_labels(labels)} {value[-1]}')
+            lines.append(f'{name}_count{format_labels(labels)} {cumulative}')
+    return '\n'.join(lines) + '\n'
+
+
+def add_series(total, series, gauges=True):
+    """Add ``series`` to ``total`` in place, leaving out gauges unless
+    ``gauges`` is set."""
+    for key, value in series.items():
+        kind = METRICS[key[0]][0]
+        if kind == 'gauge' and not gauges:
+            continue
+        if kind == 'histogram':
+            current = total.setdefault(key, [0] * len(value))
+            for index, count in enumerate(value):
+                current[index] += count
+        else:
+            total[key] = total.get(key, 0) + value
+    return total
+
+
+def dump_series(series, path):
+    """Write ``series`` to ``path`` atomically."""
+    temporary = f'{path}.{threading.get_ident()}.tmp'
+    with open(temporary, 'w') as output:
+        json.dump([[name, labels, value] for (name, labels), value in series.items()], output)
+    os.replace(temporary, path)
+
+
+def load_series(path):
+    with open(path) as source:
+        return {(name, tuple(map(tuple, labels))): value for name, labels, value in json.load(source)}
+
+
+def process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class MetricsDirectory:
+    """Directory where the processes of a server write their series.
+
+    Files are named after the process id and a random token, so a recycled
+    pid never overwrites the series of an exited worker. Processes are told
+    alive by their pid: the directory belongs to the processes of one host
+    or container.
+    """
+
+    def __init__(self, path, flush_interval, sample):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.sample = sample
+        self._pid = None
+        self._file = None
+
+    def start(self):
+        """Start the flusher thread, again in a process forked since."""
+        if self._pid == os.getpid():
+            return
+        with _lock:
+            if self._pid == os.getpid():
+                return
+            os.makedirs(self.path, exist_ok=True)
+            self._file = os.path.join(self.path, f'{os.getpid()}-{uuid.uuid4().hex}.json')
+            self._pid = os.getpid()
+            threading.Thread(target=self._run_flushes, name='metrics-flush', daemon=True).start()
+            atexit.register(self.flush)
+
+    def _run_flushes(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def flush(self):
+        """Write the series of this process to its file."""
+        if self._pid == os.getpid():
+            dump_series(self.sample(), self._file)
+
+    def collect(self):
+        """Sum of the series of every process, this one flushed first.
+
+        Files of exited processes are folded into the archive, without
+        their gauges, under a lock so that no scrape counts them twice.
+        """
+        self.start()
+        self.flush()
+        archive = os.path.join(self.path, ARCHIVE)
+        with open(os.path.join(self.path, '.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            archived = load_series(archive) if os.path.exists(archive) else {}
+            live, exited = {}, []
+            for path in glob.glob(os.path.join(self.path, '[0-9]*-*.json')):
+                try:
+                    series = load_series(path)
+                except FileNotFoundError:
+                    continue
+                if process_alive(int(os.path.basename(path).split('-', 1)[0])):
+                    add_series(live, series)
+                else:
+                    add_series(archived, series, gauges=False)
+                    exited.append(path)
+            if exited:
+                dump_series(archived, archive)
+                for path in exited:
+                    os.unlink(path)
+        return add_series(live, archived)
+
+
+registry = Registry()
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
+
+
+def endpoint_labels():
+    return (('endpoint', request.endpoint or 'unmatched'),)
+
+
+def record_rows(count, size=None):
+    """Count ``count`` rows (and ``size`` body bytes of a streamed response)
+    sent by the current request."""
+    labels = endpoint_labels()
+    registry.inc('api_rows_serialized_total', labels, count)
+    if size is not None:
+        registry.inc('api_response_bytes_total', labels, size)
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool timing how long each checkout waits for a connection."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            registry.observe('api_db_pool_wait_seconds', (), time.perf_counter() - started)
+
+
+# Functions called with ``(cursor, statement, parameters, executemany,
+# elapsed)`` after every statement, to reuse its timing (see api.query_debug).
+statement_observers = []
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def start_statement(conn, cursor, statement, parameters, context, executemany):
+    conn.info['statement_started'] = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def end_statement(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info.pop('statement_started')
+    if has_request_context() and 'db_statements' in g:
+        g.db_statements += 1
+        g.db_seconds += elapsed
+    for observer in statement_observers:
+        observer(cursor, statement, parameters, executemany, elapsed)
+
+
+@event.listens_for(Engine, 'handle_error')
+def abandon_statement(context):
+    """Forget the start time of a failed statement, which gets no
+    ``after_cursor_execute``."""
+    if context.connection is not None:
+        context.connection.info.pop('statement_started', None)
+
+
+def sample_process():
+    """Series of this process, with the pool and lookup cache state of the
+    current app."""
+    pool = db.engine.pool
+    if isinstance(pool, QueuePool):
+        registry.set('api_db_pool_checked_out', (), pool.checkedout())
+        registry.set('api_db_pool_overflow', (), max(pool.overflow(), 0))
+
+    stats = cache.stats()
+    registry.set('api_cache_entries', (), stats['size'])
+    registry.set('api_cache_hits_total', (), stats['hits'])
+    registry.set('api_cache_misses_total', (), stats['misses'])
+    return registry.snapshot()
+
+
+def render_metrics():
+    """All metrics in the Prometheus text format: those of every process
+    writing to ``METRICS_DIR``, or of this one."""
+    directory = current_app.extensions.get('metrics_dir')
+    if directory is None:
+        return render_series(sample_process())
+    return render_series(directory.collect())
+
+
+def configure_metrics(app):
+    """Record latency, SQL statements and time, and response size of every
+    request, and time pool checkouts of the app engine.
+
+    With ``METRICS_DIR`` set, the series of the process are written there
+    once it served its first request.
+    """
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        'poolclass': InstrumentedQueuePool,
+        **app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {})
+    }
+
+    directory = None
+    if app.config['METRICS_DIR']:
+        def sample():
+            with app.app_context():
+                return sample_process()
+        directory = app.extensions['metrics_dir'] = MetricsDirectory(
+            app.config['METRICS_DIR'], app.config['METRICS_FLUSH_INTERVAL'], sample
+        )
+
+    @app.before_request
+    def start_metrics():
+        g.metrics_started = time.perf_counter()
+        g.db_statements = 0
+        g.db_seconds = 0.0
+
+    @app.after_request
+    def record_metrics(response):
+        if 'metrics_started' not in g:
+            return response
+
+        labels = endpoint_labels()
+        registry.inc('api_requests_total', labels + (('method', request.method), ('status', response.status_code)))
+        registry.observe('api_request_duration_seconds', labels, time.perf_counter() - g.metrics_started)
+        registry.observe('api_db_statements', labels, g.db_statements)
+        registry.inc('api_db_seconds_total', labels, g.db_seconds)
+        if not response.is_streamed:
+            registry.inc('api_response_bytes_total', labels, response.calculate_content_length() or 0)
+        if directory is not None:
+            directory.start()
+        return response
@@ -1,33 +1,204 @@
+from sqlalchemy import DDL, event
 from sqlalchemy_serializer import SerializerMixin
 
+from api.models.table_version import notify_writes, track_version
 from config import db
 
 
 class Equipment(db.Model, SerializerMixin):
     __tablename__ = 'equipments'
 
-    serialize_only = ('id', 'vessel_id', 'name', 'code', 'location', 'active')
+    __table_args__ = (
+        db.Index('ix_equipments_active', 'id', postgresql_where=db.text('active = true')),
+    )
+
+    serialize_only = ('id', 'vessel_id', 'name', 'code', 'location', 'active', 'version')
 
     id = db.Column(db.BigInteger, primary_key=True)
-    vessel_id = db.Column(db.BigInteger, db.ForeignKey('vessels.id'))
-    name = db.Column(db.String(256))
+    vessel_id = db.Column(db.BigInteger, db.ForeignKey('vessels.id', ondelete='CASCADE'), index=True)
+    name = db.Column(db.String(256), index=True)
     code = db.Column(db.String(8), unique=True)
-    location = db.Column(db.String(256))
+    location = db.Column(db.String(256), index=True)
     active = db.Column(db.Boolean, server_default='true')
+    # Bumped by the equipments_version trigger on every UPDATE changing the
+    # row, for If-Match conditional writes.
+    version = db.Column(db.Integer, nullable=False, server_default='1', server_onupdate=db.FetchedValue())
+
+    vessel = db.relationship('Vessel', back_populates='equipments')
+    operations = db.relationship(
+        'Operation', back_populates='equipment', cascade='all, delete-orphan', passive_deletes=True
+    )
 
     def __repr__(self):
         return f'Equipment <{self.name} - code: {self.code}>'
 
 
+# Set in the database rather than by each writer, so no UPDATE path can
+# change an equipment and keep its version. Updates that leave the row as it
+# was keep it too.
+EQUIPMENT_VERSION_FUNCTION = '''
+CREATE OR REPLACE FUNCTION bump_version() RETURNS trigger AS $$
+BEGIN
+    IF NEW IS DISTINCT FROM OLD THEN
+        NEW.version := OLD.version + 1;
+    END IF;
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+'''
+
+EQUIPMENT_VERSION_TRIGGER = '''
+CREATE TRIGGER equipments_version BEFORE UPDATE ON equipments
+    FOR EACH ROW EXECUTE PROCEDURE bump_version();
+'''
+
+event.listen(Equipment.__table__, 'after_create', DDL(EQUIPMENT_VERSION_FUNCTION))
+event.listen(Equipment.__table__, 'after_create', DDL(EQUIPMENT_VERSION_TRIGGER))
+
+
 class Operation(db.Model, SerializerMixin):
     __tablename__ = 'operations'
 
-    serialize_only = ('id', 'equipment_id', 'type', 'cost')
+    # Range partitioned by month on performed_at (see api.partitions), so
+    # time bounded queries only read the partitions of their period.
+    __table_args__ = (
+        db.Index('ix_operations_cost', 'cost', 'id'),
+        {'postgresql_partition_by': 'RANGE (performed_at)'},
+    )
 
-    id = db.Column(db.BigInteger, primary_key=True)
-    equipment_id = db.Column(db.BigInteger, db.ForeignKey('equipments.id'))
-    type = db.Column(db.String(32))
+    serialize_only = ('id', 'equipment_id', 'type', 'cost', 'performed_at')
+    datetime_format = None
+
+    id = db.Column(db.BigInteger, primary_key=True, autoincrement=True)
+    equipment_id = db.Column(db.BigInteger, db.ForeignKey('equipments.id', ondelete='CASCADE'), index=True)
+    type = db.Column(db.String(32), index=True)
     cost = db.Column(db.Float)
+    performed_at = db.Column(db.DateTime(timezone=True), primary_key=True, server_default=db.func.now())
+
+    equipment = db.relationship('Equipment', back_populates='operations')
 
     def __repr__(self):
         return f'Operation <{self.id} - type: {self.type}>'
+
+
+class OperationCost(db.Model):
+    """Count, sum, min and max cost per equipment and operation type.
+
+    Rows are maintained by statement level triggers on ``operations`` in the
+    same transaction as the write, so cost reports never scan the operations.
+    Operations without a type are grouped under ``''``. ``count`` only counts
+    the operations with a cost, like ``avg()``, so ``total / count`` is their
+    average.
+    """
+    __tablename__ = 'operation_costs'
+
+    equipment_id = db.Column(db.BigInteger, db.ForeignKey('equipments.id', ondelete='CASCADE'), primary_key=True)
+    type = db.Column(db.String(32), primary_key=True)
+    count = db.Column(db.BigInteger, nullable=False)
+    total = db.Column(db.Float, nullable=False)
+    min_cost = db.Column(db.Float)
+    max_cost = db.Column(db.Float)
+
+    def __repr__(self):
+        return f'OperationCost <{self.equipment_id} - type: {self.type}>'
+
+
+# Inserted rows are folded into the rollup. Deleted or updated rows make the
+# affected (equipment, type) groups be recomputed from the operations left.
+OPERATION_COSTS_FUNCTIONS = '''
+CREATE OR REPLACE FUNCTION operation_costs_insert() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO operation_costs AS c (equipment_id, type, count, total, min_cost, max_cost)
+    SELECT equipment_id, COALESCE(type, ''), count(cost), COALESCE(sum(cost), 0), min(cost), max(cost)
+    FROM new_rows
+    WHERE equipment_id IS NOT NULL
+    GROUP BY 1, 2
+    ON CONFLICT (equipment_id, type) DO UPDATE SET
+        count = c.count + EXCLUDED.count,
+        total = c.total + EXCLUDED.total,
+        min_cost = LEAST(c.min_cost, EXCLUDED.min_cost),
+        max_cost = GREATEST(c.max_cost, EXCLUDED.max_cost);
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION operation_costs_delete() RETURNS trigger AS $$
+BEGIN
+    WITH affected AS (
+        SELECT DISTINCT equipment_id, COALESCE(type, '') AS type FROM old_rows
+    )
+    DELETE FROM operation_costs c
+    USING affected a
+    WHERE c.equipment_id = a.equipment_id AND c.type = a.type;
+
+    WITH affected AS (
+        SELECT DISTINCT equipment_id, COALESCE(type, '') AS type FROM old_rows
+    )
+    INSERT INTO operation_costs (equipment_id, type, count, total, min_cost, max_cost)
+    SELECT o.equipment_id, COALESCE(o.type, ''), count(o.cost), COALESCE(sum(o.cost), 0), min(o.cost), max(o.cost)
+    FROM operations o
+    JOIN affected a ON o.equipment_id = a.equipment_id AND COALESCE(o.type, '') = a.type
+    GROUP BY 1, 2;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION operation_costs_update() RETURNS trigger AS $$
+BEGIN
+    WITH affected AS (
+        SELECT equipment_id, COALESCE(type, '') AS type FROM old_rows
+        UNION
+        SELECT equipment_id, COALESCE(type, '') FROM new_rows
+    )
+    DELETE FROM operation_costs c
+    USING affected a
+    WHERE c.equipment_id = a.equipment_id AND c.type = a.type;
+
+    WITH affected AS (
+        SELECT equipment_id, COALESCE(type, '') AS type FROM old_rows
+        UNION
+        SELECT equipment_id, COALESCE(type, '') FROM new_rows
+    )
+    INSERT INTO operation_costs (equipment_id, type, count, total, min_cost, max_cost)
+    SELECT o.equipment_id, COALESCE(o.type, ''), count(o.cost), COALESCE(sum(o.cost), 0), min(o.cost), max(o.cost)
+    FROM operations o
+    JOIN affected a ON o.equipment_id = a.equipment_id AND COALESCE(o.type, '') = a.type
+    GROUP BY 1, 2;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION operation_costs_truncate() RETURNS trigger AS $$
+BEGIN
+    DELETE FROM operation_costs;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+'''
+
+OPERATION_COSTS_TRIGGERS = '''
+CREATE TRIGGER operation_costs_insert AFTER INSERT ON operations
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE PROCEDURE operation_costs_insert();
+
+CREATE TRIGGER operation_costs_update AFTER UPDATE ON operations
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE PROCEDURE operation_costs_update();
+
+CREATE TRIGGER operation_costs_delete AFTER DELETE ON operations
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE PROCEDURE operation_costs_delete();
+
+CREATE TRIGGER operation_costs_truncate AFTER TRUNCATE ON operations
+    FOR EACH STATEMENT EXECUTE PROCEDURE operation_costs_truncate();
+'''
+
+event.listen(Operation.__table__, 'after_create', DDL(
+    f'CREATE TABLE {Operation.__tablename__}_default PARTITION OF {Operation.__tablename__} DEFAULT'
+))
+event.listen(Operation.__table__, 'after_create', DDL(OPERATION_COSTS_FUNCTIONS))
+event.listen(Operation.__table__, 'after_create', DDL(OPERATION_COSTS_TRIGGERS))
+
+track_version(Equipment.__table__)
+notify_writes(Equipment.__table__)
+track_version(Operation.__table__)
@@ -0,0 +1,26 @@
+from sqlalchemy.dialects.postgresql import JSONB
+
+from config import db
+
+
+class IdempotencyKey(db.Model):
+    """Response of a write request, stored under the ``Idempotency-Key`` sent
+    by its client so that retries can be answered without writing again.
+
+    The row is reserved and its response stored in the transaction of the
+    write, so ``status_code`` is only null while that transaction runs. Rows
+    past ``expires_at`` are taken over by a new request with the same key and
+    deleted by ``flask idempotency purge``.
+    """
+    __tablename__ = 'idempotency_keys'
+
+    key = db.Column(db.String(255), primary_key=True)
+    endpoint = db.Column(db.String(128), primary_key=True)
+    request_hash = db.Column(db.LargeBinary(32), nullable=False)
+    status_code = db.Column(db.SmallInteger)
+    body = db.Column(JSONB)
+    created_at = db.Column(db.DateTime(timezone=True), nullable=False, server_default=db.func.now())
+    expires_at = db.Column(db.DateTime(timezone=True), nullable=False, index=True)
+
+    def __repr__(self):
+        return f'IdempotencyKey <{self.endpoint} - {self.key}>'
@@ -0,0 +1,38 @@
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy_serializer import SerializerMixin
+
+from config import db
+
+
+class Job(db.Model, SerializerMixin):
+    """Background job queued by an endpoint and run by ``flask jobs worker``.
+
+    ``status`` goes from ``queued`` to ``running`` when a worker claims the
+    row, then to ``succeeded`` or ``failed``. ``progress`` runs from 0 to 1.
+    """
+    __tablename__ = 'jobs'
+
+    # Workers only look for queued and running jobs: the finished ones, the
+    # bulk of the table, stay out of the index.
+    __table_args__ = (
+        db.Index('ix_jobs_pending', 'status', 'id', postgresql_where=db.text("status IN ('queued', 'running')")),
+    )
+
+    serialize_only = ('id', 'kind', 'status', 'progress', 'result', 'error', 'created_at', 'started_at', 'finished_at')
+    datetime_format = None
+
+    id = db.Column(db.BigInteger, primary_key=True)
+    kind = db.Column(db.String(64), nullable=False)
+    status = db.Column(db.String(16), nullable=False, server_default='queued')
+    payload = db.Column(JSONB, nullable=False)
+    result = db.Column(JSONB)
+    error = db.Column(db.Text)
+    progress = db.Column(db.Float, nullable=False, server_default='0')
+    attempts = db.Column(db.Integer, nullable=False, server_default='0')
+    created_at = db.Column(db.DateTime(timezone=True), nullable=False, server_default=db.func.now())
+    started_at = db.Column(db.DateTime(timezone=True))
+    updated_at = db.Column(db.DateTime(timezone=True))
+    finished_at = db.Column(db.DateTime(timezone=True))
+
+    def __repr__(self):
+        return f'Job <{self.id} - {self.kind}: {self.status}>'
@@ -0,0 +1,157 @@
+import logging
+
+from sqlalchemy import DDL, event, func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import DBAPIError
+
+from api.replicas import RoutingSession
+from config import db
+
+logger = logging.getLogger(__name__)
+
+
+class TableVersion(db.Model):
+    """Change counter of a table, bumped after every transaction writing to it.
+
+    The HTTP layer derives ETag and Last-Modified headers from these rows, so
+    checking whether a resource changed costs one primary key lookup.
+    """
+    __tablename__ = 'table_versions'
+
+    name = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False)
+    updated_at = db.Column(db.DateTime(timezone=True), nullable=False)
+
+    def __repr__(self):
+        return f'TableVersion <{self.name} - version: {self.version}>'
+
+
+# Triggers only note the written table in a setting local to the transaction:
+# they lock nothing, so writers of a table never wait on each other. The
+# session reads the setting before committing and bumps the versions after
+# the commit, in a short transaction of its own (see bump_versions).
+WRITTEN_TABLES_SETTING = 'app.written_tables'
+
+TABLE_WRITE_FUNCTIONS = f'''
+CREATE OR REPLACE FUNCTION note_table_write(name text) RETURNS void AS $$
+DECLARE
+    written text := COALESCE(current_setting('{WRITTEN_TABLES_SETTING}', true), '');
+BEGIN
+    IF position(',' || name || ',' IN written) = 0 THEN
+        PERFORM set_config('{WRITTEN_TABLES_SETTING}', COALESCE(NULLIF(written, ''), ',') || name || ',', true);
+    END IF;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION table_written() RETURNS trigger AS $$
+BEGIN
+    PERFORM note_table_write(TG_TABLE_NAME);
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+'''
+
+TABLE_WRITE_TRIGGER = '''
+CREATE TRIGGER {table}_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {table}
+    FOR EACH STATEMENT EXECUTE PROCEDURE table_written();
+'''
+
+
+# Processes caching rows of a table are told of the writes of the others on
+# this channel (see api.lookups). Inserts change no row another process may
+# have cached, so they notify nothing.
+WRITES_CHANNEL = 'table_writes'
+
+TABLE_NOTIFY_FUNCTION = f'''
+CREATE OR REPLACE FUNCTION notify_table_write() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('{WRITES_CHANNEL}', TG_TABLE_NAME);
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+'''
+
+TABLE_NOTIFY_TRIGGER = '''
+CREATE TRIGGER {table}_notify AFTER UPDATE OR DELETE OR TRUNCATE ON {table}
+    FOR EACH STATEMENT EXECUTE PROCEDURE notify_table_write();
+'''
+
+# Functions called with the names of the tables a transaction wrote, after
+# it committed (see api.lookups).
+write_observers = []
+
+
+def track_version(table):
+    """Keep the ``table_versions`` row of ``table`` up to date."""
+    event.listen(table, 'after_create', DDL(TABLE_WRITE_FUNCTIONS))
+    event.listen(table, 'after_create', DDL(TABLE_WRITE_TRIGGER.format(table=table.name)))
+
+
+def notify_writes(table):
+    """Send the name of ``table`` on ``WRITES_CHANNEL`` when a transaction
+    updating or deleting rows of it commits. PostgreSQL sends it once per
+    transaction, however many statements wrote."""
+    event.listen(table, 'after_create', DDL(TABLE_NOTIFY_FUNCTION))
+    event.listen(table, 'after_create', DDL(TABLE_NOTIFY_TRIGGER.format(table=table.name)))
+
+
+def bump_versions(tables):
+    """Bump the versions of ``tables`` in a transaction of their own.
+
+    Rows are locked in name order, so concurrent bumps never deadlock.
+    """
+    statement = insert(TableVersion).values([
+        {'name': name, 'version': 1, 'updated_at': func.clock_timestamp()} for name in sorted(tables)
+    ])
+    statement = statement.on_conflict_do_update(
+        index_elements=[TableVersion.name],
+        set_={'version': TableVersion.version + 1, 'updated_at': statement.excluded.updated_at}
+    )
+    with db.engine.begin() as connection:
+        connection.execute(statement)
+
+
+@event.listens_for(RoutingSession, 'after_begin')
+def watch_connection(session, transaction, connection):
+    session.info.setdefault('version_connections', set()).add(connection)
+
+
+@event.listens_for(RoutingSession, 'before_commit')
+def collect_written_tables(session):
+    """Read the tables the transaction wrote, flushed first, before it commits."""
+    if session.in_nested_transaction():
+        return
+    session.flush()
+    written = session.info.setdefault('written_tables', set())
+    for connection in session.info.get('version_connections', ()):
+        noted = connection.exec_driver_sql(f"SELECT current_setting('{WRITTEN_TABLES_SETTING}', true)").scalar()
+        written.update(name for name in (noted or '').split(',') if name)
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def bump_written_tables(session):
+    """Bump the versions of the tables written by the transaction just
+    committed, then tell the ``write_observers``.
+
+    A failed bump is logged, not raised: the write itself is committed, and
+    the next write to the table bumps its version anyway.
+    """
+    if session.in_nested_transaction():
+        return
+    session.info.pop('version_connections', None)
+    tables = session.info.pop('written_tables', None)
+    if not tables:
+        return
+    try:
+        bump_versions(tables)
+    except DBAPIError:
+        logger.warning('Bumping the versions of %s failed', ', '.join(sorted(tables)), exc_info=True)
+    for observer in write_observers:
+        observer(tables)
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def forget_written_tables(session):
+    if not session.in_nested_transaction():
+        session.info.pop('version_connections', None)
+        session.info.pop('written_tables', None)
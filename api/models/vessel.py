@@ -1,13 +1,26 @@
 from sqlalchemy_serializer import SerializerMixin
 
+from api.models.table_version import notify_writes, track_version
 from config import db
 
 
 class Vessel(db.Model, SerializerMixin):
     __tablename__ = 'vessels'
 
+    serialize_only = ('id', 'code')
+
     id = db.Column(db.BigInteger, primary_key=True)
     code = db.Column(db.String(8), unique=True)
 
+    # Equipments and their operations are deleted by the ON DELETE CASCADE
+    # foreign keys, never loaded into the session to be deleted one by one.
+    equipments = db.relationship(
+        'Equipment', back_populates='vessel', cascade='all, delete-orphan', passive_deletes=True
+    )
+
     def __repr__(self):
         return f'Vessel <{self.code}>'
+
+
+track_version(Vessel.__table__)
+notify_writes(Vessel.__table__)
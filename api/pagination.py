@@ -0,0 +1,201 @@
+import base64
+import binascii
+import json
+from collections import namedtuple
+
+from flask import Response, current_app, request, stream_with_context, url_for
+from sqlalchemy import and_, or_, tuple_
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_accept_header
+
+from api.filters import filter_criteria, parse_fields, parse_sort
+from api.metrics import record_rows
+from api.serialization import dumps, project, row_encoder, serialized_columns
+from config import db
+
+ListArgs = namedtuple('ListArgs', 'limit after criteria sort descending fields')
+
+
+def encode_cursor(value, object_id):
+    """Opaque ``after`` token for a page sorted by another column than id."""
+    return base64.urlsafe_b64encode(dumps([value, object_id])).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    try:
+        value, object_id = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    except (binascii.Error, TypeError, ValueError):
+        raise ValueError('after is not a valid cursor')
+    return value, object_id
+
+
+def parse_page_args(args, config, cursor=False):
+    """Parse the ``limit`` and ``after`` entries of the query ``args`` of a
+    list request, with the page size settings of ``config``.
+
+    ``after`` is an id, or a ``(value, id)`` pair decoded from an opaque
+    token when ``cursor`` is set.
+    Raises ValueError with a client facing message on invalid values.
+    """
+    max_limit = config['PAGE_MAX_LIMIT']
+    limit = args.get('limit', config['PAGE_DEFAULT_LIMIT'])
+    after = args.get('after')
+
+    try:
+        limit = int(limit)
+        if after is not None and not cursor:
+            after = int(after)
+    except ValueError:
+        raise ValueError('limit and after must be integers')
+
+    if after is not None and cursor:
+        after = decode_cursor(after)
+
+    if not 0 < limit <= max_limit:
+        raise ValueError(f'limit must be between 1 and {max_limit}')
+
+    return limit, after
+
+
+def parse_list_args(model, args, config):
+    """Parse the paging, filter, ``sort`` and ``fields`` parameters of a list
+    request on ``model`` (see api.filters).
+
+    Raises ValueError with a client facing message on invalid values.
+    """
+    sort, descending = parse_sort(model, args.get('sort'))
+    limit, after = parse_page_args(args, config, cursor=sort.key != 'id')
+    fields = parse_fields(model, args.get('fields'), required=('id', sort.key))
+    return ListArgs(limit, after, filter_criteria(model, args), sort, descending, fields)
+
+
+def keyset(model, listing):
+    """WHERE criteria and ORDER BY clauses selecting the page of ``listing``.
+
+    Rows are ordered by the sort column, then by id to break ties, and the
+    page starts right after the ``after`` position. Sort columns are
+    nullable: NULLs come last in ascending order and first in descending
+    order, as in their indexes, and a cursor may hold a NULL value.
+    """
+    criteria = list(listing.criteria)
+    if listing.sort.key == 'id':
+        order_by = [model.id.desc() if listing.descending else model.id]
+        if listing.after is not None:
+            criteria.append(model.id < listing.after if listing.descending else model.id > listing.after)
+        return criteria, order_by
+
+    sort = listing.sort
+    if listing.descending:
+        order_by = [sort.desc().nulls_first(), model.id.desc()]
+    else:
+        order_by = [sort.asc().nulls_last(), model.id]
+    if listing.after is not None:
+        criteria.append(after_position(sort, model.id, listing.after, listing.descending))
+    return criteria, order_by
+
+
+def after_position(sort, id_column, after, descending):
+    """Criterion of the rows following the ``(value, id)`` position ``after``.
+
+    Comparisons with NULL are never true, so the rows with a NULL sort value
+    are matched with IS NULL, before or after the others.
+    """
+    value, object_id = after
+    if value is None:
+        following = id_column < object_id if descending else id_column > object_id
+        if descending:
+            return or_(and_(sort.is_(None), following), sort.isnot(None))
+        return and_(sort.is_(None), following)
+
+    position, start = tuple_(sort, id_column), tuple_(value, object_id)
+    if descending:
+        return position < start
+    return or_(position > start, sort.is_(None))
+
+
+def next_after(model, listing, row):
+    """``after`` value of the page following the one ending with ``row``."""
+    columns = serialized_columns(model, listing.fields)
+    table = model.__table__
+    object_id = row[columns.index(table.c.id)]
+    if listing.sort.key == 'id':
+        return object_id
+    return encode_cursor(row[columns.index(table.c[listing.sort.key])], object_id)
+
+
+def list_args(model):
+    """Parse the list parameters of the current request."""
+    return parse_list_args(model, request.args, current_app.config)
+
+
+def prefers_ndjson(args, accept):
+    """Whether the query ``args`` or the ``Accept`` header value ``accept`` of
+    a list request ask for a streamed NDJSON response."""
+    if args.get('format') == 'ndjson':
+        return True
+    best = parse_accept_header(accept, MIMEAccept).best_match(['application/json', 'application/x-ndjson'])
+    return best == 'application/x-ndjson'
+
+
+def wants_ndjson():
+    """Whether the client asked for a streamed NDJSON response."""
+    return prefers_ndjson(request.args, request.headers.get('Accept'))
+
+
+def next_url(after, limit):
+    args = request.args.to_dict()
+    args.update(after=after, limit=limit)
+    return url_for(request.endpoint, **request.view_args, **args)
+
+
+def ndjson_response(query, model, fields=None):
+    """Stream ``query`` as NDJSON from a server-side cursor.
+
+    Rows are fetched ``STREAM_CHUNK_SIZE`` at a time as plain tuples, so
+    memory use does not depend on the size of the result.
+    """
+    chunk_size = current_app.config['STREAM_CHUNK_SIZE']
+    encode = row_encoder(model, fields)
+
+    def generate():
+        statement = project(query, model, fields).statement
+        result = db.session.execute(statement, execution_options={'stream_results': True})
+        for rows in result.partitions(chunk_size):
+            chunk = b''.join(dumps(encode(row)) + b'\n' for row in rows)
+            record_rows(len(rows), len(chunk))
+            yield chunk
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
+def paginated_response(query, model):
+    """Return one keyset page of ``query``, narrowed, sorted and projected as
+    the request parameters ask (see :func:`parse_list_args`).
+
+    Only the selected columns are fetched and encoded straight from the
+    rows. The next page, if any, is announced in a ``Link: <...>; rel="next"``
+    header so the body keeps being a plain JSON list.
+    """
+    try:
+        listing = list_args(model)
+    except ValueError as error:
+        return {'message': str(error)}, 400
+
+    criteria, order_by = keyset(model, listing)
+    query = query.filter(*criteria).order_by(*order_by)
+
+    if wants_ndjson():
+        if 'limit' in request.args:
+            query = query.limit(listing.limit)
+        return ndjson_response(query, model, listing.fields), 200
+
+    limit = listing.limit
+    rows = project(query, model, listing.fields).limit(limit + 1).all()
+    page = rows[:limit]
+
+    encode = row_encoder(model, listing.fields)
+    response = Response(dumps([encode(row) for row in page]), mimetype='application/json')
+    record_rows(len(page))
+    if len(rows) > limit:
+        response.headers['Link'] = f'<{next_url(next_after(model, listing, page[-1]), limit)}>; rel="next"'
+    return response, 200
@@ -0,0 +1,178 @@
+"""Monthly range partitions of the operations table.
+
+``operations`` is partitioned by ``performed_at``: one ``operations_YYYY_MM``
+partition per month, plus ``operations_default`` catching rows outside of
+them. Partitions are created ahead of time with :func:`create_partitions`,
+by api.boot before the server starts and by every jobs worker each
+``PARTITION_CHECK_INTERVAL`` seconds, and retired whole with
+:func:`detach_partitions`, which is a catalog change instead of a DELETE of
+every row.
+"""
+import re
+from datetime import date, datetime, timezone
+
+from sqlalchemy import text
+
+from api.models.equipment import Operation
+from config import db
+
+TABLE = Operation.__tablename__
+DEFAULT_PARTITION = f'{TABLE}_default'
+PARTITION_NAME = re.compile(rf'^{TABLE}_(\d{{4}})_(\d{{2}})$')
+
+# Rows of a detached partition leave without firing the operations triggers:
+# drop their groups from the rollup and recompute them from what is left, and
+# note the write for the operations version to be bumped on commit.
+ROLLUP_REBUILD = '''
+WITH affected AS (
+    SELECT DISTINCT equipment_id, COALESCE(type, '') AS type FROM {partition}
+)
+DELETE FROM operation_costs c
+USING affected a
+WHERE c.equipment_id = a.equipment_id AND c.type = a.type;
+
+WITH affected AS (
+    SELECT DISTINCT equipment_id, COALESCE(type, '') AS type FROM {partition}
+)
+INSERT INTO operation_costs (equipment_id, type, count, total, min_cost, max_cost)
+SELECT o.equipment_id, COALESCE(o.type, ''), count(o.cost), COALESCE(sum(o.cost), 0), min(o.cost), max(o.cost)
+FROM operations o
+JOIN affected a ON o.equipment_id = a.equipment_id AND COALESCE(o.type, '') = a.type
+GROUP BY 1, 2;
+
+SELECT note_table_write('operations');
+'''
+
+
+def is_partition_name(name):
+    return name == DEFAULT_PARTITION or PARTITION_NAME.match(name) is not None
+
+
+def month_start(value):
+    return date(value.year, value.month, 1)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f'{TABLE}_{month:%Y_%m}'
+
+
+def bound(month):
+    """``month`` as a timestamptz literal, at midnight UTC."""
+    return f"'{month.isoformat()} 00:00:00+00'"
+
+
+def partitions(connection=None):
+    """Months of the monthly partitions attached to ``operations``, sorted,
+    read on ``connection`` or the session."""
+    names = (connection or db.session).execute(text(
+        'SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid '
+        'WHERE i.inhparent = CAST(:table AS regclass)'
+    ), {'table': TABLE}).scalars()
+    months = []
+    for name in names:
+        match = PARTITION_NAME.match(name)
+        if match:
+            months.append(date(int(match.group(1)), int(match.group(2)), 1))
+    return sorted(months)
+
+
+def create_partition(month):
+    """Attach the partition of ``month``.
+
+    Rows of that month already in the default partition are moved into the new
+    table first, as PostgreSQL refuses to attach a range the default holds.
+    Moving rows between partitions leaves the rollup and versions unchanged.
+    """
+    name, end = partition_name(month), add_months(month, 1)
+    db.session.execute(text(f'CREATE TABLE {name} (LIKE {TABLE} INCLUDING DEFAULTS)'))
+    db.session.execute(text(
+        f'WITH moved AS ('
+        f'DELETE FROM {DEFAULT_PARTITION} WHERE performed_at >= {bound(month)} AND performed_at < {bound(end)} '
+        f'RETURNING *) INSERT INTO {name} SELECT * FROM moved'
+    ))
+    db.session.execute(text(
+        f'ALTER TABLE {TABLE} ATTACH PARTITION {name} FOR VALUES FROM ({bound(month)}) TO ({bound(end)})'
+    ))
+
+
+def missing_partitions(months_ahead=3, today=None, connection=None):
+    """Months from the current one to ``months_ahead`` months later without
+    a partition."""
+    current = month_start(today or datetime.now(timezone.utc))
+    existing = set(partitions(connection))
+    return [month for month in (add_months(current, offset) for offset in range(months_ahead + 1)) if month not in existing]
+
+
+def create_partitions(months_ahead=3, today=None):
+    """Create the missing partitions from the current month to ``months_ahead``
+    months later. Returns the names of the partitions created.
+
+    Creators are serialized by an advisory lock, so booting servers, jobs
+    workers and cron can all run it at once.
+    """
+    if not missing_partitions(months_ahead, today):
+        db.session.commit()
+        return []
+
+    db.session.execute(text('SELECT pg_advisory_xact_lock(hashtext(:table))'), {'table': TABLE})
+    created = []
+    for month in missing_partitions(months_ahead, today):
+        create_partition(month)
+        created.append(partition_name(month))
+    db.session.commit()
+    return created
+
+
+def archive_name(name):
+    """Free name for the detached partition ``name``: ``<name>_detached``, or
+    ``<name>_detached_N`` when earlier detaches of that month took it."""
+    candidate, number = f'{name}_detached', 1
+    while db.session.execute(text('SELECT to_regclass(:name)'), {'name': candidate}).scalar() is not None:
+        number += 1
+        candidate = f'{name}_detached_{number}'
+    return candidate
+
+
+def drop_foreign_keys(name):
+    """Drop the foreign keys a detached partition kept from ``operations``,
+    so it no longer takes part in the cascades of ``equipments``."""
+    constraints = db.session.execute(text(
+        "SELECT conname FROM pg_constraint WHERE conrelid = CAST(:table AS regclass) AND contype = 'f'"
+    ), {'table': name}).scalars().all()
+    for constraint in constraints:
+        db.session.execute(text(f'ALTER TABLE {name} DROP CONSTRAINT "{constraint}"'))
+
+
+def detach_partitions(before, drop=False):
+    """Detach the partitions holding only operations older than ``before``.
+
+    Detached partitions are kept, without foreign keys, as plain tables named
+    by :func:`archive_name` to be archived (``pg_dump -t``) unless ``drop`` is
+    set. The rollup groups they contributed to are recomputed from the
+    remaining operations, in the same transaction. Returns the names of the
+    tables kept, or of the partitions dropped.
+    """
+    detached = []
+    for month in partitions():
+        if add_months(month, 1) > month_start(before):
+            continue
+        name = partition_name(month)
+        db.session.execute(text(f'ALTER TABLE {TABLE} DETACH PARTITION {name}'))
+        for statement in ROLLUP_REBUILD.format(partition=name).split(';'):
+            if statement.strip():
+                db.session.execute(text(statement))
+        if drop:
+            db.session.execute(text(f'DROP TABLE {name}'))
+        else:
+            drop_foreign_keys(name)
+            archive = archive_name(name)
+            db.session.execute(text(f'ALTER TABLE {name} RENAME TO {archive}'))
+            name = archive
+        detached.append(name)
+    db.session.commit()
+    return detached
@@ -0,0 +1,126 @@
+"""Development and test helpers catching query regressions.
+
+With ``QUERY_DEBUG`` on, every request counts its SQL statements by shape and
+logs the shapes repeated ``REPEATED_QUERY_THRESHOLD`` times or more (the
+signature of an N+1 loop), and any statement slower than ``SLOW_QUERY_MS``
+with its EXPLAIN plan. :func:`assert_max_queries` bounds the statements a
+block of code runs, for the test suite.
+"""
+import collections
+import contextlib
+import logging
+import re
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from api.metrics import statement_observers
+
+logger = logging.getLogger(__name__)
+
+# ``IN (%(id_1)s, %(id_2)s, ...)`` lists of any length have the same shape.
+PLACEHOLDER_LIST = re.compile(r'\((?:\s*%\(\w+\)s\s*,)*\s*%\(\w+\)s\s*\)')
+EXPLAINABLE = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE')
+
+
+def statement_shape(statement):
+    """``statement`` with whitespace and placeholder lists normalized."""
+    return PLACEHOLDER_LIST.sub('(?)', ' '.join(statement.split()))
+
+
+def explain(cursor, statement, parameters):
+    """EXPLAIN plan of ``statement`` run on the connection of ``cursor``, or
+    ``None`` when it can't be explained.
+
+    The plan is fetched inside a savepoint, so a failing EXPLAIN leaves the
+    transaction of the request usable.
+    """
+    if not statement.lstrip().upper().startswith(EXPLAINABLE):
+        return None
+
+    explain_cursor = cursor.connection.cursor()
+    try:
+        explain_cursor.execute('SAVEPOINT query_debug')
+        try:
+            explain_cursor.execute(f'EXPLAIN {statement}', parameters)
+            plan = '\n'.join(row[0] for row in explain_cursor.fetchall())
+        except Exception:
+            explain_cursor.execute('ROLLBACK TO SAVEPOINT query_debug')
+            plan = None
+        explain_cursor.execute('RELEASE SAVEPOINT query_debug')
+        return plan
+    finally:
+        explain_cursor.close()
+
+
+def debug_statement(cursor, statement, parameters, executemany, elapsed):
+    """Count the shape of ``statement`` and log it when slow, with the timing
+    taken by api.metrics."""
+    if not has_request_context() or 'query_shapes' not in g:
+        return
+
+    elapsed_ms = elapsed * 1000
+
+    g.query_shapes[statement_shape(statement)] += 1
+    if elapsed_ms >= current_app.config['SLOW_QUERY_MS']:
+        logger.warning('Slow query: %.1f ms', elapsed_ms, extra={
+            'endpoint': request.endpoint,
+            'duration_ms': round(elapsed_ms, 3),
+            'statement': statement,
+            'plan': None if executemany else explain(cursor, statement, parameters)
+        })
+
+
+statement_observers.append(debug_statement)
+
+
+def configure_query_debug(app):
+    """Flag repeated and slow statements of every request while ``QUERY_DEBUG`` is on."""
+    @app.before_request
+    def start_query_debug():
+        if app.config['QUERY_DEBUG']:
+            g.query_shapes = collections.Counter()
+
+    @app.after_request
+    def report_repeated_queries(response):
+        threshold = app.config['REPEATED_QUERY_THRESHOLD']
+        for shape, count in g.get('query_shapes', {}).items():
+            if count >= threshold:
+                logger.warning('Statement ran %d times in one request, possible N+1', count, extra={
+                    'endpoint': request.endpoint,
+                    'count': count,
+                    'statement': shape
+                })
+        return response
+
+
+@contextlib.contextmanager
+def count_queries():
+    """Collect the SQL statements run on any engine inside the block."""
+    statements = []
+
+    def collect(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(Engine, 'before_cursor_execute', collect)
+    try:
+        yield statements
+    finally:
+        event.remove(Engine, 'before_cursor_execute', collect)
+
+
+@contextlib.contextmanager
+def assert_max_queries(limit):
+    """Fail when the block runs more than ``limit`` SQL statements.
+
+    Usage in tests::
+
+        with assert_max_queries(2):
+            client.get('/vessel/1')
+    """
+    with count_queries() as statements:
+        yield statements
+    assert len(statements) <= limit, (
+        f'{len(statements)} queries executed, expected at most {limit}:\n' + '\n'.join(statements)
+    )
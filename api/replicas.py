@@ -0,0 +1,185 @@
+"""Routing of read-only requests to PostgreSQL replicas.
+
+``REPLICA_DATABASE_URIS`` lists the replicas. The queries of views decorated
+with :func:`read_replica` run on one of them, picked round-robin among the
+ones passing a health check. Every other request, any request once its
+session wrote, and every request when no replica is healthy, use the
+primary ``SQLALCHEMY_DATABASE_URI``. Health checks run in a background
+thread, never on a request.
+
+Replicas lag behind the primary. After a write, the client gets a
+``read_primary`` cookie and reads from the primary for
+``REPLICA_STICKY_SECONDS``. A single request can ask for the same with
+``X-Read-Primary: true``.
+"""
+import functools
+import itertools
+import logging
+import os
+import threading
+
+from flask import current_app, g, has_request_context, request
+from flask_sqlalchemy import SignallingSession, SQLAlchemy
+from sqlalchemy import create_engine, event, orm, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.sql.dml import UpdateBase
+
+logger = logging.getLogger(__name__)
+
+STICKY_COOKIE = 'read_primary'
+STICKY_HEADER = 'X-Read-Primary'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_lock = threading.Lock()
+
+
+class RoutingSession(SignallingSession):
+    """Session running the statements of a :func:`read_replica` view on the
+    replica picked for the request, until it writes."""
+
+    def __init__(self, db, **options):
+        super().__init__(db, **options)
+        self.wrote = False
+
+    def reads_replica(self):
+        """True while the statements of the session run on a replica."""
+        return not self.wrote and has_request_context() and g.get('replica_engine') is not None
+
+    def get_bind(self, mapper=None, clause=None):
+        if self._flushing or isinstance(clause, UpdateBase):
+            self.wrote = True
+        if self.reads_replica():
+            return g.replica_engine
+        return super().get_bind(mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+class Replica:
+    def __init__(self, engine):
+        self.engine = engine
+        self.healthy = False
+
+    @property
+    def name(self):
+        return self.engine.url.render_as_string(hide_password=True)
+
+
+class ReplicaSet:
+    """Engines of the replicas of an app, handed out round-robin.
+
+    A thread of each process checks every replica with ``SELECT 1`` each
+    ``check_interval`` seconds, so a replica that hangs delays the checks,
+    never a request. Replicas are handed out once they passed a check. One
+    failing a check, or dropping a connection, is skipped until it passes
+    the next one.
+    """
+
+    def __init__(self, uris, engine_options, check_interval):
+        self.replicas = [Replica(create_engine(uri, **engine_options)) for uri in uris]
+        self.check_interval = check_interval
+        self._cycle = itertools.cycle(self.replicas)
+        self._stopped = threading.Event()
+        self._checker = None
+        self._pid = None
+        for replica in self.replicas:
+            event.listen(replica.engine, 'handle_error', functools.partial(self._on_error, replica))
+
+    def _on_error(self, replica, context):
+        if context.is_disconnect:
+            self.mark(replica, False)
+
+    def mark(self, replica, healthy):
+        if healthy != replica.healthy:
+            logger.warning('Replica %s is %s', replica.name, 'up' if healthy else 'down')
+        replica.healthy = healthy
+
+    def check(self, replica):
+        try:
+            with replica.engine.connect() as connection:
+                connection.execute(text('SELECT 1'))
+        except DBAPIError:
+            self.mark(replica, False)
+        else:
+            self.mark(replica, True)
+
+    def check_all(self):
+        for replica in self.replicas:
+            self.check(replica)
+
+    def _run_checks(self):
+        while True:
+            self.check_all()
+            if self._stopped.wait(self.check_interval):
+                return
+
+    def start(self):
+        """Start the checker thread, again in a process forked since."""
+        with _lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._checker = threading.Thread(target=self._run_checks, name='replica-checks', daemon=True)
+            self._checker.start()
+
+    def close(self):
+        """Stop the checker thread and close the connections to the replicas."""
+        self._stopped.set()
+        if self._checker is not None and self._pid == os.getpid():
+            self._checker.join()
+        for replica in self.replicas:
+            replica.engine.dispose()
+
+    def pick(self):
+        """Engine of the next healthy replica, ``None`` when none is."""
+        self.start()
+        for _ in self.replicas:
+            with _lock:
+                replica = next(self._cycle)
+            if replica.healthy:
+                return replica.engine
+        return None
+
+
+def replicas():
+    """The :class:`ReplicaSet` of the current app, built on first use."""
+    app = current_app._get_current_object()
+    with _lock:
+        replica_set = app.extensions.get('replicas')
+        if replica_set is None:
+            replica_set = ReplicaSet(
+                app.config['REPLICA_DATABASE_URIS'],
+                app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}),
+                app.config['REPLICA_CHECK_INTERVAL']
+            )
+            app.extensions['replicas'] = replica_set
+    return replica_set
+
+
+def wants_primary():
+    return request.cookies.get(STICKY_COOKIE) == '1' or request.headers.get(STICKY_HEADER) == 'true'
+
+
+def read_replica(view):
+    """Run the queries of the read-only ``view`` on a replica, unless the
+    client asked to read its own writes."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if current_app.config['REPLICA_DATABASE_URIS'] and not wants_primary():
+            g.replica_engine = replicas().pick()
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def configure_replicas(app):
+    """Send clients that wrote to the primary for ``REPLICA_STICKY_SECONDS``."""
+    @app.after_request
+    def stick_to_primary(response):
+        sticky = app.config['REPLICA_STICKY_SECONDS']
+        if (app.config['REPLICA_DATABASE_URIS'] and sticky and request.method not in SAFE_METHODS
+                and response.status_code < 400):
+            response.set_cookie(STICKY_COOKIE, '1', max_age=sticky, httponly=True, samesite='Lax')
+        return response
@@ -1,33 +1,91 @@
 import logging
 
-from flask import Blueprint, jsonify, request
-from sqlalchemy import exc
-
+from flask import Blueprint, Response, abort, current_app, request, stream_with_context
+from sqlalchemy import delete, exc, or_, tuple_, update
+
+from api.bulk import delete_by_ids, read_batch, read_ids, upsert_by_code, validate_fields
+from api.costs import cost_breakdown, parse_period, total_cost
+from api.export import EXTENSIONS, FORMATS, export_operations, parse_columns, parse_format
+from api.filters import filter_criteria
+from api.http_cache import if_match_versions, row_response
+from api.ingest import IngestError, ingest_operations, read_operation_rows
+from api.idempotency import idempotent
+from api.jobs import JobError, accepted, enqueue, handler
+from api.lookups import equipment_id_by_code, get_equipment, vessel_id_by_code
+from api.metrics import record_rows
 from api.models.equipment import Equipment, Operation
 from api.models.vessel import Vessel
+from api.pagination import paginated_response
+from api.replicas import read_replica
+from api.utils import chunked, parse_timestamp
 from config import db
 
+logger = logging.getLogger(__name__)
+
 equipments_blueprint = Blueprint('equipments', __name__)
 
 @equipments_blueprint.route('', methods=['GET'])
+@read_replica
 def list_equipments():
     """List all existing equipments.
         ---
+        parameters:
+            - name: limit
+              in: query
+              type: integer
+              required: false
+            - name: after
+              in: query
+              type: string
+              description: Id, or cursor when sorted by another column
+              required: false
+            - name: format
+              in: query
+              type: string
+              enum: [json, ndjson]
+              required: false
+            - name: vessel_code
+              in: query
+              type: string
+              required: false
+            - name: location
+              in: query
+              type: string
+              required: false
+            - name: name
+              in: query
+              type: string
+              required: false
+            - name: active
+              in: query
+              type: boolean
+              required: false
+            - name: sort
+              in: query
+              type: string
+              enum: [id, -id, code, -code, name, -name, location, -location]
+              required: false
+            - name: fields
+              in: query
+              type: string
+              description: Comma separated columns to return
+              required: false
         responses:
           200:
-            description: OK
+            description: OK. The next page is announced in the Link header
+          400:
+            description: Invalid pagination, filter or sort parameters
     """
-    logging.basicConfig(format='%(levelname)s - %(asctime)s (%(filename)s:%(funcName)s): %(message)s', level=logging.INFO)
-    logger = logging.getLogger(__name__)
-    logger.info('list of equipments endpoint')
+    logger.debug('list of equipments endpoint')
 
-    equipment = Equipment.query.all()
-    return jsonify([obj.to_dict() for obj in equipment]), 200
+    return paginated_response(Equipment.query, Equipment)
 
 
 @equipments_blueprint.route('/<int:equipment_id>', methods=['GET'])
+@read_replica
 def view_equipment(equipment_id):
     """Retrieve information about one equipment, specified in the URL.
+        The ETag is the version of the equipment, to send back in If-Match.
         ---
         parameters:
             - name: equipment_id
@@ -38,18 +96,21 @@ def view_equipment(equipment_id):
         responses:
           200:
             description: OK
+          304:
+            description: Not modified since the ETag in If-None-Match
           404:
             description: Not found
     """
-    logging.basicConfig(format='%(levelname)s - %(asctime)s (%(filename)s:%(funcName)s): %(message)s', level=logging.INFO)
-    logger = logging.getLogger(__name__)
-    logger.info('View vessel endpoint')
+    logger.debug('View vessel endpoint')
     
-    equipment = Equipment.query.get_or_404(equipment_id)
-    return equipment.to_dict(), 200
+    equipment = get_equipment(equipment_id)
+    if equipment is None:
+        abort(404)
+    return row_response(equipment)
 
 
 @equipments_blueprint.route('', methods=['POST'])
+@idempotent
 def insert_equipment():
     """Create a new equipment.
         ---
@@ -70,6 +131,11 @@ def insert_equipment():
               in: body
               type: string
               required: true
+            - name: Idempotency-Key
+              in: header
+              type: string
+              description: Retries with the same key get the first response back
+              required: false
         responses:
           201:
             description: returns OK if the equipment was correctly inserted
@@ -77,23 +143,23 @@ def insert_equipment():
             description: There was a parsing or validation error in the request.
           409:
             description: An equipment with that code already exists 
+          422:
+            description: The Idempotency-Key was used with a different request
           500:
             description: Error
     """
-    logging.basicConfig(format='%(levelname)s - %(asctime)s (%(filename)s:%(funcName)s): %(message)s', level=logging.INFO)
-    logger = logging.getLogger(__name__)
-    logger.info('Insert equipment endpoint')
+    logger.debug('Insert equipment endpoint')
 
     try:
         data = request.get_json()
-        vessel = Vessel.query.filter_by(code=data['vessel_code']).first()
+        vessel_id = vessel_id_by_code(data['vessel_code'])
         
-        if not vessel:
-            logger.info(f"Vessel code {data['vessel_code']} not found")
+        if not vessel_id:
+            logger.info('Vessel code %s not found', data['vessel_code'])
             return {'message': 'ERROR'}, 400
 
         equipment = Equipment(
-            vessel_id = vessel.id,
+            vessel_id = vessel_id,
             name = data['name'],
             code = data['code'],
             location = data['location'],
@@ -104,12 +170,10 @@ def insert_equipment():
     except KeyError:
         return {'message': 'ERROR'}, 400
     except exc.IntegrityError:
-        message = f"Code {data['code']} already exists"
-        logger.info(message)
+        logger.info('Code %s already exists', data['code'])
         return {'message': 'FAIL'}, 409
     except:
-        message = 'An unhandled exception occurred.'
-        logger.info(message)
+        logger.exception('An unhandled exception occurred.')
         return {'message': 'ERROR'}, 500
 
     logger.info('Equipment created successfully')
@@ -117,105 +181,502 @@ def insert_equipment():
     return {'message':'OK'}, 201
 
 
+@equipments_blueprint.route('/batch', methods=['POST'])
+def insert_equipment_batch():
+    """Create many equipments at once.
+        Every vessel_code of the batch is resolved with a single query.
+        Existing codes are skipped, or overwritten with on_conflict=update
+        when their values differ from the batch.
+        ---
+        parameters:
+            - name: equipments
+              in: body
+              type: list
+              required: true
+            - name: on_conflict
+              in: body
+              type: string
+              enum: [skip, update]
+              required: false
+        responses:
+          201:
+            description: returns OK and the inserted, updated and skipped codes
+          400:
+            description: There was a parsing or validation error in the request.
+          413:
+            description: The batch has more equipments than BULK_MAX_ITEMS
+    """
+    logger.debug('Insert equipment batch endpoint')
+
+    try:
+        rows, on_conflict = read_batch(request.get_json(silent=True), 'equipments')
+    except ValueError as error:
+        return {'message': str(error)}, 400
+    except OverflowError as error:
+        return {'message': str(error)}, 413
+
+    fields = ('vessel_code', 'code', 'name', 'location')
+    vessel_codes = {row['vessel_code'] for row in rows if validate_fields(Equipment, row, fields) is None}
+    vessel_ids = {}
+    for chunk in chunked(vessel_codes, current_app.config['BULK_CHUNK_SIZE']):
+        vessel_ids.update(db.session.query(Vessel.code, Vessel.id).filter(Vessel.code.in_(chunk)))
+
+    equipments, errors = [], []
+    for row_number, row in enumerate(rows, start=1):
+        error = validate_fields(Equipment, row, fields)
+        if error is None and row['vessel_code'] not in vessel_ids:
+            error = f"Vessel code {row['vessel_code']} not found"
+        if error:
+            errors.append({'row': row_number, 'message': error})
+            continue
+        equipments.append({
+            'vessel_id': vessel_ids[row['vessel_code']],
+            'code': row['code'],
+            'name': row['name'],
+            'location': row['location']
+        })
+
+    if errors:
+        return {'message': 'ERROR', 'errors': errors}, 400
+
+    inserted, updated, skipped = upsert_by_code(Equipment, equipments, on_conflict)
+    db.session.commit()
+
+    logger.info('%d equipments created, %d updated, %d skipped', len(inserted), len(updated), len(skipped))
+
+    return {'message': 'OK', 'inserted': inserted, 'updated': updated, 'skipped': skipped}, 201
+
+
+def deactivate_equipments(codes, progress=None, versions=None):
+    """Set the equipments with ``codes`` inactive, in a single transaction.
+
+    ``versions`` maps some of the codes to the version their equipment must
+    still have. Nothing is updated when a code does not exist or a version
+    changed. ``progress(done, total)`` is called after each chunk. Returns
+    the ``(id, code)`` pairs updated, the sorted missing codes and the
+    sorted codes whose version changed.
+    """
+    versions = versions or {}
+    chunks = list(chunked(codes, current_app.config['BULK_CHUNK_SIZE']))
+    updated = set()
+    for done, chunk in enumerate(chunks, start=1):
+        expected = [(code, versions[code]) for code in chunk if code in versions]
+        criteria = [Equipment.code.in_([code for code in chunk if code not in versions])]
+        if expected:
+            criteria.append(tuple_(Equipment.code, Equipment.version).in_(expected))
+        statement = (
+            update(Equipment)
+            .where(or_(*criteria))
+            .values(active=False)
+            .returning(Equipment.id, Equipment.code)
+        )
+        updated.update(db.session.execute(statement))
+        if progress:
+            progress(done, len(chunks))
+
+    left = codes - {code for _, code in updated}
+    conflicts = set()
+    for chunk in chunked(left, current_app.config['BULK_CHUNK_SIZE']):
+        conflicts.update(code for code, in db.session.query(Equipment.code).filter(Equipment.code.in_(chunk)))
+    if left:
+        db.session.rollback()
+        return set(), sorted(left - conflicts), sorted(conflicts)
+
+    db.session.commit()
+    return updated, [], []
+
+
+def read_codes(equipments):
+    """Return the ``(codes, versions)`` of a list of equipment codes, or of
+    ``{"code": ..., "version": ...}`` objects, ``None`` when it is invalid."""
+    if not isinstance(equipments, list):
+        return None
+
+    codes, versions = set(), {}
+    for item in equipments:
+        if isinstance(item, dict):
+            code, version = item.get('code'), item.get('version')
+            if not isinstance(version, int) or isinstance(version, bool):
+                return None
+            versions[code] = version
+        else:
+            code = item
+        if not isinstance(code, str):
+            return None
+        codes.add(code)
+    return codes, versions
+
+
+@handler('deactivate_equipments')
+def deactivate_equipments_job(payload, progress):
+    updated, missing, conflicts = deactivate_equipments(set(payload['codes']), progress, payload.get('versions'))
+    if missing:
+        raise JobError(f'{len(missing)} equipments not found.', {'missing': missing})
+    if conflicts:
+        raise JobError(f'{len(conflicts)} equipments changed since the versions given.', {'conflicts': conflicts})
+    return {'updated': len(updated), 'missing': []}
+
+
 @equipments_blueprint.route('/inactive', methods=['PUT'])
 def update_equipment_status():
     """Update a list of equipments to status inactive.
+        The whole list is applied in a single transaction: if any code does
+        not exist nothing is updated and every missing code is reported.
+        Items given as {"code": ..., "version": ...} are only updated while
+        the equipment is at that version, otherwise nothing is updated and
+        the changed codes are reported with a 412.
+        With async=true the list is deactivated by a background job.
         ---
         parameters:
+            - name: async
+              in: query
+              type: boolean
+              required: false
             - name: equipments
               in: body
               type: list
+              description: Equipment codes, or objects with a code and the expected version
               required: true
         responses:
           201:
-            description: returns OK if the equipments were correctly updated
+            description: returns OK and the number of updated equipments
+          202:
+            description: The job was queued, follow it at the Location header
           400:
-            description: Error
+            description: Invalid body or some equipment codes were not found
+          412:
+            description: Some equipments changed since the versions given
+          413:
+            description: The list has more codes than BULK_MAX_ITEMS
     """
-    logging.basicConfig(format='%(levelname)s - %(asctime)s (%(filename)s:%(funcName)s): %(message)s', level=logging.INFO)
-    logger = logging.getLogger(__name__)
-    logger.info('Runing')
+    logger.debug('Runing')
 
-    data = request.get_json()
-    equipments = data['equipments']
-    # equipments = Equipment.query.filter(Equipment.id.in_(equipment_list)).all()
+    data = request.get_json(silent=True) or {}
+    equipments = read_codes(data.get('equipments'))
+
+    if equipments is None:
+        return {'message': 'Invalid body'}, 400
+
+    codes, versions = equipments
+    max_items = current_app.config['BULK_MAX_ITEMS']
+    if len(data['equipments']) > max_items:
+        return {'message': f'At most {max_items} equipments per request'}, 413
+
+    if request.args.get('async') == 'true':
+        payload = {'codes': sorted(codes)}
+        if versions:
+            payload['versions'] = versions
+        return accepted(enqueue('deactivate_equipments', payload))
+
+    logger.info('Deactivating %d equipments', len(codes))
+
+    updated, missing, conflicts = deactivate_equipments(codes, versions=versions)
+    if missing:
+        message_error = f'{len(missing)} equipments not found.'
+        logger.info(message_error)
+        return {'message': message_error, 'missing': missing}, 400
+    if conflicts:
+        message_error = f'{len(conflicts)} equipments changed since the versions given.'
+        logger.info(message_error)
+        return {'message': message_error, 'conflicts': conflicts}, 412
 
-    logger.info(f'List of equipments: {equipments}')
-    
-    for equipment_code in equipments:
-        equipment = Equipment.query.filter_by(code=equipment_code).first()
-        if equipment:
-            equipment.active = False
-            db.session.commit()
-        else:
-            message_error = f'Equipment {equipment_code} not found.'
-            logger.info(message_error)
-            return {'message': message_error}, 400
-    
     message = 'All equipments set to inactive'
     logger.info(message)
-    return {'message': 'OK'}, 201
+    return {'message': 'OK', 'updated': len(updated), 'missing': []}, 201
 
 
 @equipments_blueprint.route('/active', methods=['GET'])
+@read_replica
 def active_equipment():
     """List all active equipments.
         ---
+        parameters:
+            - name: limit
+              in: query
+              type: integer
+              required: false
+            - name: after
+              in: query
+              type: string
+              description: Id, or cursor when sorted by another column
+              required: false
+            - name: format
+              in: query
+              type: string
+              enum: [json, ndjson]
+              required: false
+            - name: vessel_code
+              in: query
+              type: string
+              required: false
+            - name: location
+              in: query
+              type: string
+              required: false
+            - name: name
+              in: query
+              type: string
+              required: false
+            - name: sort
+              in: query
+              type: string
+              enum: [id, -id, code, -code, name, -name, location, -location]
+              required: false
+            - name: fields
+              in: query
+              type: string
+              description: Comma separated columns to return
+              required: false
         responses:
           200:
-            description: OK
+            description: OK. The next page is announced in the Link header
+          400:
+            description: Invalid pagination, filter or sort parameters
     """
-    logging.basicConfig(format='%(levelname)s - %(asctime)s (%(filename)s:%(funcName)s): %(message)s', level=logging.INFO)
-    logger = logging.getLogger(__name__)
-    logger.info('list of active equipments endpoint')
+    logger.debug('list of active equipments endpoint')
 
-    equipments = Equipment.query.filter_by(active=True).all()
-    return jsonify([equipment.to_dict() for equipment in equipments]), 200
+    return paginated_response(Equipment.query.filter_by(active=True), Equipment)
 
 
 @equipments_blueprint.route('/<int:equipment_id>', methods=['DELETE'])
 def delete_equipment(equipment_id):
     """Delete an equipment.
+        Its operations are deleted with it. With If-Match, only while the
+        equipment is at one of the versions listed.
         ---
         parameters:
             - name: equipment_id
               in: body
               type: int
               required: true
+            - name: If-Match
+              in: header
+              type: string
+              description: Expected version of the equipment, such as "3"
+              required: false
 
         responses:
           200:
             description: OK
+          400:
+            description: If-Match does not list versions
           404:
             description: Not found
+          412:
+            description: The equipment changed since the version given
     """
-    logging.basicConfig(format='%(levelname)s - %(asctime)s (%(filename)s:%(funcName)s): %(message)s', level=logging.INFO)
-    logger = logging.getLogger(__name__)
-    logger.info('View equipment endpoint')
-    
-    equipment = Equipment.query.get_or_404(equipment_id)
-    db.session.delete(equipment)
+    logger.debug('View equipment endpoint')
+
+    try:
+        versions = if_match_versions()
+    except ValueError as error:
+        return {'message': str(error)}, 400
+
+    if versions is None:
+        deleted = delete_by_ids(Equipment, [equipment_id])
+    else:
+        statement = (
+            delete(Equipment)
+            .where(Equipment.id == equipment_id, Equipment.version.in_(versions))
+            .returning(Equipment.id, Equipment.code)
+        )
+        deleted = db.session.execute(statement).all()
+    if not deleted:
+        if versions is not None and db.session.query(Equipment.id).filter_by(id=equipment_id).scalar():
+            return {'message': 'The equipment changed since the version given'}, 412
+        abort(404)
     db.session.commit()
     return {'message': f'OK'}, 200
 
 
+@equipments_blueprint.route('', methods=['DELETE'])
+def delete_equipment_batch():
+    """Delete many equipments, with their operations.
+        The whole list is applied in a single transaction: if any id does
+        not exist nothing is deleted and every missing id is reported.
+        ---
+        parameters:
+            - name: ids
+              in: body
+              type: list
+              required: true
+        responses:
+          200:
+            description: returns OK and the number of deleted equipments
+          400:
+            description: Invalid body or some equipment ids were not found
+          413:
+            description: The list has more ids than BULK_MAX_ITEMS
+    """
+    logger.debug('Delete equipment batch endpoint')
+
+    try:
+        ids = read_ids(request.get_json(silent=True))
+    except ValueError as error:
+        return {'message': str(error)}, 400
+    except OverflowError as error:
+        return {'message': str(error)}, 413
+
+    deleted = delete_by_ids(Equipment, ids)
+    missing = set(ids) - {equipment_id for equipment_id, _ in deleted}
+    if missing:
+        db.session.rollback()
+        return {'message': f'{len(missing)} equipments not found.', 'missing': sorted(missing)}, 400
+
+    db.session.commit()
+
+    logger.info('%d equipments deleted', len(deleted))
+    return {'message': 'OK', 'deleted': len(deleted)}, 200
+
+
 @equipments_blueprint.route('/operation', methods=['GET'])
+@read_replica
 def list_operations():
     """List all existing operations.
         ---
+        parameters:
+            - name: limit
+              in: query
+              type: integer
+              required: false
+            - name: after
+              in: query
+              type: string
+              description: Id, or cursor when sorted by another column
+              required: false
+            - name: format
+              in: query
+              type: string
+              enum: [json, ndjson]
+              required: false
+            - name: vessel_code
+              in: query
+              type: string
+              required: false
+            - name: code
+              in: query
+              type: string
+              description: Equipment code
+              required: false
+            - name: type
+              in: query
+              type: string
+              required: false
+            - name: min_cost
+              in: query
+              type: number
+              required: false
+            - name: max_cost
+              in: query
+              type: number
+              required: false
+            - name: since
+              in: query
+              type: string
+              format: date-time
+              required: false
+            - name: until
+              in: query
+              type: string
+              format: date-time
+              required: false
+            - name: sort
+              in: query
+              type: string
+              enum: [id, -id, cost, -cost]
+              required: false
+            - name: fields
+              in: query
+              type: string
+              description: Comma separated columns to return
+              required: false
         responses:
           200:
-            description: OK
+            description: OK. The next page is announced in the Link header
+          400:
+            description: Invalid pagination, filter or sort parameters
     """
-    logging.basicConfig(format='%(levelname)s - %(asctime)s (%(filename)s:%(funcName)s): %(message)s', level=logging.INFO)
-    logger = logging.getLogger(__name__)
-    logger.info('list of operation endpoint')
+    logger.debug('list of operation endpoint')
 
-    operations = Operation.query.all()
-    return jsonify([obj.to_dict() for obj in operations]), 200
+    return paginated_response(Operation.query, Operation)
+
+
+@equipments_blueprint.route('/operation/export', methods=['GET'])
+@read_replica
+def export_operations_file():
+    """Export operations, with their equipment and vessel codes, as a file.
+        ---
+        parameters:
+            - name: format
+              in: query
+              type: string
+              enum: [csv, arrow, parquet]
+              required: false
+            - name: fields
+              in: query
+              type: string
+              description: Comma separated columns to export, among id, equipment_id, equipment_code, vessel_code, type, cost and performed_at
+              required: false
+            - name: vessel_code
+              in: query
+              type: string
+              required: false
+            - name: code
+              in: query
+              type: string
+              description: Equipment code
+              required: false
+            - name: type
+              in: query
+              type: string
+              required: false
+            - name: min_cost
+              in: query
+              type: number
+              required: false
+            - name: max_cost
+              in: query
+              type: number
+              required: false
+            - name: since
+              in: query
+              type: string
+              format: date-time
+              required: false
+            - name: until
+              in: query
+              type: string
+              format: date-time
+              required: false
+        responses:
+          200:
+            description: OK. The file is streamed, sorted by operation id
+          400:
+            description: Invalid format, fields or filter parameters
+          501:
+            description: Arrow and Parquet need pyarrow installed on the server
+    """
+    logger.debug('export operations endpoint')
+
+    try:
+        export_format = parse_format(request.args.get('format'))
+        names = parse_columns(request.args.get('fields'))
+        criteria = filter_criteria(Operation, request.args)
+    except LookupError as error:
+        return {'message': str(error)}, 501
+    except ValueError as error:
+        return {'message': str(error)}, 400
+
+    chunks = export_operations(names, criteria, export_format, on_rows=record_rows)
+    return Response(
+        stream_with_context(chunks),
+        mimetype=FORMATS[export_format],
+        headers={'Content-Disposition': f'attachment; filename=operations.{EXTENSIONS[export_format]}'}
+    )
 
 
 @equipments_blueprint.route('/operation', methods=['POST'])
+@idempotent
 def operation_equipment():
     """Add an operation order related to a equipment.
         ---
@@ -232,36 +693,49 @@ def operation_equipment():
               in: body
               type: float
               required: true
+            - name: performed_at
+              in: body
+              type: string
+              format: date-time
+              description: When the operation was performed, now by default
+              required: false
+            - name: Idempotency-Key
+              in: header
+              type: string
+              description: Retries with the same key get the first response back
+              required: false
         responses:
           201:
             description: returns OK if the operation was correctly created.
           400:
             description: There was a parsing or validation error in the request.
+          422:
+            description: The Idempotency-Key was used with a different request
           500:
             description: Error
     """
-    logging.basicConfig(format='%(levelname)s - %(asctime)s (%(filename)s:%(funcName)s): %(message)s', level=logging.INFO)
-    logger = logging.getLogger(__name__)
-    logger.info('Operation endpoint')
+    logger.debug('Operation endpoint')
 
     data = request.get_json()
 
     try:
-        equipment = Equipment.query.filter_by(code=data['code']).first()
-        logger.info(f"Equipment: {equipment}")
+        equipment_id = equipment_id_by_code(data['code'])
+        logger.debug('Equipment: %s', data['code'])
         
-        if not equipment:
+        if not equipment_id:
             logger.info('Equipment code is not valid')
             return {'message': 'ERROR'}, 400
 
         operation = Operation(
-            equipment_id = equipment.id,
+            equipment_id = equipment_id,
             type = data['type'],
             cost = data['cost']
         )
+        if data.get('performed_at') is not None:
+            operation.performed_at = parse_timestamp(data['performed_at'])
         db.session.add(operation)
         db.session.commit()
-    except KeyError:
+    except (KeyError, ValueError):
         return {'message': 'Invalid body'}, 400
     except:
         message = 'An unhandled exception occurred.'
@@ -272,11 +746,79 @@ def operation_equipment():
     return {'message':'OK'}, 201
 
 
+@equipments_blueprint.route('/operation/batch', methods=['POST'])
+def operation_batch():
+    """Add many operations at once.
+        The body is a JSON array, NDJSON (application/x-ndjson) or CSV
+        (text/csv) stream of operations with code, type and cost. Rows that
+        fail validation are skipped and reported with their row number; the
+        valid rows are inserted in a single transaction.
+        ---
+        consumes:
+            - application/json
+            - application/x-ndjson
+            - text/csv
+        parameters:
+            - name: operations
+              in: body
+              type: list
+              required: true
+        responses:
+          201:
+            description: returns OK, the number of inserted operations and the per-row errors
+          400:
+            description: The body could not be read or no row was valid
+          413:
+            description: The batch has more rows than INGEST_MAX_ROWS
+    """
+    logger.debug('Operation batch endpoint')
+
+    try:
+        inserted, failed, errors = ingest_operations(read_operation_rows())
+    except IngestError as error:
+        db.session.rollback()
+        return {'message': str(error)}, 400
+    except OverflowError as error:
+        db.session.rollback()
+        return {'message': str(error)}, 413
+
+    response = {'inserted': inserted, 'failed': failed, 'errors': errors}
+    if not inserted:
+        db.session.rollback()
+        return {'message': 'ERROR', **response}, 400
+
+    db.session.commit()
+    logger.info('%d operations added, %d rejected', inserted, failed)
+
+    return {'message': 'OK', **response}, 201
+
+
 @equipments_blueprint.route('/operation/costs', methods=['POST'])
 def costs_operations():
     """Returns the total cost in operation of an equipment.
+        With code or name the total cost is returned as a message. With a
+        list of codes or names, the count, total, average, min and max cost
+        of every matching equipment is returned, also broken down by
+        operation type. Costs come from the operation_costs rollup unless
+        fresh=true or a since/until period asks for a live aggregate.
         ---
         parameters:
+            - name: fresh
+              in: query
+              type: boolean
+              required: false
+            - name: since
+              in: query
+              type: string
+              format: date-time
+              description: Only count operations performed at or after this time
+              required: false
+            - name: until
+              in: query
+              type: string
+              format: date-time
+              description: Only count operations performed before this time
+              required: false
             - name: code
               in: body
               type: string
@@ -285,26 +827,55 @@ def costs_operations():
               in: body
               type: string
               required: false
+            - name: codes
+              in: body
+              type: list
+              required: false
+            - name: names
+              in: body
+              type: list
+              required: false
         responses:
           200:
             description: OK
           400:
             description: There was a parsing or validation error in the request.
+          413:
+            description: More codes or names than BULK_MAX_ITEMS
     """
-    logging.basicConfig(format='%(levelname)s - %(asctime)s (%(filename)s:%(funcName)s): %(message)s', level=logging.INFO)
-    logger = logging.getLogger(__name__)
-    logger.info('Total cost in operation endpoint')
+    logger.debug('Total cost in operation endpoint')
+
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return 'ERROR', 400
+
+    fresh = request.args.get('fresh') == 'true'
+    try:
+        since, until = parse_period(request.args)
+    except ValueError as error:
+        return {'message': str(error)}, 400
 
-    data = request.get_json()
-    
     if 'code' in data.keys():
-        operations = Operation.query.join(Equipment).filter(Equipment.code==data['code']).all()
-        costs = [operation.cost for operation in operations]
-        return {'message': f'Total cost: {sum(costs)}'}, 200
+        return {'message': f"Total cost: {total_cost(Equipment.code, data['code'], fresh, since, until)}"}, 200
     elif 'name' in data.keys():
-        operations = Operation.query.join(Equipment).filter(Equipment.name==data['name']).all()
-        costs = [operation.cost for operation in operations]
-        return {'message': f'Total cost: {sum(costs)}'}, 200
+        return {'message': f"Total cost: {total_cost(Equipment.name, data['name'], fresh, since, until)}"}, 200
+
+    for key, column in (('codes', Equipment.code), ('names', Equipment.name)):
+        if key not in data.keys():
+            continue
+
+        values = data[key]
+        if not isinstance(values, list) or not all(isinstance(value, str) for value in values):
+            return {'message': f'{key} must be a list of strings'}, 400
+
+        max_items = current_app.config['BULK_MAX_ITEMS']
+        if len(values) > max_items:
+            return {'message': f'At most {max_items} {key} per request'}, 413
+
+        breakdown = cost_breakdown(column, set(values), fresh, since, until)
+        found = {equipment[key[:-1]] for equipment in breakdown}
+        missing = sorted(set(values) - found)
+        return {'message': 'OK', 'equipments': breakdown, 'missing': missing}, 200
 
     logger.info('Code or Name not found in the request')
     return 'ERROR', 400
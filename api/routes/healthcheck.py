@@ -1,6 +1,11 @@
 import logging
 
-from flask import Blueprint
+from flask import Blueprint, Response
+
+from api.cache import cache
+from api.metrics import render_metrics
+
+logger = logging.getLogger(__name__)
 
 healthcheck_blueprint = Blueprint('healthcheck', __name__)
 
@@ -13,7 +18,27 @@ def healthcheck():
           200:
             description: OK if the system is alive
     """
-    logging.basicConfig(format='%(levelname)s - %(asctime)s (%(filename)s:%(funcName)s): %(message)s', level=logging.INFO)
-    logger = logging.getLogger(__name__)
-    logger.info('Test the health of the system')
+    logger.debug('Test the health of the system')
     return 'OK', 200
+
+
+@healthcheck_blueprint.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    """Hit and miss counters of the lookup cache.
+        ---
+        responses:
+          200:
+            description: backend, number of entries, hits and misses
+    """
+    return cache.stats(), 200
+
+
+@healthcheck_blueprint.route('/metrics', methods=['GET'])
+def metrics():
+    """Request, database and cache metrics in the Prometheus text format.
+        ---
+        responses:
+          200:
+            description: Latency, SQL statement, row and byte counters per endpoint
+    """
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4'), 200
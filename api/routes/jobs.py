@@ -0,0 +1,31 @@
+import logging
+
+from flask import Blueprint
+
+from api.models.job import Job
+
+logger = logging.getLogger(__name__)
+
+jobs_blueprint = Blueprint('jobs', __name__)
+
+@jobs_blueprint.route('/<int:job_id>', methods=['GET'])
+def view_job(job_id):
+    """Status of a background job.
+        The result is set once the status is succeeded, or failed with an
+        error message.
+        ---
+        parameters:
+            - name: job_id
+              in: path
+              type: int
+              required: true
+        responses:
+          200:
+            description: kind, status (queued, running, succeeded or failed), progress from 0 to 1, result and error
+          404:
+            description: Not found
+    """
+    logger.debug('View job endpoint')
+
+    job = Job.query.get_or_404(job_id)
+    return job.to_dict(), 200
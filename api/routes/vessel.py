@@ -1,33 +1,61 @@
 import logging
 
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, abort, jsonify, request
 from sqlalchemy import exc
-from sqlalchemy.sql import func
 
-from api.models.equipment import Equipment, Operation
+from api.bulk import delete_by_ids, read_batch, read_ids, upsert_by_code, validate_fields
+from api.costs import cost_stats, parse_group_by, parse_percentiles, parse_period, parse_top, top_equipments, vessel_average_costs
+from api.filters import filter_criteria
+from api.http_cache import conditional
+from api.idempotency import idempotent
+from api.jobs import accepted, enqueue, handler
+from api.lookups import get_vessel
+from api.models.equipment import Operation
 from api.models.vessel import Vessel
+from api.pagination import paginated_response
+from api.replicas import read_replica
 from config import db
 
+logger = logging.getLogger(__name__)
+
 vessels_blueprint = Blueprint('vessels', __name__)
 
 @vessels_blueprint.route('', methods=['GET'])
+@read_replica
+@conditional('vessels')
 def list_vessel():
     """List all existing vessels.
         ---
-
+        parameters:
+            - name: limit
+              in: query
+              type: integer
+              required: false
+            - name: after
+              in: query
+              type: integer
+              required: false
+            - name: format
+              in: query
+              type: string
+              enum: [json, ndjson]
+              required: false
         responses:
           200:
-            description: OK
+            description: OK. The next page is announced in the Link header
+          304:
+            description: Not modified since the ETag in If-None-Match
+          400:
+            description: Invalid pagination parameters
     """
-    logging.basicConfig(format='%(levelname)s - %(asctime)s (%(filename)s:%(funcName)s): %(message)s', level=logging.INFO)
-    logger = logging.getLogger(__name__)
-    logger.info('list vessels endpoint')
+    logger.debug('list vessels endpoint')
 
-    vessel = Vessel.query.all()
-    return jsonify([obj.to_dict() for obj in vessel]), 200
+    return paginated_response(Vessel.query, Vessel)
 
 
 @vessels_blueprint.route('/<int:vessel_id>', methods=['GET'])
+@read_replica
+@conditional('vessels')
 def view_vessel(vessel_id):
     """Retrieve information about one vessel, specified in the URL.
         ---
@@ -40,18 +68,21 @@ def view_vessel(vessel_id):
         responses:
           200:
             description: OK
+          304:
+            description: Not modified since the ETag in If-None-Match
           404:
             description: Not found
     """
-    logging.basicConfig(format='%(levelname)s - %(asctime)s (%(filename)s:%(funcName)s): %(message)s', level=logging.INFO)
-    logger = logging.getLogger(__name__)
-    logger.info('View vessel endpoint')
+    logger.debug('View vessel endpoint')
     
-    vessel = Vessel.query.get_or_404(vessel_id)
-    return vessel.to_dict(), 200
+    vessel = get_vessel(vessel_id)
+    if vessel is None:
+        abort(404)
+    return vessel, 200
 
 
 @vessels_blueprint.route('', methods=['POST'])
+@idempotent
 def insert_vessel():
     """Create a new vessel.
         ---
@@ -60,6 +91,11 @@ def insert_vessel():
               in: body
               type: string
               required: true
+            - name: Idempotency-Key
+              in: header
+              type: string
+              description: Retries with the same key get the first response back
+              required: false
         responses:
           201:
             description: OK
@@ -67,12 +103,12 @@ def insert_vessel():
             description: There was a parsing or validation error in the request.
           409:
             description: A vessel with that code already exists 
+          422:
+            description: The Idempotency-Key was used with a different request
           500:
             description: Error
     """
-    logging.basicConfig(format='%(levelname)s - %(asctime)s (%(filename)s:%(funcName)s): %(message)s', level=logging.INFO)
-    logger = logging.getLogger(__name__)
-    logger.info('Insert vessel endpoint')
+    logger.debug('Insert vessel endpoint')
 
     data = request.get_json()
     try:
@@ -84,12 +120,10 @@ def insert_vessel():
     except KeyError:
         return {'message': 'ERROR'}, 400
     except exc.IntegrityError:
-        message = f"Code {data['code']} already exists"
-        logger.info(message)
+        logger.info('Code %s already exists', data['code'])
         return {'message': 'FAIL'}, 409
     except:
-        message = 'An unhandled exception occurred.'
-        logger.info(message)
+        logger.exception('An unhandled exception occurred.')
         return {'message': 'ERROR'}, 500
 
     logger.info('Vessel created successfully')
@@ -97,9 +131,61 @@ def insert_vessel():
     return {'message': 'OK'}, 201
 
 
+@vessels_blueprint.route('/batch', methods=['POST'])
+def insert_vessel_batch():
+    """Create many vessels at once.
+        Existing codes are skipped: a vessel has nothing to update but its code.
+        ---
+        parameters:
+            - name: vessels
+              in: body
+              type: list
+              required: true
+            - name: on_conflict
+              in: body
+              type: string
+              enum: [skip, update]
+              required: false
+        responses:
+          201:
+            description: returns OK and the inserted, updated and skipped codes
+          400:
+            description: There was a parsing or validation error in the request.
+          413:
+            description: The batch has more vessels than BULK_MAX_ITEMS
+    """
+    logger.debug('Insert vessel batch endpoint')
+
+    try:
+        rows, on_conflict = read_batch(request.get_json(silent=True), 'vessels')
+    except ValueError as error:
+        return {'message': str(error)}, 400
+    except OverflowError as error:
+        return {'message': str(error)}, 413
+
+    vessels, errors = [], []
+    for row_number, row in enumerate(rows, start=1):
+        error = validate_fields(Vessel, row, ('code',))
+        if error:
+            errors.append({'row': row_number, 'message': error})
+        else:
+            vessels.append({'code': row['code']})
+
+    if errors:
+        return {'message': 'ERROR', 'errors': errors}, 400
+
+    inserted, updated, skipped = upsert_by_code(Vessel, vessels, on_conflict)
+    db.session.commit()
+
+    logger.info('%d vessels created, %d updated, %d skipped', len(inserted), len(updated), len(skipped))
+
+    return {'message': 'OK', 'inserted': inserted, 'updated': updated, 'skipped': skipped}, 201
+
+
 @vessels_blueprint.route('/<int:vessel_id>', methods=['DELETE'])
 def delete_vessel(vessel_id):
     """Delete a vessel.
+        Its equipments and their operations are deleted with it.
         ---
         parameters:
             - name: vessel_id
@@ -113,28 +199,231 @@ def delete_vessel(vessel_id):
           404:
             description: Not found
     """
-    logging.basicConfig(format='%(levelname)s - %(asctime)s (%(filename)s:%(funcName)s): %(message)s', level=logging.INFO)
-    logger = logging.getLogger(__name__)
-    logger.info('Delete  vessel endpoint')
-    
-    vessel = Vessel.query.get_or_404(vessel_id)
-    db.session.delete(vessel)
+    logger.debug('Delete  vessel endpoint')
+
+    # Equipments and their operations go through ON DELETE CASCADE.
+    if not delete_by_ids(Vessel, [vessel_id]):
+        abort(404)
     db.session.commit()
     return {'message': 'OK'}, 200
 
 
+@vessels_blueprint.route('', methods=['DELETE'])
+def delete_vessel_batch():
+    """Delete many vessels, with their equipments and operations.
+        The whole list is applied in a single transaction: if any id does
+        not exist nothing is deleted and every missing id is reported.
+        ---
+        parameters:
+            - name: ids
+              in: body
+              type: list
+              required: true
+        responses:
+          200:
+            description: returns OK and the number of deleted vessels
+          400:
+            description: Invalid body or some vessel ids were not found
+          413:
+            description: The list has more ids than BULK_MAX_ITEMS
+    """
+    logger.debug('Delete vessel batch endpoint')
+
+    try:
+        ids = read_ids(request.get_json(silent=True))
+    except ValueError as error:
+        return {'message': str(error)}, 400
+    except OverflowError as error:
+        return {'message': str(error)}, 413
+
+    deleted = delete_by_ids(Vessel, ids)
+    missing = set(ids) - {vessel_id for vessel_id, _ in deleted}
+    if missing:
+        db.session.rollback()
+        return {'message': f'{len(missing)} vessels not found.', 'missing': sorted(missing)}, 400
+
+    db.session.commit()
+
+    logger.info('%d vessels deleted', len(deleted))
+    return {'message': 'OK', 'deleted': len(deleted)}, 200
+
+
 @vessels_blueprint.route('/operation/costs', methods=['GET'])
+@read_replica
+@conditional('vessels', 'equipments', 'operations')
 def costs_operations_vessel():
     """Returns the average cost in operation in each vessel.
+        Averages come from the operation_costs rollup unless fresh=true or a
+        since/until period asks for a live aggregate over the operations.
         ---
+        parameters:
+            - name: fresh
+              in: query
+              type: boolean
+              required: false
+            - name: since
+              in: query
+              type: string
+              format: date-time
+              description: Only count operations performed at or after this time
+              required: false
+            - name: until
+              in: query
+              type: string
+              format: date-time
+              description: Only count operations performed before this time
+              required: false
         responses:
           200:
             description: OK
+          304:
+            description: Not modified since the ETag in If-None-Match
+          400:
+            description: Invalid since or until
+    """
+    logger.debug('Average cost in operation in vessels endpoint')
+
+    try:
+        since, until = parse_period(request.args)
+    except ValueError as error:
+        return {'message': str(error)}, 400
+
+    return jsonify(average_costs(request.args.get('fresh') == 'true', since, until)), 200
+
+
+@vessels_blueprint.route('/operation/costs', methods=['POST'])
+def costs_operations_vessel_job():
+    """Queue a background job computing the average cost in operation in each vessel.
+        The job result is the list GET /vessel/operation/costs returns for the
+        same parameters.
+        ---
+        parameters:
+            - name: fresh
+              in: query
+              type: boolean
+              required: false
+            - name: since
+              in: query
+              type: string
+              format: date-time
+              description: Only count operations performed at or after this time
+              required: false
+            - name: until
+              in: query
+              type: string
+              format: date-time
+              description: Only count operations performed before this time
+              required: false
+        responses:
+          202:
+            description: The job was queued, follow it at the Location header
+          400:
+            description: Invalid since or until
+    """
+    logger.debug('Average cost in operation in vessels job endpoint')
+
+    try:
+        since, until = parse_period(request.args)
+    except ValueError as error:
+        return {'message': str(error)}, 400
+
+    return accepted(enqueue('vessel_average_costs', {
+        'fresh': request.args.get('fresh') == 'true',
+        'since': since and since.isoformat(),
+        'until': until and until.isoformat()
+    }))
+
+
+def average_costs(fresh, since, until):
+    return [{code: average} for code, average in vessel_average_costs(fresh, since, until)]
+
+
+@handler('vessel_average_costs')
+def average_costs_job(payload, progress):
+    since, until = parse_period(payload)
+    return average_costs(payload['fresh'], since, until)
+
+
+@vessels_blueprint.route('/operation/stats', methods=['GET'])
+@read_replica
+@conditional('vessels', 'equipments', 'operations')
+def stats_operations_vessel():
+    """Returns cost statistics of the operations, grouped in one query.
+        Every group_by parameter is a grouping set: group_by=vessel_code,type&group_by=location
+        returns the groups per vessel and type and the groups per location.
+        Each group has count, total, average, min, max and the percentiles
+        of the cost. top adds the equipments with the highest total cost
+        of each vessel.
+        ---
+        parameters:
+            - name: group_by
+              in: query
+              type: array
+              items:
+                type: string
+              collectionFormat: multi
+              description: Comma separated dimensions among vessel_code, equipment_code, name, location and type. vessel_code by default
+              required: false
+            - name: percentiles
+              in: query
+              type: string
+              description: Comma separated fractions, 0.5,0.9,0.99 by default
+              required: false
+            - name: top
+              in: query
+              type: integer
+              description: Equipments with the highest total cost per vessel, 3 by default
+              required: false
+            - name: vessel_code
+              in: query
+              type: string
+              required: false
+            - name: code
+              in: query
+              type: string
+              description: Equipment code
+              required: false
+            - name: type
+              in: query
+              type: string
+              required: false
+            - name: min_cost
+              in: query
+              type: number
+              required: false
+            - name: max_cost
+              in: query
+              type: number
+              required: false
+            - name: since
+              in: query
+              type: string
+              format: date-time
+              required: false
+            - name: until
+              in: query
+              type: string
+              format: date-time
+              required: false
+        responses:
+          200:
+            description: OK. groups are keyed by group_by, top_equipments by vessel code
+          304:
+            description: Not modified since the ETag in If-None-Match
+          400:
+            description: Invalid group_by, percentiles, top or filter parameters
     """
-    logging.basicConfig(format='%(levelname)s - %(asctime)s (%(filename)s:%(funcName)s): %(message)s', level=logging.INFO)
-    logger = logging.getLogger(__name__)
-    logger.info('Average cost in operation in vessels endpoint')
+    logger.debug('Operation cost statistics endpoint')
 
-    vessels = Operation.query.join(Equipment).join(Vessel).with_entities(Vessel.code.label('Vessel'), func.avg(Operation.cost).label('Average Cost')).group_by(Vessel.code).all()
+    try:
+        group_sets = parse_group_by(request.args.getlist('group_by'))
+        fractions = parse_percentiles(request.args.get('percentiles'))
+        top = parse_top(request.args.get('top'))
+        criteria = filter_criteria(Operation, request.args)
+    except ValueError as error:
+        return {'message': str(error)}, 400
 
-    return jsonify([{vessel['Vessel']: vessel['Average Cost']} for vessel in vessels]), 200
+    stats = {'groups': cost_stats(group_sets, fractions, criteria)}
+    if top:
+        stats['top_equipments'] = top_equipments(top, criteria)
+    return stats, 200
@@ -0,0 +1,61 @@
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_encoders = {}
+
+
+def serialized_columns(model, fields=None):
+    """Columns that ``model.to_dict()`` would serialize, in order.
+
+    ``fields``, a set of column names, restricts them to a sparse fieldset.
+    """
+    table = model.__table__
+    names = model.serialize_only or tuple(column.name for column in table.columns)
+    if fields is not None:
+        names = tuple(name for name in names if name in fields)
+    return tuple(table.c[name] for name in names)
+
+
+def row_encoder(model, fields=None):
+    """Return a function turning a row of :func:`serialized_columns` into a dict.
+
+    The column names are looked up once per model and fieldset, so encoding
+    a row costs one ``dict(zip(...))`` instead of an introspective walk over
+    the model like ``SerializerMixin.to_dict()``.
+    """
+    key = (model, fields)
+    encoder = _encoders.get(key)
+    if encoder is None:
+        names = tuple(column.name for column in serialized_columns(model, fields))
+
+        def encoder(row):
+            return dict(zip(names, row))
+
+        _encoders[key] = encoder
+    return encoder
+
+
+def _default(value):
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
+
+
+def dumps(value):
+    """Encode ``value`` as compact JSON bytes, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(value, default=_default)
+    return json.dumps(value, separators=(',', ':'), default=_default).encode()
+
+
+def project(query, model, fields=None):
+    """Restrict an ORM query on ``model`` to its serialized columns.
+
+    The result is plain row tuples: no instances are built and nothing is
+    added to the session identity map.
+    """
+    return query.with_entities(*serialized_columns(model, fields))
@@ -0,0 +1,25 @@
+from datetime import datetime, timezone
+from itertools import islice
+
+
+def chunked(iterable, size):
+    """Yield successive lists of at most ``size`` items from ``iterable``."""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def parse_timestamp(value):
+    """Parse an ISO 8601 date or datetime, taken as UTC when it has no offset.
+
+    Raises ValueError when ``value`` is not a valid timestamp.
+    """
+    if not isinstance(value, str):
+        raise ValueError(f'Invalid timestamp {value!r}')
+    timestamp = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return timestamp
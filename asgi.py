@@ -0,0 +1,3 @@
+from api.aio.app import create_async_app
+
+app = create_async_app('config.ProductionConfig')
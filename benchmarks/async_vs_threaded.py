@@ -0,0 +1,74 @@
+"""Compare concurrent-client latency of the threaded and the asyncio servers.
+
+Starts the threaded app (gunicorn, wsgi:app) and the asyncio app (uvicorn,
+asgi:app) with the same number of worker processes, one after the other,
+and drives the read endpoints with benchmarks.loadtest at each concurrency.
+
+    python -m benchmarks.async_vs_threaded --workers 2 --concurrency 10 100 1000
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import subprocess
+import sys
+
+from benchmarks.loadtest import run
+from benchmarks.worker_scaling import wait_until_ready
+
+SERVERS = {
+    'threaded': lambda port, workers: [
+        sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py',
+        '--bind', f'127.0.0.1:{port}', '--workers', str(workers), 'wsgi:app'
+    ],
+    'async': lambda port, workers: [
+        sys.executable, '-m', 'uvicorn', '--host', '127.0.0.1', '--port', str(port),
+        '--workers', str(workers), '--no-access-log', 'asgi:app'
+    ],
+}
+
+
+@contextlib.contextmanager
+def serve(command, port):
+    server = subprocess.Popen(command, env=dict(os.environ, LOG_LEVEL='WARNING'))
+    try:
+        wait_until_ready(f'http://127.0.0.1:{port}/')
+        yield
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--vessels', type=int, default=100, help='poll /vessel/1 to /vessel/N')
+    parser.add_argument('--port', type=int, default=5056)
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    args = parser.parse_args()
+
+    paths = [f'/vessel/{vessel_id}' for vessel_id in range(1, args.vessels + 1)] + ['/equipment/active?limit=100']
+    url = f'http://127.0.0.1:{args.port}/'
+
+    results = []
+    print(f"{'server':>9} {'clients':>8} {'rps':>10} {'p50 ms':>10} {'p99 ms':>10} {'errors':>8}")
+    for name, command in SERVERS.items():
+        with serve(command(args.port, args.workers), args.port):
+            for concurrency in args.concurrency:
+                result = asyncio.run(run(url, concurrency, args.duration, paths))
+                results.append({'server': name, 'workers': args.workers, 'concurrency': concurrency, **result})
+                print(
+                    f"{name:>9} {concurrency:>8} {result['rps']:>10} "
+                    f"{result['p50_ms']:>10.2f} {result['p99_ms']:>10.2f} {result['errors']:>8}"
+                )
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+
+
+if __name__ == '__main__':
+    main()
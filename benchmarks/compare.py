@@ -0,0 +1,83 @@
+"""Compare two benchmark result files and flag regressions.
+
+Works with the JSON written by ``--output`` of benchmarks.routes,
+benchmarks.loadtest, benchmarks.worker_scaling, benchmarks.serialization,
+benchmarks.ingest and benchmarks.startup:
+records are matched on their non-metric fields (route, scale, url, phase...),
+and latency or throughput changes beyond ``--threshold`` percent are reported.
+
+    python -m benchmarks.compare baseline.json current.json --threshold 10
+
+Exits with status 1 when a regression is found, so it can gate CI.
+"""
+import argparse
+import json
+import sys
+
+# Metrics where a lower value is better, then the throughputs where a higher one is.
+LOWER_IS_BETTER = ('p50_ms', 'p95_ms', 'p99_ms', 'mean_ms', 'orm_seconds', 'projection_seconds')
+HIGHER_IS_BETTER = ('rps', 'rows_per_s')
+METRICS = LOWER_IS_BETTER + HIGHER_IS_BETTER
+IGNORED = ('requests', 'runs', 'errors', 'seconds', 'max_ms')
+
+
+def record_key(record):
+    return tuple(sorted(
+        (name, value) for name, value in record.items() if name not in METRICS and name not in IGNORED
+    ))
+
+
+def load(path):
+    with open(path) as results:
+        records = json.load(results)
+    if isinstance(records, dict):
+        records = [records]
+    return {record_key(record): record for record in records}
+
+
+def change(before, after):
+    """Relative change from ``before`` to ``after``, in percent."""
+    if not before:
+        return None
+    return (after - before) / before * 100
+
+
+def compare(baseline, current, threshold):
+    """Yield ``(key, metric, before, after, percent, regressed)`` for every
+    metric present in both runs."""
+    for key, record in current.items():
+        if key not in baseline:
+            continue
+        for metric in METRICS:
+            before, after = baseline[key].get(metric), record.get(metric)
+            if before is None or after is None:
+                continue
+            percent = change(before, after)
+            if percent is None:
+                continue
+            worse = percent if metric in LOWER_IS_BETTER else -percent
+            yield key, metric, before, after, percent, worse > threshold
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('baseline')
+    parser.add_argument('current')
+    parser.add_argument('--threshold', type=float, default=10.0, help='tolerated slowdown, in percent')
+    parser.add_argument('--all', action='store_true', help='print every metric, not only regressions')
+    args = parser.parse_args()
+
+    regressions = 0
+    for key, metric, before, after, percent, regressed in compare(load(args.baseline), load(args.current), args.threshold):
+        regressions += regressed
+        if regressed or args.all:
+            label = ' '.join(f'{name}={value}' for name, value in key)
+            flag = 'REGRESSION' if regressed else ''
+            print(f'{label:<70} {metric:>18} {before:>10.3f} -> {after:>10.3f} {percent:>+8.1f}% {flag}')
+
+    print(f'{regressions} regression(s) beyond {args.threshold}%')
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
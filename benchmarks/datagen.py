@@ -0,0 +1,129 @@
+"""Fill a scratch database with synthetic vessels, equipments and operations.
+
+Rows are streamed to PostgreSQL with COPY, so millions of operations load
+in seconds. The operation_costs rollup is filled by its triggers as usual.
+
+    BENCH_DATABASE_URI=postgresql://postgres@localhost/vessels_db_bench \\
+        python -m benchmarks.datagen --vessels 10 --equipments 100 --operations 100
+
+The database is emptied first: never point it at real data.
+"""
+import argparse
+import io
+import os
+import random
+import time
+
+from sqlalchemy import text
+
+from api.app import create_app
+from config import db
+
+OPERATION_TYPES = ('repair', 'inspection', 'replacement', 'cleaning', 'calibration')
+LOCATIONS = ('brazil', 'chile', 'peru', 'norway', 'angola', 'mexico')
+COPY_CHUNK_ROWS = 100000
+
+
+def vessel_code(vessel_id):
+    return f'MV{vessel_id:06}'
+
+
+def equipment_code(equipment_id):
+    return f'{equipment_id:08X}'
+
+
+def copy_rows(cursor, table, columns, rows):
+    """COPY ``rows`` (tuples of already formatted values) into ``table``,
+    ``COPY_CHUNK_ROWS`` at a time."""
+    statement = f'COPY {table} ({", ".join(columns)}) FROM STDIN'
+    buffer, count = io.StringIO(), 0
+    for row in rows:
+        buffer.write('\t'.join(row))
+        buffer.write('\n')
+        count += 1
+        if count == COPY_CHUNK_ROWS:
+            buffer.seek(0)
+            cursor.copy_expert(statement, buffer)
+            buffer, count = io.StringIO(), 0
+    if count:
+        buffer.seek(0)
+        cursor.copy_expert(statement, buffer)
+
+
+def generate(vessels, equipments_per_vessel, operations_per_equipment, seed=0):
+    """Replace the data of the current app database with ``vessels`` vessels,
+    each with ``equipments_per_vessel`` equipments, each with
+    ``operations_per_equipment`` operations. Returns the row counts.
+    """
+    rng = random.Random(seed)
+    equipments = vessels * equipments_per_vessel
+    operations = equipments * operations_per_equipment
+
+    db.session.execute(text('TRUNCATE vessels, equipments, operations, operation_costs RESTART IDENTITY'))
+    cursor = db.session.connection().connection.cursor()
+
+    copy_rows(cursor, 'vessels', ('id', 'code'), (
+        (str(vessel_id), vessel_code(vessel_id)) for vessel_id in range(1, vessels + 1)
+    ))
+    copy_rows(cursor, 'equipments', ('id', 'vessel_id', 'name', 'code', 'location', 'active'), (
+        (
+            str(equipment_id),
+            str((equipment_id - 1) // equipments_per_vessel + 1),
+            f'equipment {equipment_id % 1000}',
+            equipment_code(equipment_id),
+            rng.choice(LOCATIONS),
+            't' if rng.random() < 0.8 else 'f'
+        )
+        for equipment_id in range(1, equipments + 1)
+    ))
+    copy_rows(cursor, 'operations', ('id', 'equipment_id', 'type', 'cost'), (
+        (
+            str(operation_id),
+            str((operation_id - 1) // operations_per_equipment + 1),
+            rng.choice(OPERATION_TYPES),
+            f'{rng.uniform(1, 10000):.2f}'
+        )
+        for operation_id in range(1, operations + 1)
+    ))
+
+    for table in ('vessels', 'equipments', 'operations'):
+        db.session.execute(text(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), (SELECT COALESCE(max(id), 0) + 1 FROM {table}), false)"))
+    db.session.commit()
+
+    for table in ('vessels', 'equipments', 'operations', 'operation_costs'):
+        db.session.execute(text(f'ANALYZE {table}'))
+    db.session.commit()
+    return {'vessels': vessels, 'equipments': equipments, 'operations': operations}
+
+
+def bench_app():
+    """App bound to ``BENCH_DATABASE_URI`` (the test database by default)."""
+    app = create_app(test_config=True)
+    app.config['QUERY_DEBUG'] = False
+    if os.environ.get('BENCH_DATABASE_URI'):
+        app.config['SQLALCHEMY_DATABASE_URI'] = os.environ['BENCH_DATABASE_URI']
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--vessels', type=int, default=10)
+    parser.add_argument('--equipments', type=int, default=100, help='equipments per vessel')
+    parser.add_argument('--operations', type=int, default=100, help='operations per equipment')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    app = bench_app()
+    with app.app_context():
+        db.create_all()
+        started = time.perf_counter()
+        counts = generate(args.vessels, args.equipments, args.operations, args.seed)
+        elapsed = time.perf_counter() - started
+
+    rows = sum(counts.values())
+    print(f"{counts['vessels']} vessels, {counts['equipments']} equipments, {counts['operations']} operations "
+          f'in {elapsed:.2f}s ({rows / elapsed:,.0f} rows/s)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""Measure the rows/s of the operation batch upload, POST /equipment/operation/batch.
+
+For every body format (JSON array, NDJSON, CSV), ingest method (COPY or
+multi-row INSERT, see INGEST_METHOD) and upload size, the body is built
+once, then posted in-process through the Flask test client; the best of
+``--repeat`` runs is kept. The operations are emptied before every run, so
+each upload starts from the same table.
+
+    BENCH_DATABASE_URI=postgresql://postgres@localhost/vessels_db_bench \\
+        python -m benchmarks.ingest --rows 1000 100000 1000000 --output ingest.json
+
+The database is emptied first: never point it at real data.
+"""
+import argparse
+import csv
+import io
+import json
+import logging
+import time
+
+from sqlalchemy import text
+
+from benchmarks.datagen import OPERATION_TYPES, bench_app, equipment_code, generate
+from config import db
+
+FORMATS = ('json', 'ndjson', 'csv')
+METHODS = ('copy', 'insert')
+
+
+def operations(rows, equipments):
+    return [
+        {'code': equipment_code(index % equipments + 1), 'type': OPERATION_TYPES[index % len(OPERATION_TYPES)],
+         'cost': index % 10000 + 0.5}
+        for index in range(rows)
+    ]
+
+
+def request_body(upload_format, rows):
+    """Keyword arguments of the ``client.post()`` call uploading ``rows``."""
+    if upload_format == 'json':
+        return {'data': json.dumps(rows), 'content_type': 'application/json'}
+    if upload_format == 'ndjson':
+        return {'data': ''.join(json.dumps(row) + '\n' for row in rows), 'content_type': 'application/x-ndjson'}
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=('code', 'type', 'cost'))
+    writer.writeheader()
+    writer.writerows(rows)
+    return {'data': buffer.getvalue(), 'content_type': 'text/csv'}
+
+
+def time_upload(client, body, repeat):
+    timings = []
+    for _ in range(repeat):
+        db.session.execute(text('TRUNCATE operations, operation_costs'))
+        db.session.commit()
+        db.session.remove()
+        started = time.perf_counter()
+        response = client.post('/equipment/operation/batch', **body)
+        elapsed = time.perf_counter() - started
+        if response.status_code != 201:
+            raise RuntimeError(f'Upload failed with {response.status_code}: {response.get_data(as_text=True)[:200]}')
+        timings.append(elapsed)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 100000, 1000000])
+    parser.add_argument('--equipments', type=int, default=1000, help='equipments the operations are spread over')
+    parser.add_argument('--format', choices=FORMATS, action='append', help='only upload bodies of this format')
+    parser.add_argument('--method', choices=METHODS, action='append', help='only use this INGEST_METHOD')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    args = parser.parse_args()
+
+    app = bench_app()
+    app.config['INGEST_MAX_ROWS'] = max(app.config['INGEST_MAX_ROWS'], *args.rows)
+    logging.getLogger('api').setLevel(logging.WARNING)
+    client = app.test_client()
+
+    results = []
+    with app.app_context():
+        db.create_all()
+        generate(1, args.equipments, 0)
+        print(f"{'format':<8} {'method':<8} {'rows':>10} {'seconds':>9} {'rows/s':>12}")
+        for rows in args.rows:
+            uploaded = operations(rows, args.equipments)
+            for upload_format in args.format or FORMATS:
+                body = request_body(upload_format, uploaded)
+                for method in args.method or METHODS:
+                    app.config['INGEST_METHOD'] = method
+                    seconds = time_upload(client, body, args.repeat)
+                    rows_per_s = round(rows / seconds)
+                    results.append({'format': upload_format, 'method': method, 'rows': rows,
+                                    'seconds': seconds, 'rows_per_s': rows_per_s})
+                    print(f'{upload_format:<8} {method:<8} {rows:>10} {seconds:>9.3f} {rows_per_s:>12,}')
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+"""HTTP load generator built on asyncio streams, with no extra dependencies.
+
+Each simulated client keeps one keep-alive connection open and sends GET
+requests back to back for the length of the run.
+
+    python -m benchmarks.loadtest http://localhost:5000/vessel -c 50 -d 10 --output run.json
+
+``--paths FILE`` spreads the requests over the paths listed in FILE, one per
+line. Compare saved runs with ``python -m benchmarks.compare``.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from urllib.parse import urlsplit
+
+
+class HTTPClient(object):
+    """A single keep-alive HTTP/1.1 connection."""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = self.writer = None
+
+    async def get(self, path):
+        """Send a GET request and return ``(status, body)``."""
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+        self.writer.write(f'GET {path} HTTP/1.1\r\nHost: {self.host}\r\n\r\n'.encode())
+        await self.writer.drain()
+
+        head = await self.reader.readuntil(b'\r\n\r\n')
+        lines = head.decode('latin-1').split('\r\n')
+        status = int(lines[0].split()[1])
+        headers = dict(line.split(': ', 1) for line in lines[1:] if ': ' in line)
+        headers = {name.lower(): value for name, value in headers.items()}
+
+        if headers.get('transfer-encoding') == 'chunked':
+            body = await self._read_chunked()
+        else:
+            body = await self.reader.readexactly(int(headers.get('content-length', 0)))
+
+        if headers.get('connection', '').lower() == 'close':
+            await self.close()
+        return status, body
+
+    async def _read_chunked(self):
+        body = bytearray()
+        while True:
+            size = int((await self.reader.readline()).strip(), 16)
+            chunk = await self.reader.readexactly(size + 2)
+            if size == 0:
+                return bytes(body)
+            body += chunk[:-2]
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.reader = self.writer = None
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(latencies, errors, elapsed):
+    """Throughput and latency percentiles (in milliseconds) of a run."""
+    latencies_ms = [latency * 1000 for latency in latencies]
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'seconds': round(elapsed, 3),
+        'rps': round(len(latencies) / elapsed, 1) if elapsed else None,
+        'mean_ms': round(statistics.mean(latencies_ms), 3) if latencies_ms else None,
+        'p50_ms': percentile(latencies_ms, 0.50),
+        'p95_ms': percentile(latencies_ms, 0.95),
+        'p99_ms': percentile(latencies_ms, 0.99),
+        'max_ms': max(latencies_ms, default=None)
+    }
+
+
+async def run(url, concurrency=10, duration=10.0, paths=None):
+    """Hit ``url`` from ``concurrency`` clients for ``duration`` seconds.
+
+    ``paths``, when given, is cycled through instead of the url path so a run
+    can spread over many resources.
+    """
+    parts = urlsplit(url)
+    host, port = parts.hostname, parts.port or 80
+    paths = paths or [parts.path + (f'?{parts.query}' if parts.query else '') or '/']
+
+    latencies, errors = [], 0
+    deadline = time.perf_counter() + duration
+
+    async def client(offset):
+        nonlocal errors
+        connection = HTTPClient(host, port)
+        index = offset
+        while time.perf_counter() < deadline:
+            path = paths[index % len(paths)]
+            index += concurrency
+            started = time.perf_counter()
+            try:
+                status, _ = await connection.get(path)
+            except (OSError, asyncio.IncompleteReadError, ValueError):
+                errors += 1
+                await connection.close()
+                continue
+            if status >= 500:
+                errors += 1
+            else:
+                latencies.append(time.perf_counter() - started)
+        await connection.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client(offset) for offset in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('url')
+    parser.add_argument('-c', '--concurrency', type=int, default=10)
+    parser.add_argument('-d', '--duration', type=float, default=10.0)
+    parser.add_argument('--paths', help='file with one request path per line')
+    parser.add_argument('--output', help='write the result as JSON to this file')
+    args = parser.parse_args()
+
+    paths = None
+    if args.paths:
+        with open(args.paths) as lines:
+            paths = [line.strip() for line in lines if line.strip()]
+
+    result = asyncio.run(run(args.url, args.concurrency, args.duration, paths))
+    result = {'url': args.url, 'concurrency': args.concurrency, 'paths': args.paths, **result}
+    print(json.dumps(result, indent=2))
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump([result], output, indent=2)
+
+
+if __name__ == '__main__':
+    main()
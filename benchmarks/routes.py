@@ -0,0 +1,176 @@
+"""Time every route of api/routes at several data scales.
+
+For each scale (vessels x equipments per vessel x operations per equipment)
+the database is regenerated with benchmarks.datagen, then each route is
+called in-process through the Flask test client, so the numbers measure the
+handler, the queries and the serialization without any HTTP server.
+
+    BENCH_DATABASE_URI=postgresql://postgres@localhost/vessels_db_bench \\
+        python -m benchmarks.routes --scales 10x10x10 10x100x100 --output routes.json
+
+Compare two result files with ``python -m benchmarks.compare``.
+The database is emptied first: never point it at real data.
+"""
+import argparse
+import itertools
+import json
+import logging
+import time
+from collections import namedtuple
+
+from api.models.equipment import Equipment
+from api.models.vessel import Vessel
+from benchmarks.datagen import bench_app, equipment_code, generate, vessel_code
+from benchmarks.loadtest import summarize
+from config import db
+
+# ``request`` returns the keyword arguments of one ``client.open()`` call; it
+# runs outside the timed section and gets a fresh counter on every call.
+Case = namedtuple('Case', 'name request')
+
+counter = itertools.count(1)
+
+
+def operations(count):
+    return [{'code': equipment_code(1), 'type': 'repair', 'cost': index} for index in range(count)]
+
+
+def cases(client, scale):
+    vessels, equipments = scale['vessels'], scale['equipments']
+
+    def created(model, path, body):
+        """Id of a row created through ``path`` for a delete case."""
+        client.post(path, json=body)
+        return db.session.query(model.id).filter_by(code=body['code']).scalar()
+
+    def created_batch(model, path, key, rows):
+        """Ids of the rows created through the batch endpoint ``path``."""
+        client.post(path, json={key: rows})
+        codes = [row['code'] for row in rows]
+        return [model_id for (model_id,) in db.session.query(model.id).filter(model.code.in_(codes))]
+
+    return [
+        Case('GET /', lambda n: {'path': '/'}),
+        Case('GET /cache/stats', lambda n: {'path': '/cache/stats'}),
+        Case('GET /metrics', lambda n: {'path': '/metrics'}),
+        Case('GET /vessel', lambda n: {'path': '/vessel'}),
+        Case('GET /vessel?format=ndjson', lambda n: {'path': '/vessel?format=ndjson'}),
+        Case('GET /vessel/<id>', lambda n: {'path': f'/vessel/{n % vessels + 1}'}),
+        Case('POST /vessel', lambda n: {'path': '/vessel', 'method': 'POST', 'json': {'code': f'B{n:07}'}}),
+        Case('POST /vessel/batch', lambda n: {'path': '/vessel/batch', 'method': 'POST', 'json': {
+            'vessels': [{'code': f'C{n:04}{index:03}'} for index in range(100)]
+        }}),
+        Case('DELETE /vessel/<id>', lambda n: {
+            'path': f"/vessel/{created(Vessel, '/vessel', {'code': f'D{n:07}'})}", 'method': 'DELETE'
+        }),
+        Case('DELETE /vessel', lambda n: {'path': '/vessel', 'method': 'DELETE', 'json': {
+            'ids': created_batch(Vessel, '/vessel/batch', 'vessels', [{'code': f'H{n:04}{index:03}'} for index in range(100)])
+        }}),
+        Case('GET /vessel/operation/costs', lambda n: {'path': '/vessel/operation/costs'}),
+        Case('GET /vessel/operation/costs?fresh=true', lambda n: {'path': '/vessel/operation/costs?fresh=true'}),
+        Case('GET /equipment', lambda n: {'path': '/equipment'}),
+        Case('GET /equipment?vessel_code=&sort=name', lambda n: {
+            'path': f'/equipment?vessel_code={vessel_code(n % vessels + 1)}&sort=name'
+        }),
+        Case('GET /equipment/active', lambda n: {'path': '/equipment/active'}),
+        Case('GET /equipment/<id>', lambda n: {'path': f'/equipment/{n % equipments + 1}'}),
+        Case('POST /equipment', lambda n: {'path': '/equipment', 'method': 'POST', 'json': {
+            'vessel_code': vessel_code(1), 'code': f'E{n:07}', 'location': 'brazil', 'name': 'pump'
+        }}),
+        Case('POST /equipment/batch', lambda n: {'path': '/equipment/batch', 'method': 'POST', 'json': {
+            'equipments': [
+                {'vessel_code': vessel_code(1), 'code': f'F{n:04}{index:03}', 'location': 'brazil', 'name': 'pump'}
+                for index in range(100)
+            ]
+        }}),
+        Case('PUT /equipment/inactive', lambda n: {'path': '/equipment/inactive', 'method': 'PUT', 'json': {
+            'equipments': [equipment_code((n * 100 + index) % equipments + 1) for index in range(100)]
+        }}),
+        Case('DELETE /equipment/<id>', lambda n: {
+            'path': f"/equipment/{created(Equipment, '/equipment', {'vessel_code': vessel_code(1), 'code': f'G{n:07}', 'location': 'brazil', 'name': 'pump'})}",
+            'method': 'DELETE'
+        }),
+        Case('DELETE /equipment', lambda n: {'path': '/equipment', 'method': 'DELETE', 'json': {
+            'ids': created_batch(Equipment, '/equipment/batch', 'equipments', [
+                {'vessel_code': vessel_code(1), 'code': f'I{n:04}{index:03}', 'location': 'brazil', 'name': 'pump'}
+                for index in range(100)
+            ])
+        }}),
+        Case('GET /equipment/operation', lambda n: {'path': '/equipment/operation'}),
+        Case('GET /equipment/operation?code=&sort=-cost', lambda n: {
+            'path': f'/equipment/operation?code={equipment_code(n % equipments + 1)}&sort=-cost'
+        }),
+        Case('POST /equipment/operation', lambda n: {'path': '/equipment/operation', 'method': 'POST', 'json': {
+            'code': equipment_code(n % equipments + 1), 'type': 'repair', 'cost': n
+        }}),
+        Case('POST /equipment/operation/batch', lambda n: {
+            'path': '/equipment/operation/batch', 'method': 'POST', 'json': operations(1000)
+        }),
+        Case('POST /equipment/operation/costs', lambda n: {'path': '/equipment/operation/costs', 'method': 'POST', 'json': {
+            'code': equipment_code(n % equipments + 1)
+        }}),
+        Case('POST /equipment/operation/costs codes', lambda n: {'path': '/equipment/operation/costs', 'method': 'POST', 'json': {
+            'codes': [equipment_code((n + index) % equipments + 1) for index in range(100)]
+        }}),
+    ]
+
+
+def time_case(client, case, iterations, warmup):
+    latencies, errors = [], 0
+    for iteration in range(warmup + iterations):
+        arguments = case.request(next(counter))
+        started = time.perf_counter()
+        response = client.open(**arguments)
+        response.get_data()
+        elapsed = time.perf_counter() - started
+        if iteration < warmup:
+            continue
+        if response.status_code >= 400:
+            errors += 1
+        latencies.append(elapsed)
+    return summarize(latencies, errors, sum(latencies))
+
+
+def parse_scale(value):
+    vessels, equipments, operations = (int(part) for part in value.split('x'))
+    return vessels, equipments, operations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scales', type=parse_scale, nargs='+', default=[(10, 10, 10), (10, 100, 100), (100, 100, 100)],
+                        help='VESSELSxEQUIPMENTSxOPERATIONS, per parent row')
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--route', action='append', help='only run the cases whose name starts with this')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    args = parser.parse_args()
+
+    app = bench_app()
+    logging.getLogger('api').setLevel(logging.WARNING)
+    client = app.test_client()
+
+    results = []
+    with app.app_context():
+        db.create_all()
+        for vessels, equipments, operations_count in args.scales:
+            scale = generate(vessels, equipments, operations_count)
+            label = f'{vessels}x{equipments}x{operations_count}'
+            print(f'\n{label}: {scale}')
+            print(f"{'route':<48} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'rps':>8} {'errors':>7}")
+            for case in cases(client, scale):
+                if args.route and not any(case.name.startswith(prefix) for prefix in args.route):
+                    continue
+                result = time_case(client, case, args.iterations, args.warmup)
+                results.append({'scale': label, 'route': case.name, **result})
+                print(f"{case.name:<48} {result['p50_ms']:>9.2f} {result['p95_ms']:>9.2f} "
+                      f"{result['p99_ms']:>9.2f} {result['rps']:>8} {result['errors']:>7}")
+                db.session.remove()
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""Compare the SerializerMixin.to_dict() list path with the column projection path.
+
+Fills the equipments table of a scratch database with N rows and times,
+for every N, serializing all of them to JSON both ways:
+
+* orm: Equipment.query.all(), to_dict() on every instance, json.dumps
+* projection: serialized columns as row tuples, precompiled row encoder,
+  api.serialization.dumps (orjson when installed)
+
+    BENCH_DATABASE_URI=postgresql://postgres@localhost/vessels_db_bench \\
+        python -m benchmarks.serialization --rows 1000 100000 1000000
+
+The database is emptied first: never point it at real data.
+"""
+import argparse
+import json
+import os
+import time
+
+from sqlalchemy import text
+
+from api.app import create_app
+from api.models.equipment import Equipment
+from api.serialization import dumps, project, row_encoder
+from config import db
+
+
+def populate(rows):
+    db.session.execute(text('TRUNCATE vessels, equipments, operations, operation_costs RESTART IDENTITY'))
+    db.session.execute(text("INSERT INTO vessels (code) VALUES ('BENCH')"))
+    db.session.execute(text(
+        "INSERT INTO equipments (vessel_id, name, code, location, active) "
+        "SELECT 1, 'equipment ' || i, to_hex(i), 'location ' || (i % 100), i % 2 = 0 "
+        "FROM generate_series(1, :rows) AS i"
+    ), {'rows': rows})
+    db.session.commit()
+
+
+def orm_path():
+    return json.dumps([equipment.to_dict() for equipment in Equipment.query.all()]).encode()
+
+
+def projection_path():
+    encode = row_encoder(Equipment)
+    return dumps([encode(row) for row in project(Equipment.query, Equipment).all()])
+
+
+def best_of(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        db.session.remove()
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 100000, 1000000])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    args = parser.parse_args()
+
+    app = create_app(test_config=True)
+    if os.environ.get('BENCH_DATABASE_URI'):
+        app.config['SQLALCHEMY_DATABASE_URI'] = os.environ['BENCH_DATABASE_URI']
+
+    results = []
+    with app.app_context():
+        db.create_all()
+        print(f"{'rows':>10} {'orm s':>10} {'projection s':>14} {'speedup':>8}")
+        for rows in args.rows:
+            populate(rows)
+            orm = best_of(orm_path, args.repeat)
+            projection = best_of(projection_path, args.repeat)
+            results.append({'rows': rows, 'orm_seconds': orm, 'projection_seconds': projection})
+            print(f'{rows:>10} {orm:>10.3f} {projection:>14.3f} {orm / projection:>7.1f}x')
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+
+
+if __name__ == '__main__':
+    main()
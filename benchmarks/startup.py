@@ -0,0 +1,118 @@
+"""Time the cold start of the app: import, factory and first requests.
+
+Every run is a fresh interpreter, as a new gunicorn worker or container is.
+The phases timed are the import of ``api.app``, ``create_app()``, a first
+request without database access, a first request with it (connection and
+first queries) and the first ``/apispec_1.json`` (flasgger import and spec
+build). ``process`` is the wall time of the whole child process.
+
+    BENCH_DATABASE_URI=postgresql://postgres@localhost/vessels_db_bench \\
+        python -m benchmarks.startup --runs 20 --output startup.json
+
+``--imports N`` also prints the N slowest imports of one run
+(``python -X importtime``). Compare runs with ``python -m benchmarks.compare``.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from benchmarks.loadtest import percentile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = '''
+import json, os, time
+started = time.perf_counter()
+from api.app import create_app
+imported = time.perf_counter()
+app = create_app(test_config=True)
+app.config['QUERY_DEBUG'] = False
+if os.environ.get('BENCH_DATABASE_URI'):
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ['BENCH_DATABASE_URI']
+created = time.perf_counter()
+client = app.test_client()
+client.get('/')
+first_request = time.perf_counter()
+client.get('/vessel?limit=1')
+first_query = time.perf_counter()
+client.get('/apispec_1.json')
+first_spec = time.perf_counter()
+print(json.dumps({
+    'import': imported - started,
+    'create_app': created - imported,
+    'first_request': first_request - created,
+    'first_query': first_query - first_request,
+    'first_spec': first_spec - first_query,
+}))
+'''
+
+PHASES = ('process', 'import', 'create_app', 'first_request', 'first_query', 'first_spec')
+
+
+def run_child():
+    """Phase durations, in seconds, of one cold start."""
+    env = dict(os.environ, LOG_LEVEL='WARNING')
+    started = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, '-c', CHILD], cwd=ROOT, env=env, check=True, capture_output=True, text=True
+    ).stdout
+    elapsed = time.perf_counter() - started
+    return {'process': elapsed, **json.loads(output.strip().splitlines()[-1])}
+
+
+def slowest_imports(count):
+    """``(cumulative ms, module)`` of the ``count`` slowest imports of ``api.app``."""
+    stderr = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import api.app'], cwd=ROOT, check=True, capture_output=True, text=True
+    ).stderr
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, module = line[len('import time:'):].split('|')
+        imports.append((int(cumulative) / 1000, module.rstrip()))
+    return sorted(imports, reverse=True)[:count]
+
+
+def summarize(samples):
+    samples_ms = [sample * 1000 for sample in samples]
+    return {
+        'runs': len(samples_ms),
+        'mean_ms': round(statistics.mean(samples_ms), 3),
+        'p50_ms': percentile(samples_ms, 0.50),
+        'p95_ms': percentile(samples_ms, 0.95),
+        'max_ms': round(max(samples_ms), 3)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--imports', type=int, default=0, help='print the N slowest imports')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    args = parser.parse_args()
+
+    runs = [run_child() for _ in range(args.runs)]
+    results = [{'benchmark': 'startup', 'phase': phase, **summarize([run[phase] for run in runs])} for phase in PHASES]
+
+    print(f"{'phase':<16} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9}")
+    for result in results:
+        print(f"{result['phase']:<16} {result['mean_ms']:>9.2f} {result['p50_ms']:>9.2f} "
+              f"{result['p95_ms']:>9.2f} {result['max_ms']:>9.2f}")
+
+    if args.imports:
+        print(f'\nslowest imports of api.app')
+        for cumulative_ms, module in slowest_imports(args.imports):
+            print(f'{cumulative_ms:>9.2f} ms {module}')
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""Measure how requests/s scale with the number of gunicorn workers.
+
+Starts ``gunicorn -c gunicorn.conf.py wsgi:app`` once per worker count,
+drives it with benchmarks.loadtest and prints one row per run.
+
+    python -m benchmarks.worker_scaling --workers 1 2 4 8 --path /vessel/1
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+
+from benchmarks.loadtest import run
+
+
+def wait_until_ready(url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(url, timeout=1)
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'{url} did not come up in {timeout}s')
+
+
+def measure(workers, threads, port, path, concurrency, duration):
+    environ = dict(os.environ, WEB_CONCURRENCY=str(workers), WEB_THREADS=str(threads), LOG_LEVEL='WARNING')
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--bind', f'127.0.0.1:{port}', 'wsgi:app'],
+        env=environ
+    )
+    try:
+        wait_until_ready(f'http://127.0.0.1:{port}/')
+        return asyncio.run(run(f'http://127.0.0.1:{port}{path}', concurrency, duration))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--path', default='/vessel/operation/costs')
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'workers':>8} {'rps':>10} {'p50 ms':>10} {'p99 ms':>10} {'errors':>8}")
+    for workers in args.workers:
+        result = measure(workers, args.threads, args.port, args.path, args.concurrency, args.duration)
+        results.append({'workers': workers, 'threads': args.threads, **result})
+        print(f"{workers:>8} {result['rps']:>10} {result['p50_ms']:>10.2f} {result['p99_ms']:>10.2f} {result['errors']:>8}")
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,13 @@
 import os
-from flask_sqlalchemy import SQLAlchemy
+
+from api.replicas import RoutingSQLAlchemy
 
 
 basedir = os.path.abspath(os.path.dirname(__file__))
-db = SQLAlchemy()
+db = RoutingSQLAlchemy()
 
-class RunConfig(object):
-    DEBUG = True
+class BaseConfig(object):
+    DEBUG = False
     pguser = os.environ.get('PGUSER', 'postgres')
     pgpass = os.environ.get('PGPASSWORD', 'postgres')
     pghost = os.environ.get('PGHOST', 'db')
@@ -14,15 +15,69 @@ class RunConfig(object):
     pgdb = os.environ.get('PGDATABASE', 'vessels_db')
     SQLALCHEMY_DATABASE_URI = f'postgresql://{pguser}:{pgpass}@{pghost}:{pgport}/{pgdb}'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    REPLICA_DATABASE_URIS = [uri for uri in os.environ.get('REPLICA_DATABASE_URIS', '').split(',') if uri]
+    REPLICA_CHECK_INTERVAL = float(os.environ.get('REPLICA_CHECK_INTERVAL', 5))
+    REPLICA_STICKY_SECONDS = int(os.environ.get('REPLICA_STICKY_SECONDS', 5))
+    BULK_MAX_ITEMS = int(os.environ.get('BULK_MAX_ITEMS', 50000))
+    BULK_CHUNK_SIZE = int(os.environ.get('BULK_CHUNK_SIZE', 1000))
+    PAGE_DEFAULT_LIMIT = int(os.environ.get('PAGE_DEFAULT_LIMIT', 100))
+    PAGE_MAX_LIMIT = int(os.environ.get('PAGE_MAX_LIMIT', 1000))
+    STREAM_CHUNK_SIZE = int(os.environ.get('STREAM_CHUNK_SIZE', 1000))
+    EXPORT_CHUNK_SIZE = int(os.environ.get('EXPORT_CHUNK_SIZE', 50000))
+    INGEST_METHOD = os.environ.get('INGEST_METHOD', 'copy')
+    INGEST_CHUNK_SIZE = int(os.environ.get('INGEST_CHUNK_SIZE', 10000))
+    INGEST_MAX_ROWS = int(os.environ.get('INGEST_MAX_ROWS', 1000000))
+    INGEST_MAX_ERRORS = int(os.environ.get('INGEST_MAX_ERRORS', 1000))
+    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+    LOG_FORMAT = os.environ.get('LOG_FORMAT', 'json')
+    CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'memory')
+    CACHE_MAXSIZE = int(os.environ.get('CACHE_MAXSIZE', 10000))
+    CACHE_TTL = int(os.environ.get('CACHE_TTL', 60))
+    CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL', 'redis://localhost:6379/0')
+    HTTP_CACHE_MAX_AGE = int(os.environ.get('HTTP_CACHE_MAX_AGE', 5))
+    QUERY_DEBUG = os.environ.get('QUERY_DEBUG', 'false') == 'true'
+    SLOW_QUERY_MS = int(os.environ.get('SLOW_QUERY_MS', 100))
+    REPEATED_QUERY_THRESHOLD = int(os.environ.get('REPEATED_QUERY_THRESHOLD', 5))
+    JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+    JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', 1))
+    JOB_STALE_SECONDS = int(os.environ.get('JOB_STALE_SECONDS', 600))
+    JOB_HEARTBEAT_SECONDS = float(os.environ.get('JOB_HEARTBEAT_SECONDS', 30))
+    JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 3))
+    PARTITION_MONTHS_AHEAD = int(os.environ.get('PARTITION_MONTHS_AHEAD', 3))
+    PARTITION_CHECK_INTERVAL = float(os.environ.get('PARTITION_CHECK_INTERVAL', 3600))
+    IDEMPOTENCY_TTL = int(os.environ.get('IDEMPOTENCY_TTL', 86400))
+    METRICS_DIR = os.environ.get('METRICS_DIR')
+    METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 5))
 
 
-class TestConfig(object):
+class RunConfig(BaseConfig):
     DEBUG = True
-    pguser = os.environ.get('PGUSER', 'postgres')
-    pgpass = os.environ.get('PGPASSWORD', 'postgres')
-    pghost = os.environ.get('PGHOST', 'db')
-    pgport = os.environ.get('PGPORT', '5432')
+    QUERY_DEBUG = os.environ.get('QUERY_DEBUG', 'true') == 'true'
+
+
+class TestConfig(BaseConfig):
+    DEBUG = True
+    QUERY_DEBUG = True
     pgdb = os.environ.get('PGDATABASETEST', 'vessels_db_test')
-    SQLALCHEMY_DATABASE_URI = f'postgresql://{pguser}:{pgpass}@{pghost}:{pgport}/{pgdb}'
-    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_DATABASE_URI = f'postgresql://{BaseConfig.pguser}:{BaseConfig.pgpass}@{BaseConfig.pghost}:{BaseConfig.pgport}/{pgdb}'
+    REPLICA_DATABASE_URIS = []
+
+
+class ProductionConfig(BaseConfig):
+    """Settings for gunicorn workers (see gunicorn.conf.py).
 
+    Each worker process has its own pool, so the database sees up to
+    WEB_CONCURRENCY * (DB_POOL_SIZE + DB_MAX_OVERFLOW) connections.
+    DEBUG stays off, which also makes flasgger build the Swagger spec once
+    instead of on every /apispec_1.json request.
+    """
+    DEBUG = False
+    # Shared by the workers, so that /metrics sums all of them.
+    METRICS_DIR = os.environ.get('METRICS_DIR', '/tmp/api-metrics')
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', os.environ.get('WEB_THREADS', 4))),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 2)),
+        'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', 10)),
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': os.environ.get('DB_POOL_PRE_PING', 'true') == 'true',
+    }
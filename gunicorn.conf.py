@@ -0,0 +1,27 @@
+import multiprocessing
+import os
+
+# Sizing: a worker is a process running WEB_THREADS request threads, and
+# each thread needs a database connection while it serves a request, so
+# keep DB_POOL_SIZE + DB_MAX_OVERFLOW >= WEB_THREADS (ProductionConfig
+# defaults DB_POOL_SIZE to WEB_THREADS). The database then sees at most
+#     WEB_CONCURRENCY * (DB_POOL_SIZE + DB_MAX_OVERFLOW)
+# connections, which must stay below PostgreSQL's max_connections minus
+# what migrations, psql and other clients need. Requests mostly wait on
+# PostgreSQL, so start from 2 * cores + 1 workers and tune with
+# benchmarks/worker_scaling.py.
+bind = os.environ.get('BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('WEB_THREADS', 4))
+worker_class = 'gthread'
+timeout = int(os.environ.get('WEB_TIMEOUT', 30))
+keepalive = int(os.environ.get('WEB_KEEPALIVE', 5))
+
+# Recycle workers now and then to bound memory growth.
+max_requests = int(os.environ.get('WEB_MAX_REQUESTS', 10000))
+max_requests_jitter = int(os.environ.get('WEB_MAX_REQUESTS_JITTER', 1000))
+
+# The app is not preloaded: every worker builds its own engine and pool
+# after the fork, so connections are never shared between processes.
+preload_app = False
+accesslog = None
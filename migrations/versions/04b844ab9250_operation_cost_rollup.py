@@ -0,0 +1,135 @@
+"""operation cost rollup
+
+Revision ID: 04b844ab9250
+Revises: e320e2258b63
+Create Date: 2026-10-18 14:37:24.842164
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+OPERATION_COSTS_FUNCTIONS = '''
+CREATE OR REPLACE FUNCTION operation_costs_insert() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO operation_costs AS c (equipment_id, type, count, total, min_cost, max_cost)
+    SELECT equipment_id, COALESCE(type, ''), count(*), COALESCE(sum(cost), 0), min(cost), max(cost)
+    FROM new_rows
+    WHERE equipment_id IS NOT NULL
+    GROUP BY 1, 2
+    ON CONFLICT (equipment_id, type) DO UPDATE SET
+        count = c.count + EXCLUDED.count,
+        total = c.total + EXCLUDED.total,
+        min_cost = LEAST(c.min_cost, EXCLUDED.min_cost),
+        max_cost = GREATEST(c.max_cost, EXCLUDED.max_cost);
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION operation_costs_delete() RETURNS trigger AS $$
+BEGIN
+    WITH affected AS (
+        SELECT DISTINCT equipment_id, COALESCE(type, '') AS type FROM old_rows
+    )
+    DELETE FROM operation_costs c
+    USING affected a
+    WHERE c.equipment_id = a.equipment_id AND c.type = a.type;
+
+    WITH affected AS (
+        SELECT DISTINCT equipment_id, COALESCE(type, '') AS type FROM old_rows
+    )
+    INSERT INTO operation_costs (equipment_id, type, count, total, min_cost, max_cost)
+    SELECT o.equipment_id, COALESCE(o.type, ''), count(*), COALESCE(sum(o.cost), 0), min(o.cost), max(o.cost)
+    FROM operations o
+    JOIN affected a ON o.equipment_id = a.equipment_id AND COALESCE(o.type, '') = a.type
+    GROUP BY 1, 2;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION operation_costs_update() RETURNS trigger AS $$
+BEGIN
+    WITH affected AS (
+        SELECT equipment_id, COALESCE(type, '') AS type FROM old_rows
+        UNION
+        SELECT equipment_id, COALESCE(type, '') FROM new_rows
+    )
+    DELETE FROM operation_costs c
+    USING affected a
+    WHERE c.equipment_id = a.equipment_id AND c.type = a.type;
+
+    WITH affected AS (
+        SELECT equipment_id, COALESCE(type, '') AS type FROM old_rows
+        UNION
+        SELECT equipment_id, COALESCE(type, '') FROM new_rows
+    )
+    INSERT INTO operation_costs (equipment_id, type, count, total, min_cost, max_cost)
+    SELECT o.equipment_id, COALESCE(o.type, ''), count(*), COALESCE(sum(o.cost), 0), min(o.cost), max(o.cost)
+    FROM operations o
+    JOIN affected a ON o.equipment_id = a.equipment_id AND COALESCE(o.type, '') = a.type
+    GROUP BY 1, 2;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION operation_costs_truncate() RETURNS trigger AS $$
+BEGIN
+    DELETE FROM operation_costs;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+'''
+
+OPERATION_COSTS_TRIGGERS = '''
+CREATE TRIGGER operation_costs_insert AFTER INSERT ON operations
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE PROCEDURE operation_costs_insert();
+
+CREATE TRIGGER operation_costs_update AFTER UPDATE ON operations
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE PROCEDURE operation_costs_update();
+
+CREATE TRIGGER operation_costs_delete AFTER DELETE ON operations
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE PROCEDURE operation_costs_delete();
+
+CREATE TRIGGER operation_costs_truncate AFTER TRUNCATE ON operations
+    FOR EACH STATEMENT EXECUTE PROCEDURE operation_costs_truncate();
+'''
+
+OPERATION_COSTS_BACKFILL = '''
+INSERT INTO operation_costs (equipment_id, type, count, total, min_cost, max_cost)
+SELECT equipment_id, COALESCE(type, ''), count(*), COALESCE(sum(cost), 0), min(cost), max(cost)
+FROM operations
+WHERE equipment_id IS NOT NULL
+GROUP BY 1, 2
+'''
+
+
+# revision identifiers, used by Alembic.
+revision = '04b844ab9250'
+down_revision = 'e320e2258b63'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('operation_costs',
+        sa.Column('equipment_id', sa.BigInteger(), nullable=False),
+        sa.Column('type', sa.String(length=32), nullable=False),
+        sa.Column('count', sa.BigInteger(), nullable=False),
+        sa.Column('total', sa.Float(), nullable=False),
+        sa.Column('min_cost', sa.Float(), nullable=True),
+        sa.Column('max_cost', sa.Float(), nullable=True),
+        sa.ForeignKeyConstraint(['equipment_id'], ['equipments.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('equipment_id', 'type')
+    )
+    op.execute(OPERATION_COSTS_FUNCTIONS)
+    op.execute(OPERATION_COSTS_TRIGGERS)
+    op.execute(OPERATION_COSTS_BACKFILL)
+
+
+def downgrade():
+    for operation in ('insert', 'update', 'delete', 'truncate'):
+        op.execute(f'DROP TRIGGER IF EXISTS operation_costs_{operation} ON operations')
+        op.execute(f'DROP FUNCTION IF EXISTS operation_costs_{operation}()')
+    op.drop_table('operation_costs')
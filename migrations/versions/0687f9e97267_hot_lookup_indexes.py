@@ -0,0 +1,36 @@
+"""hot lookup indexes
+
+Revision ID: 0687f9e97267
+Revises: 04b844ab9250
+Create Date: 2026-10-18 14:37:26.086601
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0687f9e97267'
+down_revision = '04b844ab9250'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Built CONCURRENTLY so the tables stay writable while the indexes build.
+    with op.get_context().autocommit_block():
+        op.create_index('ix_equipments_vessel_id', 'equipments', ['vessel_id'], postgresql_concurrently=True)
+        op.create_index('ix_equipments_name', 'equipments', ['name'], postgresql_concurrently=True)
+        op.create_index(
+            'ix_equipments_active', 'equipments', ['id'],
+            postgresql_where=sa.text('active = true'), postgresql_concurrently=True
+        )
+        op.create_index('ix_operations_equipment_id', 'operations', ['equipment_id'], postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_operations_equipment_id', 'operations', postgresql_concurrently=True)
+        op.drop_index('ix_equipments_active', 'equipments', postgresql_concurrently=True)
+        op.drop_index('ix_equipments_name', 'equipments', postgresql_concurrently=True)
+        op.drop_index('ix_equipments_vessel_id', 'equipments', postgresql_concurrently=True)
@@ -0,0 +1,31 @@
+"""listing filter indexes
+
+Revision ID: 311db7fa4996
+Revises: 0687f9e97267
+Create Date: 2026-10-18 14:47:28.568007
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '311db7fa4996'
+down_revision = '0687f9e97267'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Built CONCURRENTLY so the tables stay writable while the indexes build.
+    with op.get_context().autocommit_block():
+        op.create_index('ix_equipments_location', 'equipments', ['location'], postgresql_concurrently=True)
+        op.create_index('ix_operations_type', 'operations', ['type'], postgresql_concurrently=True)
+        op.create_index('ix_operations_cost', 'operations', ['cost', 'id'], postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_operations_cost', 'operations', postgresql_concurrently=True)
+        op.drop_index('ix_operations_type', 'operations', postgresql_concurrently=True)
+        op.drop_index('ix_equipments_location', 'equipments', postgresql_concurrently=True)
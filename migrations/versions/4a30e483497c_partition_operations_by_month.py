@@ -0,0 +1,117 @@
+"""partition operations by month
+
+Revision ID: 4a30e483497c
+Revises: 70f4dc50ec39
+Create Date: 2026-10-18 14:57:00.084309
+
+"""
+from datetime import date, datetime, timezone
+
+from alembic import op
+import sqlalchemy as sa
+
+OPERATION_COSTS_TRIGGERS = '''
+CREATE TRIGGER operation_costs_insert AFTER INSERT ON operations
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE PROCEDURE operation_costs_insert();
+
+CREATE TRIGGER operation_costs_update AFTER UPDATE ON operations
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE PROCEDURE operation_costs_update();
+
+CREATE TRIGGER operation_costs_delete AFTER DELETE ON operations
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE PROCEDURE operation_costs_delete();
+
+CREATE TRIGGER operation_costs_truncate AFTER TRUNCATE ON operations
+    FOR EACH STATEMENT EXECUTE PROCEDURE operation_costs_truncate();
+
+CREATE TRIGGER operations_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON operations
+    FOR EACH STATEMENT EXECUTE PROCEDURE bump_table_version();
+'''
+
+INDEXES = (
+    ('ix_operations_equipment_id', ['equipment_id']),
+    ('ix_operations_type', ['type']),
+    ('ix_operations_cost', ['cost', 'id']),
+)
+
+MONTHS_AHEAD = 3
+
+COLUMNS = 'id, equipment_id, type, cost'
+
+
+# revision identifiers, used by Alembic.
+revision = '4a30e483497c'
+down_revision = '70f4dc50ec39'
+branch_labels = None
+depends_on = None
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def set_aside(suffix):
+    """Rename the current operations table and its indexes out of the way."""
+    op.rename_table('operations', f'operations_{suffix}')
+    op.execute(f'ALTER INDEX operations_pkey RENAME TO operations_{suffix}_pkey')
+    for name, _ in INDEXES:
+        op.execute(f'ALTER INDEX {name} RENAME TO {name}_{suffix}')
+
+
+def create_operations(primary_key, **kwargs):
+    op.create_table('operations',
+    sa.Column('id', sa.BigInteger(), server_default=sa.text("nextval('operations_id_seq'::regclass)"), nullable=False),
+    sa.Column('equipment_id', sa.BigInteger(), nullable=True),
+    sa.Column('type', sa.String(length=32), nullable=True),
+    sa.Column('cost', sa.Float(), nullable=True),
+    *primary_key,
+    sa.ForeignKeyConstraint(['equipment_id'], ['equipments.id'], name='operations_equipment_id_fkey'),
+    **kwargs
+    )
+    for name, columns in INDEXES:
+        op.create_index(name, 'operations', columns, unique=False)
+
+
+def move_rows(source, columns, values):
+    """Copy ``source`` into the new operations table and drop it.
+
+    The triggers are created afterwards: the rollup already counts these rows.
+    """
+    op.execute(f'INSERT INTO operations ({columns}) SELECT {values} FROM {source}')
+    op.execute('ALTER SEQUENCE operations_id_seq OWNED BY operations.id')
+    op.drop_table(source)
+    op.execute(OPERATION_COSTS_TRIGGERS)
+
+
+def upgrade():
+    # Rewrites the whole table under an exclusive lock: run it in a
+    # maintenance window on large databases. Existing operations are dated
+    # at the time of the migration.
+    set_aside('unpartitioned')
+    create_operations(
+        [
+            sa.Column('performed_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+            sa.PrimaryKeyConstraint('id', 'performed_at'),
+        ],
+        postgresql_partition_by='RANGE (performed_at)'
+    )
+    op.execute('CREATE TABLE operations_default PARTITION OF operations DEFAULT')
+    today = datetime.now(timezone.utc)
+    current = date(today.year, today.month, 1)
+    for offset in range(MONTHS_AHEAD + 1):
+        month, end = add_months(current, offset), add_months(current, offset + 1)
+        op.execute(
+            f"CREATE TABLE operations_{month:%Y_%m} PARTITION OF operations "
+            f"FOR VALUES FROM ('{month} 00:00:00+00') TO ('{end} 00:00:00+00')"
+        )
+    move_rows('operations_unpartitioned', f'{COLUMNS}, performed_at', f'{COLUMNS}, now()')
+
+
+def downgrade():
+    # Operations of detached partitions are not brought back.
+    set_aside('partitioned')
+    create_operations([sa.PrimaryKeyConstraint('id')])
+    move_rows('operations_partitioned', COLUMNS, COLUMNS)
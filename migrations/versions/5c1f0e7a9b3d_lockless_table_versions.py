@@ -0,0 +1,71 @@
+"""lockless table versions
+
+Revision ID: 5c1f0e7a9b3d
+Revises: 2128b57232e6
+Create Date: 2026-10-18 16:02:11.418206
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+TRACKED_TABLES = ('vessels', 'equipments', 'operations')
+
+TABLE_WRITE_FUNCTIONS = '''
+CREATE OR REPLACE FUNCTION note_table_write(name text) RETURNS void AS $$
+DECLARE
+    written text := COALESCE(current_setting('app.written_tables', true), '');
+BEGIN
+    IF position(',' || name || ',' IN written) = 0 THEN
+        PERFORM set_config('app.written_tables', COALESCE(NULLIF(written, ''), ',') || name || ',', true);
+    END IF;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION table_written() RETURNS trigger AS $$
+BEGIN
+    PERFORM note_table_write(TG_TABLE_NAME);
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+'''
+
+BUMP_TABLE_VERSION_FUNCTION = '''
+CREATE OR REPLACE FUNCTION bump_table_version() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO table_versions AS v (name, version, updated_at)
+    VALUES (TG_TABLE_NAME, 1, clock_timestamp())
+    ON CONFLICT (name) DO UPDATE SET version = v.version + 1, updated_at = EXCLUDED.updated_at;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+'''
+
+
+# revision identifiers, used by Alembic.
+revision = '5c1f0e7a9b3d'
+down_revision = '2128b57232e6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute(TABLE_WRITE_FUNCTIONS)
+    for table in TRACKED_TABLES:
+        op.execute(f'DROP TRIGGER {table}_version ON {table}')
+        op.execute(
+            f'CREATE TRIGGER {table}_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {table} '
+            'FOR EACH STATEMENT EXECUTE PROCEDURE table_written()'
+        )
+    op.execute('DROP FUNCTION bump_table_version()')
+
+
+def downgrade():
+    op.execute(BUMP_TABLE_VERSION_FUNCTION)
+    for table in TRACKED_TABLES:
+        op.execute(f'DROP TRIGGER {table}_version ON {table}')
+        op.execute(
+            f'CREATE TRIGGER {table}_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {table} '
+            'FOR EACH STATEMENT EXECUTE PROCEDURE bump_table_version()'
+        )
+    op.execute('DROP FUNCTION table_written()')
+    op.execute('DROP FUNCTION note_table_write(text)')
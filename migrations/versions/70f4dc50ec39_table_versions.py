@@ -0,0 +1,51 @@
+"""table versions
+
+Revision ID: 70f4dc50ec39
+Revises: 311db7fa4996
+Create Date: 2026-10-18 14:49:30.831268
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+TABLE_VERSION_FUNCTION = '''
+CREATE OR REPLACE FUNCTION bump_table_version() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO table_versions AS v (name, version, updated_at)
+    VALUES (TG_TABLE_NAME, 1, clock_timestamp())
+    ON CONFLICT (name) DO UPDATE SET version = v.version + 1, updated_at = EXCLUDED.updated_at;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+'''
+
+TRACKED_TABLES = ('vessels', 'equipments', 'operations')
+
+
+# revision identifiers, used by Alembic.
+revision = '70f4dc50ec39'
+down_revision = '311db7fa4996'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('table_versions',
+    sa.Column('name', sa.String(length=64), nullable=False),
+    sa.Column('version', sa.BigInteger(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+    op.execute(TABLE_VERSION_FUNCTION)
+    for table in TRACKED_TABLES:
+        op.execute(
+            f'CREATE TRIGGER {table}_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {table} '
+            'FOR EACH STATEMENT EXECUTE PROCEDURE bump_table_version()'
+        )
+
+
+def downgrade():
+    for table in TRACKED_TABLES:
+        op.execute(f'DROP TRIGGER {table}_version ON {table}')
+    op.execute('DROP FUNCTION bump_table_version()')
+    op.drop_table('table_versions')
@@ -0,0 +1,42 @@
+"""notify cached table writes
+
+Revision ID: 9e4b7c2d1f60
+Revises: 5c1f0e7a9b3d
+Create Date: 2026-10-18 16:40:52.107334
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+NOTIFIED_TABLES = ('vessels', 'equipments')
+
+TABLE_NOTIFY_FUNCTION = '''
+CREATE OR REPLACE FUNCTION notify_table_write() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('table_writes', TG_TABLE_NAME);
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+'''
+
+
+# revision identifiers, used by Alembic.
+revision = '9e4b7c2d1f60'
+down_revision = '5c1f0e7a9b3d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute(TABLE_NOTIFY_FUNCTION)
+    for table in NOTIFIED_TABLES:
+        op.execute(
+            f'CREATE TRIGGER {table}_notify AFTER UPDATE OR DELETE OR TRUNCATE ON {table} '
+            'FOR EACH STATEMENT EXECUTE PROCEDURE notify_table_write()'
+        )
+
+
+def downgrade():
+    for table in NOTIFIED_TABLES:
+        op.execute(f'DROP TRIGGER {table}_notify ON {table}')
+    op.execute('DROP FUNCTION notify_table_write()')
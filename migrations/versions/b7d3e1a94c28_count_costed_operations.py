@@ -0,0 +1,105 @@
+"""count costed operations in the rollup
+
+Revision ID: b7d3e1a94c28
+Revises: 9e4b7c2d1f60
+Create Date: 2026-10-18 17:52:16.480913
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# {count} and {o_count} count the rows of the new/old transition tables and
+# of the operations left.
+OPERATION_COSTS_FUNCTIONS = '''
+CREATE OR REPLACE FUNCTION operation_costs_insert() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO operation_costs AS c (equipment_id, type, count, total, min_cost, max_cost)
+    SELECT equipment_id, COALESCE(type, ''), {count}, COALESCE(sum(cost), 0), min(cost), max(cost)
+    FROM new_rows
+    WHERE equipment_id IS NOT NULL
+    GROUP BY 1, 2
+    ON CONFLICT (equipment_id, type) DO UPDATE SET
+        count = c.count + EXCLUDED.count,
+        total = c.total + EXCLUDED.total,
+        min_cost = LEAST(c.min_cost, EXCLUDED.min_cost),
+        max_cost = GREATEST(c.max_cost, EXCLUDED.max_cost);
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION operation_costs_delete() RETURNS trigger AS $$
+BEGIN
+    WITH affected AS (
+        SELECT DISTINCT equipment_id, COALESCE(type, '') AS type FROM old_rows
+    )
+    DELETE FROM operation_costs c
+    USING affected a
+    WHERE c.equipment_id = a.equipment_id AND c.type = a.type;
+
+    WITH affected AS (
+        SELECT DISTINCT equipment_id, COALESCE(type, '') AS type FROM old_rows
+    )
+    INSERT INTO operation_costs (equipment_id, type, count, total, min_cost, max_cost)
+    SELECT o.equipment_id, COALESCE(o.type, ''), {o_count}, COALESCE(sum(o.cost), 0), min(o.cost), max(o.cost)
+    FROM operations o
+    JOIN affected a ON o.equipment_id = a.equipment_id AND COALESCE(o.type, '') = a.type
+    GROUP BY 1, 2;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION operation_costs_update() RETURNS trigger AS $$
+BEGIN
+    WITH affected AS (
+        SELECT equipment_id, COALESCE(type, '') AS type FROM old_rows
+        UNION
+        SELECT equipment_id, COALESCE(type, '') FROM new_rows
+    )
+    DELETE FROM operation_costs c
+    USING affected a
+    WHERE c.equipment_id = a.equipment_id AND c.type = a.type;
+
+    WITH affected AS (
+        SELECT equipment_id, COALESCE(type, '') AS type FROM old_rows
+        UNION
+        SELECT equipment_id, COALESCE(type, '') FROM new_rows
+    )
+    INSERT INTO operation_costs (equipment_id, type, count, total, min_cost, max_cost)
+    SELECT o.equipment_id, COALESCE(o.type, ''), {o_count}, COALESCE(sum(o.cost), 0), min(o.cost), max(o.cost)
+    FROM operations o
+    JOIN affected a ON o.equipment_id = a.equipment_id AND COALESCE(o.type, '') = a.type
+    GROUP BY 1, 2;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+'''
+
+# Recounts the rollup, then makes the ETags built from the operations change.
+OPERATION_COSTS_REBUILD = '''
+DELETE FROM operation_costs;
+
+INSERT INTO operation_costs (equipment_id, type, count, total, min_cost, max_cost)
+SELECT equipment_id, COALESCE(type, ''), {count}, COALESCE(sum(cost), 0), min(cost), max(cost)
+FROM operations
+WHERE equipment_id IS NOT NULL
+GROUP BY 1, 2;
+
+UPDATE table_versions SET version = version + 1, updated_at = now() WHERE name = 'operations';
+'''
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7d3e1a94c28'
+down_revision = '9e4b7c2d1f60'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute(OPERATION_COSTS_FUNCTIONS.format(count='count(cost)', o_count='count(o.cost)'))
+    op.execute(OPERATION_COSTS_REBUILD.format(count='count(cost)'))
+
+
+def downgrade():
+    op.execute(OPERATION_COSTS_FUNCTIONS.format(count='count(*)', o_count='count(*)'))
+    op.execute(OPERATION_COSTS_REBUILD.format(count='count(*)'))
@@ -0,0 +1,40 @@
+"""equipment version trigger
+
+Revision ID: c4f8a2d6e913
+Revises: b7d3e1a94c28
+Create Date: 2026-10-18 19:05:37.214608
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+EQUIPMENT_VERSION_FUNCTION = '''
+CREATE OR REPLACE FUNCTION bump_version() RETURNS trigger AS $$
+BEGIN
+    IF NEW IS DISTINCT FROM OLD THEN
+        NEW.version := OLD.version + 1;
+    END IF;
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+'''
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4f8a2d6e913'
+down_revision = 'b7d3e1a94c28'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute(EQUIPMENT_VERSION_FUNCTION)
+    op.execute(
+        'CREATE TRIGGER equipments_version BEFORE UPDATE ON equipments '
+        'FOR EACH ROW EXECUTE PROCEDURE bump_version()'
+    )
+
+
+def downgrade():
+    op.execute('DROP TRIGGER equipments_version ON equipments')
+    op.execute('DROP FUNCTION bump_version()')
@@ -0,0 +1,32 @@
+"""cascade deletes
+
+Revision ID: e05b581079fe
+Revises: 4a30e483497c
+Create Date: 2026-10-18 15:01:13.087974
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e05b581079fe'
+down_revision = '4a30e483497c'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Swapped in one transaction, so the tables are never left without a
+    # foreign key. Adding the constraint back scans the table to validate it.
+    op.drop_constraint('equipments_vessel_id_fkey', 'equipments', type_='foreignkey')
+    op.create_foreign_key('equipments_vessel_id_fkey', 'equipments', 'vessels', ['vessel_id'], ['id'], ondelete='CASCADE')
+    op.drop_constraint('operations_equipment_id_fkey', 'operations', type_='foreignkey')
+    op.create_foreign_key('operations_equipment_id_fkey', 'operations', 'equipments', ['equipment_id'], ['id'], ondelete='CASCADE')
+
+
+def downgrade():
+    op.drop_constraint('operations_equipment_id_fkey', 'operations', type_='foreignkey')
+    op.create_foreign_key('operations_equipment_id_fkey', 'operations', 'equipments', ['equipment_id'], ['id'])
+    op.drop_constraint('equipments_vessel_id_fkey', 'equipments', type_='foreignkey')
+    op.create_foreign_key('equipments_vessel_id_fkey', 'equipments', 'vessels', ['vessel_id'], ['id'])
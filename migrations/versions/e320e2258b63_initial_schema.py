@@ -0,0 +1,50 @@
+"""initial schema
+
+Revision ID: e320e2258b63
+Revises: 
+Create Date: 2026-10-18 14:37:23.483038
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e320e2258b63'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('vessels',
+        sa.Column('id', sa.BigInteger(), nullable=False),
+        sa.Column('code', sa.String(length=8), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('code')
+    )
+    op.create_table('equipments',
+        sa.Column('id', sa.BigInteger(), nullable=False),
+        sa.Column('vessel_id', sa.BigInteger(), nullable=True),
+        sa.Column('name', sa.String(length=256), nullable=True),
+        sa.Column('code', sa.String(length=8), nullable=True),
+        sa.Column('location', sa.String(length=256), nullable=True),
+        sa.Column('active', sa.Boolean(), server_default='true', nullable=True),
+        sa.ForeignKeyConstraint(['vessel_id'], ['vessels.id']),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('code')
+    )
+    op.create_table('operations',
+        sa.Column('id', sa.BigInteger(), nullable=False),
+        sa.Column('equipment_id', sa.BigInteger(), nullable=True),
+        sa.Column('type', sa.String(length=32), nullable=True),
+        sa.Column('cost', sa.Float(), nullable=True),
+        sa.ForeignKeyConstraint(['equipment_id'], ['equipments.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('operations')
+    op.drop_table('equipments')
+    op.drop_table('vessels')
@@ -1,5 +1,12 @@
 #!/usr/bin/env bash
 
+# Production boots straight into gunicorn: requirements are installed in the
+# image and api.boot only applies the pending migrations.
+if [[ "$FLASK_ENV" == "production" ]]; then
+  exec python -m api.boot gunicorn -c gunicorn.conf.py wsgi:app
+fi
+
+# Development: the source is bind mounted, requirements may have changed.
 pip install -r requirements.txt
 
 while ! pg_isready -q -h $PGHOST -p $PGPORT -U $PGUSER
@@ -26,13 +33,13 @@ fi
 export FLASK_APP="manage.py"
 export FLASK_DEBUG=1
 
-echo db init
-flask db init
-echo db migrate
-flask db migrate
 echo db upgrade
 flask db upgrade
+flask partitions create
 
-pytest -v
+# RUN_TESTS=false skips the suite for a quicker restart.
+if [[ "$RUN_TESTS" != "false" ]]; then
+  pytest -v
+fi
 
 flask run -h 0.0.0.0 -p 5000
@@ -0,0 +1,92 @@
+import os
+import sys
+
+import pytest
+from flask_migrate import Migrate
+from starlette.testclient import TestClient
+
+sys.path.append(os.path.join(os.path.dirname(__file__),'../'))
+
+from api.aio.app import create_async_app
+from api.app import create_app
+from api.models.equipment import Equipment
+from api.models.vessel import Vessel
+from config import db
+
+
+@pytest.fixture(scope="module")
+def app():
+    app = create_app(test_config=True)
+    
+    with app.app_context():
+        db.create_all()
+        Migrate(app, db)
+        db.session.add(Vessel(code='MV102'))
+        db.session.add(Vessel(code='MV101'))
+        db.session.commit()
+        db.session.add(Equipment(vessel_id=1, name='compressor', code='5310B9D7', location='brazil', active=True))
+        db.session.add(Equipment(vessel_id=1, name='pump', code='5310B9D8', location='brazil', active=False))
+        db.session.commit()
+
+    yield app
+
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+
+@pytest.fixture(scope="module")
+def client(app):
+    with TestClient(create_async_app('config.TestConfig')) as client:
+        yield client
+
+def test_view_vessel(client, app):
+    result = client.get('/vessel/1')
+    assert result.status_code == 200
+    with app.app_context():
+        assert result.json() == Vessel.query.get(1).to_dict()
+
+def test_view_vessel_not_found(client, app):
+    result = client.get('/vessel/999')
+    assert result.status_code == 404
+    expected = app.test_client().get('/vessel/999')
+    assert result.content == expected.get_data()
+    assert result.headers['content-type'] == expected.headers['Content-Type']
+    assert client.get('/no-such-route').content == expected.get_data()
+
+def test_view_equipment_not_cached(client, app):
+    assert client.get('/equipment/2').json()['location'] == 'brazil'
+    with app.app_context():
+        Equipment.query.filter_by(id=2).update({'location': 'drydock'})
+        db.session.commit()
+    assert client.get('/equipment/2').json()['location'] == 'drydock'
+
+def test_list_vessel_pagination(client):
+    result = client.get('/vessel?limit=1')
+    assert [vessel['code'] for vessel in result.json()] == ['MV102']
+    next_url = result.headers['Link'][1:result.headers['Link'].index('>')]
+    result = client.get(next_url)
+    assert [vessel['code'] for vessel in result.json()] == ['MV101']
+    assert 'Link' not in result.headers
+
+def test_active_equipment(client):
+    result = client.get('/equipment/active')
+    assert [equipment['code'] for equipment in result.json()] == ['5310B9D7']
+
+def test_list_equipments_ndjson(client):
+    result = client.get('/equipment?format=ndjson')
+    assert result.headers['content-type'].startswith('application/x-ndjson')
+    assert len(result.text.splitlines()) == 2
+
+def test_list_equipments_accept(client, app):
+    for accept in ('application/x-ndjson', 'application/json, application/x-ndjson;q=0.5', '*/*'):
+        expected = app.test_client().get('/equipment', headers={'Accept': accept})
+        result = client.get('/equipment', headers={'Accept': accept})
+        assert result.headers['content-type'] == expected.headers['Content-Type']
+
+def test_list_equipments_sort_and_filter(client):
+    result = client.get('/equipment?sort=-code&limit=1&fields=code')
+    assert result.json() == [{'id': 2, 'code': '5310B9D8'}]
+    result = client.get(result.headers['Link'][1:result.headers['Link'].index('>')])
+    assert result.json() == [{'id': 1, 'code': '5310B9D7'}]
+    result = client.get('/equipment?active=false&fields=name')
+    assert result.json() == [{'id': 2, 'name': 'pump'}]
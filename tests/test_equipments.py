@@ -1,15 +1,20 @@
+import json
+import logging
 import os
 import sys
+import time
 
 import pytest
 from flask_migrate import Migrate
 
 sys.path.append(os.path.join(os.path.dirname(__file__),'../'))
 
-from sqlalchemy import func, or_
+from sqlalchemy import func, or_, text, update
 
 from api.app import create_app
-from api.models.equipment import Equipment, Operation
+from api.query_debug import assert_max_queries, statement_shape
+from api.models.equipment import Equipment, Operation, OperationCost
+from api.models.idempotency_key import IdempotencyKey
 from api.models.vessel import Vessel
 from config import db
 
@@ -90,8 +95,27 @@ def test_status_active(app):
 def test_status_inactive(app):
     result = app.test_client().put('/equipment/inactive', json={"equipments": ["5310B9D7"]})
     assert result.get_json().get('message') == 'OK'
+    assert result.get_json().get('updated') == 1
+    assert result.get_json().get('missing') == []
     assert result.status_code == 201
 
+def test_status_inactive_missing_codes(app):
+    with app.app_context():
+        db.session.add(Equipment(vessel_id=1, name='pump', code='AAAA0001', location='brazil', active=True))
+        db.session.commit()
+    result = app.test_client().put('/equipment/inactive', json={"equipments": ["AAAA0001", "MISSING1", "MISSING2"]})
+    assert result.status_code == 400
+    assert result.get_json().get('missing') == ['MISSING1', 'MISSING2']
+    with app.app_context():
+        equipment = Equipment.query.filter_by(code='AAAA0001').first()
+        assert equipment.active
+        db.session.delete(equipment)
+        db.session.commit()
+
+def test_status_inactive_invalid_body(app):
+    result = app.test_client().put('/equipment/inactive', json={"equipments": "5310B9D7"})
+    assert result.status_code == 400
+
 def test_insert_operation(app):
     result = app.test_client().post('/equipment/operation', json={"code": "5310B9D7", "type": "replacement", "cost": "1000"})
     assert result.get_json().get('message') == 'OK'
@@ -112,3 +136,538 @@ def test_operation_by_code(app):
 def test_operation_without_filter(app):
     result = app.test_client().post('/equipment/operation/costs', json={})
     assert result.status_code == 400
+
+def test_operation_batch_json(app):
+    operations = [
+        {'code': '5310B9D7', 'type': 'replacement', 'cost': 10},
+        {'code': 'UNKNOWN1', 'type': 'replacement', 'cost': 10},
+        {'code': '5310B9D7', 'type': 'repair', 'cost': 'abc'},
+        {'code': '5310B9D7', 'type': 'repair', 'cost': '20.5'},
+    ]
+    result = app.test_client().post('/equipment/operation/batch', json=operations)
+    assert result.status_code == 201
+    assert result.get_json()['inserted'] == 2
+    assert [error['row'] for error in result.get_json()['errors']] == [2, 3]
+
+def test_operation_batch_ndjson(app):
+    body = '{"code": "5310B9D7", "type": "repair", "cost": 1}\n\nnot json\n'
+    result = app.test_client().post('/equipment/operation/batch', data=body, content_type='application/x-ndjson')
+    assert result.status_code == 201
+    assert result.get_json()['inserted'] == 1
+    assert result.get_json()['errors'] == [{'row': 2, 'message': 'Invalid row'}]
+
+def test_operation_batch_csv(app):
+    body = 'code,type,cost\n5310B9D7,repair,1\n5310B9D7,repair,2\n'
+    result = app.test_client().post('/equipment/operation/batch', data=body, content_type='text/csv')
+    assert result.status_code == 201
+    assert result.get_json()['inserted'] == 2
+    with app.app_context():
+        assert Operation.query.filter_by(type='repair').count() == 4
+
+def test_operation_batch_invalid(app):
+    result = app.test_client().post('/equipment/operation/batch', json={'code': '5310B9D7'})
+    assert result.status_code == 400
+    result = app.test_client().post('/equipment/operation/batch', json=[{'code': 'UNKNOWN1', 'type': 'repair', 'cost': 1}])
+    assert result.status_code == 400
+    assert result.get_json()['inserted'] == 0
+
+def test_operation_batch_not_utf8(app):
+    client = app.test_client()
+    body = b'code,type,cost\n5310B9D7,repair,1\n5310B9D7,repair,\xff\n'
+    result = client.post('/equipment/operation/batch', data=body, content_type='text/csv')
+    assert result.status_code == 400
+    assert result.get_json()['message'] == 'Row 2 is not valid UTF-8'
+    body = b'{"code": "5310B9D7", "type": "repair", "cost": 1}\n{"code": "\xff"}\n'
+    result = client.post('/equipment/operation/batch', data=body, content_type='application/x-ndjson')
+    assert result.status_code == 400
+    assert result.get_json()['message'] == 'Row 2 is not valid UTF-8'
+
+def test_operation_batch_malformed_csv(app):
+    body = 'code,type,cost\n5310B9D7,repair,1\n5310B9D7,"repair,2\n5310B9D7,repair,3\n'
+    result = app.test_client().post('/equipment/operation/batch', data=body, content_type='text/csv')
+    assert result.status_code == 400
+    assert result.get_json()['message'].startswith('Row 2 is not valid CSV')
+
+def test_operation_batch_chunks(app):
+    operations = [{'code': '5310B9D7', 'type': 'chunked', 'cost': cost} for cost in (1, True, 2, 3, False)]
+    chunk_size, max_errors = app.config['INGEST_CHUNK_SIZE'], app.config['INGEST_MAX_ERRORS']
+    app.config.update(INGEST_CHUNK_SIZE=2, INGEST_MAX_ERRORS=1)
+    try:
+        result = app.test_client().post('/equipment/operation/batch', json=operations)
+    finally:
+        app.config.update(INGEST_CHUNK_SIZE=chunk_size, INGEST_MAX_ERRORS=max_errors)
+    assert result.status_code == 201
+    assert (result.get_json()['inserted'], result.get_json()['failed']) == (3, 2)
+    assert result.get_json()['errors'] == [{'row': 2, 'message': 'Invalid cost'}]
+    with app.app_context():
+        assert sorted(cost for cost, in db.session.query(Operation.cost).filter_by(type='chunked')) == [1, 2, 3]
+
+def test_insert_batch(app):
+    client = app.test_client()
+    equipments = [
+        {'vessel_code': 'MV101', 'code': 'BATCH001', 'location': 'chile', 'name': 'pump'},
+        {'vessel_code': 'MV101', 'code': '5310B9D7', 'location': 'chile', 'name': 'pump'},
+    ]
+    result = client.post('/equipment/batch', json={'equipments': equipments})
+    assert result.status_code == 201
+    assert result.get_json()['inserted'] == ['BATCH001']
+    assert result.get_json()['skipped'] == ['5310B9D7']
+
+    equipments[0]['location'] = 'peru'
+    result = client.post('/equipment/batch', json={'equipments': equipments[:1], 'on_conflict': 'update'})
+    assert result.get_json()['updated'] == ['BATCH001']
+    with app.app_context():
+        assert Equipment.query.filter_by(code='BATCH001').first().location == 'peru'
+
+def test_insert_batch_unknown_vessel(app):
+    equipments = [{'vessel_code': 'XX999', 'code': 'BATCH002', 'location': 'chile', 'name': 'pump'}]
+    result = app.test_client().post('/equipment/batch', json={'equipments': equipments})
+    assert result.status_code == 400
+    assert result.get_json()['errors'] == [{'row': 1, 'message': 'Vessel code XX999 not found'}]
+
+def test_operation_costs_total(app):
+    with app.app_context():
+        expected = db.session.query(func.sum(Operation.cost)).join(Equipment).filter(Equipment.code == '5310B9D7').scalar()
+    result = app.test_client().post('/equipment/operation/costs', json={'code': '5310B9D7'})
+    assert result.get_json()['message'] == f'Total cost: {expected}'
+
+    result = app.test_client().post('/equipment/operation/costs', json={'code': 'BATCH001'})
+    assert result.get_json()['message'] == 'Total cost: 0'
+
+def test_operation_costs_breakdown(app):
+    result = app.test_client().post('/equipment/operation/costs', json={'codes': ['5310B9D7', 'BATCH001', 'UNKNOWN1']})
+    assert result.status_code == 200
+    body = result.get_json()
+    assert body['missing'] == ['UNKNOWN1']
+    equipments = {equipment['code']: equipment for equipment in body['equipments']}
+    assert equipments['BATCH001']['count'] == 0
+    assert equipments['BATCH001']['types'] == {}
+    compressor = equipments['5310B9D7']
+    assert compressor['count'] == sum(group['count'] for group in compressor['types'].values())
+    assert compressor['types']['repair']['min'] == 1
+    assert compressor['types']['repair']['max'] == 20.5
+
+def test_operation_costs_breakdown_by_name(app):
+    result = app.test_client().post('/equipment/operation/costs', json={'names': ['compressor', 'pump']})
+    assert result.status_code == 200
+    assert {equipment['code'] for equipment in result.get_json()['equipments']} == {'5310B9D7', 'BATCH001'}
+
+def test_operation_costs_invalid_list(app):
+    result = app.test_client().post('/equipment/operation/costs', json={'codes': '5310B9D7'})
+    assert result.status_code == 400
+
+def test_operation_costs_rollup(app):
+    client = app.test_client()
+    for fresh in ('false', 'true'):
+        result = client.post(f'/equipment/operation/costs?fresh={fresh}', json={'codes': ['5310B9D7']})
+        assert result.status_code == 200
+    rollup = client.post('/equipment/operation/costs', json={'codes': ['5310B9D7']}).get_json()
+    live = client.post('/equipment/operation/costs?fresh=true', json={'codes': ['5310B9D7']}).get_json()
+    assert rollup == live
+
+    rollup = client.get('/vessel/operation/costs').get_json()
+    live = client.get('/vessel/operation/costs?fresh=true').get_json()
+    assert rollup == live
+
+def test_operation_costs_rollup_after_delete(app):
+    with app.app_context():
+        Operation.query.filter(Operation.type == 'repair', Operation.cost == 20.5).delete()
+        db.session.commit()
+        rollup = OperationCost.query.filter_by(equipment_id=1, type='repair').one()
+        live = db.session.query(func.count(Operation.cost), func.sum(Operation.cost), func.max(Operation.cost)).filter_by(equipment_id=1, type='repair').one()
+        assert (rollup.count, rollup.total, rollup.max_cost) == tuple(live)
+
+def test_operation_costs_null_values(app):
+    client = app.test_client()
+    with app.app_context():
+        vessel = Vessel(code='MV555')
+        db.session.add(vessel)
+        db.session.flush()
+        equipment = Equipment(vessel_id=vessel.id, code='NULL0001', name='winch', location='chile')
+        db.session.add(equipment)
+        db.session.flush()
+        db.session.add_all([
+            Operation(equipment_id=equipment.id, type=None, cost=4),
+            Operation(equipment_id=equipment.id, type=None, cost=None),
+            Operation(equipment_id=equipment.id, type='repair', cost=2),
+            Operation(equipment_id=equipment.id, type='repair', cost=None),
+        ])
+        db.session.commit()
+
+    rollup = client.post('/equipment/operation/costs', json={'codes': ['NULL0001']}).get_json()
+    live = client.post('/equipment/operation/costs?fresh=true', json={'codes': ['NULL0001']}).get_json()
+    assert rollup == live
+    [equipment] = rollup['equipments']
+    assert (equipment['count'], equipment['total'], equipment['average']) == (2, 6, 3)
+    assert set(equipment['types']) == {'', 'repair'}
+
+    def averages(url):
+        return {code: average for row in client.get(url).get_json() for code, average in row.items()}
+    rollup = averages('/vessel/operation/costs')
+    assert rollup == averages('/vessel/operation/costs?fresh=true')
+    assert rollup['MV555'] == 3
+
+def test_deactivate_invalidates_cache(app):
+    client = app.test_client()
+    with app.app_context():
+        equipment_id = Equipment.query.filter_by(code='BATCH001').one().id
+    assert client.get(f'/equipment/{equipment_id}').get_json()['active']
+    client.put('/equipment/inactive', json={'equipments': ['BATCH001']})
+    assert not client.get(f'/equipment/{equipment_id}').get_json()['active']
+
+def test_cache_sees_other_process_writes(app):
+    client = app.test_client()
+    with app.app_context():
+        equipment_id = Equipment.query.filter_by(code='BATCH001').one().id
+    assert client.get(f'/equipment/{equipment_id}').get_json()['location'] != 'drydock'
+
+    # Written outside of any session, as by another worker: only the NOTIFY of
+    # the trigger reaches the listener of this process.
+    with app.app_context():
+        with db.engine.begin() as connection:
+            connection.execute(update(Equipment).where(Equipment.id == equipment_id).values(location='drydock'))
+    deadline = time.monotonic() + 5
+    while client.get(f'/equipment/{equipment_id}').get_json()['location'] != 'drydock':
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+def test_lookups_by_code_cached(app):
+    client = app.test_client()
+    operation = {'code': '5310B9D7', 'type': 'survey', 'cost': 1}
+    client.post('/equipment/operation', json=operation)
+    stats = client.get('/cache/stats').get_json()
+    assert client.post('/equipment/operation', json=operation).status_code == 201
+    after = client.get('/cache/stats').get_json()
+    assert (after['hits'], after['misses']) == (stats['hits'] + 1, stats['misses'])
+
+    equipment = {'vessel_code': 'MV102', 'location': 'brazil', 'name': 'valve'}
+    client.post('/equipment', json={**equipment, 'code': 'BYCODE01'})
+    stats = client.get('/cache/stats').get_json()
+    assert client.post('/equipment', json={**equipment, 'code': 'BYCODE02'}).status_code == 201
+    assert client.get('/cache/stats').get_json()['hits'] == stats['hits'] + 1
+
+def test_delete_invalidates_code_lookup(app):
+    client = app.test_client()
+    operation = {'code': 'BYCODE02', 'type': 'survey', 'cost': 1}
+    assert client.post('/equipment/operation', json=operation).status_code == 201
+    with app.app_context():
+        equipment_id = Equipment.query.filter_by(code='BYCODE02').one().id
+    assert client.delete(f'/equipment/{equipment_id}').status_code == 200
+    assert client.post('/equipment/operation', json=operation).status_code == 400
+
+def test_list_matches_to_dict(app):
+    result = app.test_client().get('/equipment?limit=1000')
+    with app.app_context():
+        expected = [equipment.to_dict() for equipment in Equipment.query.order_by(Equipment.id)]
+    assert result.get_json() == expected
+    result = app.test_client().get('/equipment/operation?format=ndjson')
+    with app.app_context():
+        expected = [operation.to_dict() for operation in Operation.query.order_by(Operation.id)]
+    assert [json.loads(line) for line in result.get_data(as_text=True).splitlines()] == expected
+
+def test_list_equipments_filters(app):
+    client = app.test_client()
+    result = client.get('/equipment?vessel_code=MV101&fields=code')
+    assert result.get_json() == [{'id': 3, 'code': 'BATCH001'}]
+    result = client.get('/equipment?location=brazil&active=false&fields=code,active')
+    assert result.get_json() == [{'id': 1, 'code': '5310B9D7', 'active': False}]
+    result = client.get('/equipment/active?name=pump')
+    assert result.get_json() == []
+    assert client.get('/equipment?active=maybe').status_code == 400
+    assert client.get('/equipment?fields=code,secret').status_code == 400
+
+def test_list_operations_filters(app):
+    client = app.test_client()
+    result = client.get('/equipment/operation?code=5310B9D7&type=repair&min_cost=2&max_cost=10&fields=cost')
+    with app.app_context():
+        expected = Operation.query.filter(Operation.equipment_id == 1, Operation.type == 'repair', Operation.cost.between(2, 10))
+        expected = [{'id': operation.id, 'cost': operation.cost} for operation in expected.order_by(Operation.id)]
+    assert expected
+    assert result.get_json() == expected
+    assert client.get('/equipment/operation?min_cost=cheap').status_code == 400
+
+def test_list_operations_sort(app):
+    client = app.test_client()
+    with app.app_context():
+        expected = [operation.id for operation in Operation.query.order_by(Operation.cost.desc(), Operation.id.desc())]
+
+    ids, url = [], '/equipment/operation?sort=-cost&limit=2&fields=id'
+    while url:
+        result = client.get(url)
+        ids.extend(operation['id'] for operation in result.get_json())
+        link = result.headers.get('Link')
+        url = link[1:link.index('>')] if link else None
+    assert ids == expected
+
+    assert client.get('/equipment/operation?sort=type').status_code == 400
+    assert client.get('/equipment/operation?sort=cost&after=123').status_code == 400
+
+def test_list_sort_null_values(app):
+    client = app.test_client()
+    with app.app_context():
+        vessel = Vessel.query.filter_by(code='MV101').one()
+        for index, name in enumerate(['gauge', None, 'filter', None, None, 'gauge']):
+            db.session.add(Equipment(vessel_id=vessel.id, code=f'NS{index:06}', name=name, location='chile'))
+        db.session.commit()
+        listed = Equipment.query.filter_by(vessel_id=vessel.id)
+        ascending = [equipment.id for equipment in listed.order_by(Equipment.name.asc().nulls_last(), Equipment.id)]
+        descending = [equipment.id for equipment in listed.order_by(Equipment.name.desc().nulls_first(), Equipment.id.desc())]
+
+    # Pages of two put NULL names on both sides of a page boundary.
+    for sort, expected in (('name', ascending), ('-name', descending)):
+        ids, url = [], f'/equipment?vessel_code=MV101&sort={sort}&limit=2&fields=id'
+        while url:
+            result = client.get(url)
+            ids.extend(equipment['id'] for equipment in result.get_json())
+            link = result.headers.get('Link')
+            url = link[1:link.index('>')] if link else None
+        assert ids == expected
+
+def test_write_query_counts(app):
+    client = app.test_client()
+    # Every commit reads the tables it wrote, then bumps their versions.
+    with assert_max_queries(4):
+        client.post('/equipment', json={'vessel_code': 'MV102', 'code': 'QC000001', 'location': 'brazil', 'name': 'pump'})
+    equipments = [{'vessel_code': 'MV102', 'code': f'QC1{index:05}', 'location': 'brazil', 'name': 'pump'} for index in range(50)]
+    with assert_max_queries(4):
+        client.post('/equipment/batch', json={'equipments': equipments})
+    with assert_max_queries(3):
+        client.put('/equipment/inactive', json={'equipments': [equipment['code'] for equipment in equipments]})
+    with assert_max_queries(4):
+        client.post('/equipment/operation', json={'code': 'QC000001', 'type': 'repair', 'cost': 1})
+    operations = [{'code': 'QC000001', 'type': 'repair', 'cost': index} for index in range(50)]
+    with assert_max_queries(5):
+        client.post('/equipment/operation/batch', json=operations)
+
+def test_read_query_counts(app):
+    client = app.test_client()
+    with assert_max_queries(2):
+        client.get('/equipment?vessel_code=MV102&sort=name')
+    with assert_max_queries(1):
+        client.get('/equipment/operation?code=QC000001&min_cost=10')
+    with assert_max_queries(3):
+        client.post('/equipment/operation/costs', json={'codes': ['QC000001', '5310B9D7']})
+
+def test_statement_shape(app):
+    assert statement_shape('SELECT id FROM t WHERE id IN (%(id_1)s, %(id_2)s)') == statement_shape(
+        'SELECT id\n FROM t WHERE id IN (%(id_1)s)'
+    )
+
+def test_repeated_queries_logged(app):
+    records = []
+    handler = logging.Handler()
+    handler.emit = records.append
+    logger = logging.getLogger('api.query_debug')
+    logger.addHandler(handler)
+    app.config['SLOW_QUERY_MS'] = 0
+    try:
+        with app.test_request_context('/equipment'):
+            app.preprocess_request()
+            for equipment_id in range(5):
+                db.session.get(Equipment, equipment_id + 1000)
+            app.process_response(app.response_class())
+    finally:
+        app.config['SLOW_QUERY_MS'] = 100
+        logger.removeHandler(handler)
+
+    assert any(record.plan and 'Index Scan' in record.plan for record in records if hasattr(record, 'plan'))
+    assert [record.count for record in records if hasattr(record, 'count')] == [5]
+
+def test_operation_performed_at(app):
+    client = app.test_client()
+    result = client.post('/equipment/operation', json={'code': 'BATCH001', 'type': 'survey', 'cost': 7, 'performed_at': '2020-01-15T10:00:00Z'})
+    assert result.status_code == 201
+    result = client.post('/equipment/operation', json={'code': 'BATCH001', 'type': 'survey', 'cost': 7, 'performed_at': 'yesterday'})
+    assert result.status_code == 400
+
+    body = 'code,type,cost,performed_at\nBATCH001,survey,3,2020-02-01\nBATCH001,survey,4,\n'
+    result = client.post('/equipment/operation/batch', data=body, content_type='text/csv')
+    assert result.get_json()['inserted'] == 2
+    with app.app_context():
+        dates = sorted(operation.performed_at.isoformat() for operation in Operation.query.filter_by(type='survey', cost=7))
+        assert dates == ['2020-01-15T10:00:00+00:00']
+        assert Operation.query.filter_by(type='survey', cost=3).one().performed_at.isoformat() == '2020-02-01T00:00:00+00:00'
+
+def test_operation_costs_period(app):
+    client = app.test_client()
+    result = client.post('/equipment/operation/costs?since=2020-01-01&until=2020-02-01', json={'code': 'BATCH001'})
+    assert result.get_json()['message'] == 'Total cost: 7.0'
+    result = client.post('/equipment/operation/costs?since=2020-01-01&until=2020-03-01', json={'codes': ['BATCH001', '5310B9D7']})
+    breakdown = {equipment['code']: equipment for equipment in result.get_json()['equipments']}
+    assert breakdown['BATCH001']['count'] == 2
+    assert breakdown['5310B9D7']['count'] == 0
+
+    result = client.get('/vessel/operation/costs?until=2020-03-01')
+    assert result.get_json() == [{'MV101': 5.0}]
+    result = client.get('/equipment/operation?since=2020-01-01&until=2020-03-01&fields=cost')
+    assert [operation['cost'] for operation in result.get_json()] == [7, 3]
+
+    assert client.get('/vessel/operation/costs?since=later').status_code == 400
+    assert client.post('/equipment/operation/costs?since=2020-02-01&until=2020-01-01', json={'code': 'BATCH001'}).status_code == 400
+
+def test_operation_export_csv(app):
+    client = app.test_client()
+    app.config['EXPORT_CHUNK_SIZE'] = 2
+    try:
+        result = client.get('/equipment/operation/export?since=2020-01-01&until=2020-03-01&fields=vessel_code,equipment_code,cost,performed_at')
+    finally:
+        app.config['EXPORT_CHUNK_SIZE'] = 50000
+    assert result.status_code == 200
+    assert result.mimetype == 'text/csv'
+    assert result.headers['Content-Disposition'] == 'attachment; filename=operations.csv'
+    assert result.get_data(as_text=True).splitlines() == [
+        'vessel_code,equipment_code,cost,performed_at',
+        'MV101,BATCH001,7.0,2020-01-15 10:00:00+00:00',
+        'MV101,BATCH001,3.0,2020-02-01 00:00:00+00:00',
+    ]
+
+    with app.app_context():
+        count = Operation.query.count()
+    assert len(client.get('/equipment/operation/export').get_data(as_text=True).splitlines()) == count + 1
+    assert client.get('/equipment/operation/export?format=xlsx').status_code == 400
+    assert client.get('/equipment/operation/export?fields=id,secret').status_code == 400
+    assert client.get('/equipment/operation/export?min_cost=cheap').status_code == 400
+
+def test_operation_export_columnar(app):
+    pyarrow = pytest.importorskip('pyarrow')
+    import pyarrow.ipc
+    import pyarrow.parquet
+
+    client = app.test_client()
+    app.config['EXPORT_CHUNK_SIZE'] = 2
+    try:
+        result = client.get('/equipment/operation/export?format=arrow&code=BATCH001')
+        assert result.mimetype == 'application/vnd.apache.arrow.stream'
+        arrow = result.get_data()
+        parquet = client.get('/equipment/operation/export?format=parquet&code=BATCH001&fields=id,cost').get_data()
+    finally:
+        app.config['EXPORT_CHUNK_SIZE'] = 50000
+
+    table = pyarrow.ipc.open_stream(arrow).read_all()
+    assert table.column_names == ['id', 'equipment_id', 'equipment_code', 'vessel_code', 'type', 'cost', 'performed_at']
+    assert table.column('cost').to_pylist() == [7.0, 3.0, 4.0]
+    assert table.column('vessel_code').to_pylist() == ['MV101'] * 3
+
+    table = pyarrow.parquet.read_table(pyarrow.BufferReader(parquet))
+    assert table.column_names == ['id', 'cost']
+    assert table.column('cost').to_pylist() == [7.0, 3.0, 4.0]
+    assert pyarrow.parquet.ParquetFile(pyarrow.BufferReader(parquet)).num_row_groups == 2
+
+def test_operation_export_command(app, tmp_path):
+    output = tmp_path / 'operations.csv'
+    runner = app.test_cli_runner()
+    result = runner.invoke(args=['operations', 'export', '--fields', 'type,cost', '--filter', 'code=BATCH001', '--output', str(output)])
+    assert result.exit_code == 0
+    assert output.read_text().splitlines() == ['type,cost', 'survey,7.0', 'survey,3.0', 'survey,4.0']
+    assert runner.invoke(args=['operations', 'export', '--filter', 'since=later']).exit_code == 2
+
+def test_idempotent_operation(app):
+    client = app.test_client()
+    headers = {'Idempotency-Key': 'retry-0001'}
+    body = {'code': '5310B9D7', 'type': 'idempotent', 'cost': 1}
+    first = client.post('/equipment/operation', json=body, headers=headers)
+    retry = client.post('/equipment/operation', json=body, headers=headers)
+    assert first.status_code == retry.status_code == 201
+    assert retry.get_json() == first.get_json()
+    assert retry.headers['Idempotent-Replayed'] == 'true'
+    assert 'Idempotent-Replayed' not in first.headers
+    with app.app_context():
+        assert Operation.query.filter_by(type='idempotent').count() == 1
+
+    assert client.post('/equipment/operation', json={**body, 'cost': 2}, headers=headers).status_code == 422
+    assert client.post('/vessel', json={'code': 'MV900'}, headers=headers).status_code == 201
+
+    result = client.post('/equipment/operation', json={**body, 'code': 'UNKNOWN1'}, headers={'Idempotency-Key': 'retry-0002'})
+    assert result.status_code == 400
+    with app.app_context():
+        assert IdempotencyKey.query.filter_by(key='retry-0002').count() == 0
+    assert client.post('/equipment/operation', json=body, headers={'Idempotency-Key': 'k' * 256}).status_code == 400
+
+def test_idempotent_response_commits_with_write(app):
+    client = app.test_client()
+    headers = {'Idempotency-Key': 'retry-0003'}
+    # The duplicate code fails in the savepoint of the view: nothing is kept.
+    for _ in range(2):
+        result = client.post('/vessel', json={'code': 'MV102'}, headers=headers)
+        assert result.status_code == 409
+        assert 'Idempotent-Replayed' not in result.headers
+    with app.app_context():
+        assert IdempotencyKey.query.filter_by(key='retry-0003').count() == 0
+        assert IdempotencyKey.query.filter(IdempotencyKey.status_code.is_(None)).count() == 0
+
+def test_idempotency_expiry(app):
+    client = app.test_client()
+    expire = text("UPDATE idempotency_keys SET expires_at = now() - interval '1 second' WHERE endpoint = 'equipments.operation_equipment'")
+    with app.app_context():
+        db.session.execute(expire)
+        db.session.commit()
+    body = {'code': '5310B9D7', 'type': 'idempotent', 'cost': 2}
+    result = client.post('/equipment/operation', json=body, headers={'Idempotency-Key': 'retry-0001'})
+    assert result.status_code == 201
+    assert 'Idempotent-Replayed' not in result.headers
+
+    with app.app_context():
+        assert Operation.query.filter_by(type='idempotent').count() == 2
+        db.session.execute(expire)
+        db.session.commit()
+    result = app.test_cli_runner().invoke(args=['idempotency', 'purge'])
+    assert result.output == 'purged 1 keys\n'
+    with app.app_context():
+        assert [key.endpoint for key in IdempotencyKey.query] == ['vessels.insert_vessel']
+
+def test_deactivate_versions(app):
+    client = app.test_client()
+    client.post('/equipment', json={'vessel_code': 'MV101', 'code': 'VERS0001', 'location': 'chile', 'name': 'pump'})
+    with app.app_context():
+        equipment_id = Equipment.query.filter_by(code='VERS0001').one().id
+    assert client.get(f'/equipment/{equipment_id}').get_json()['version'] == 1
+
+    result = client.put('/equipment/inactive', json={'equipments': [{'code': 'VERS0001', 'version': 2}, '5310B9D7']})
+    assert result.status_code == 412
+    assert result.get_json()['conflicts'] == ['VERS0001']
+    with app.app_context():
+        assert Equipment.query.filter_by(code='VERS0001').one().active
+
+    result = client.put('/equipment/inactive', json={'equipments': [{'code': 'VERS0001', 'version': 1}]})
+    assert result.status_code == 201
+    assert client.get(f'/equipment/{equipment_id}').get_json()['version'] == 2
+    assert client.put('/equipment/inactive', json={'equipments': [{'code': 'VERS0001', 'version': 1}]}).status_code == 412
+    assert client.put('/equipment/inactive', json={'equipments': [{'code': 'VERS0001', 'version': '2'}]}).status_code == 400
+
+    equipments = [{'vessel_code': 'MV101', 'code': 'VERS0001', 'location': 'peru', 'name': 'pump'}]
+    assert client.post('/equipment/batch', json={'equipments': equipments, 'on_conflict': 'update'}).get_json()['updated'] == ['VERS0001']
+    assert client.post('/equipment/batch', json={'equipments': equipments, 'on_conflict': 'update'}).get_json()['skipped'] == ['VERS0001']
+    with app.app_context():
+        assert Equipment.query.filter_by(code='VERS0001').one().version == 3
+        Equipment.query.filter_by(code='VERS0001').update({'location': 'chile'})
+        Equipment.query.filter_by(code='VERS0001').update({'location': 'chile'})
+        db.session.commit()
+        assert Equipment.query.filter_by(code='VERS0001').one().version == 4
+
+def test_delete_if_match(app):
+    client = app.test_client()
+    with app.app_context():
+        equipment_id = Equipment.query.filter_by(code='VERS0001').one().id
+    etag = client.get(f'/equipment/{equipment_id}').headers['ETag']
+    assert etag == '"3"'
+    assert client.get(f'/equipment/{equipment_id}', headers={'If-None-Match': etag}).status_code == 304
+    assert client.delete(f'/equipment/{equipment_id}', headers={'If-Match': '"2"'}).status_code == 412
+    assert client.delete(f'/equipment/{equipment_id}', headers={'If-Match': '"latest"'}).status_code == 400
+    assert client.delete(f'/equipment/{equipment_id}', headers={'If-Match': f'"2", {etag}'}).status_code == 200
+    assert client.delete(f'/equipment/{equipment_id}', headers={'If-Match': '"3"'}).status_code == 404
+
+def test_delete_batch(app):
+    client = app.test_client()
+    with app.app_context():
+        equipment_id = Equipment.query.filter_by(code='BATCH001').one().id
+    assert client.get(f'/equipment/{equipment_id}').status_code == 200
+
+    result = client.delete('/equipment', json={'ids': [equipment_id, 999999]})
+    assert result.get_json() == {'message': '1 equipments not found.', 'missing': [999999]}
+    result = client.delete('/equipment', json={'ids': [equipment_id]})
+    assert result.get_json() == {'message': 'OK', 'deleted': 1}
+    assert client.get(f'/equipment/{equipment_id}').status_code == 404
+    with app.app_context():
+        assert Operation.query.filter_by(equipment_id=equipment_id).count() == 0
+    assert client.post('/equipment/operation/costs', json={'code': 'BATCH001'}).get_json()['message'] == 'Total cost: 0'
+    assert client.delete('/equipment', json={}).status_code == 400
@@ -1,12 +1,24 @@
+import io
+import json
+import logging
 import os
+import queue
+import subprocess
 import sys
+from logging.handlers import QueueListener
 
 import pytest
 from flask_migrate import Migrate
 
 sys.path.append(os.path.join(os.path.dirname(__file__),'../'))
 
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+
 from api.app import create_app
+from api.boot import pending_migrations
+from api.log import DeferredQueueHandler, JsonFormatter
+from api.metrics import MetricsDirectory, dump_series
 from config import db
 
 
@@ -27,3 +39,88 @@ def app():
 def test_heath_check(app):
     result = app.test_client().get('/')
     assert result.status_code == 200
+
+def test_request_id(app):
+    result = app.test_client().get('/', headers={'X-Request-ID': 'abc123'})
+    assert result.headers['X-Request-ID'] == 'abc123'
+    assert app.test_client().get('/').headers['X-Request-ID']
+
+def test_queued_exception_log():
+    log_queue, output = queue.SimpleQueue(), io.StringIO()
+    stream_handler = logging.StreamHandler(output)
+    stream_handler.setFormatter(JsonFormatter())
+    listener = QueueListener(log_queue, stream_handler)
+    logger = logging.getLogger('tests.queued')
+    logger.addHandler(DeferredQueueHandler(log_queue))
+    logger.propagate = False
+
+    listener.start()
+    try:
+        1 / 0
+    except ZeroDivisionError:
+        logger.exception('Job %d failed', 7, extra={'job_id': 7})
+    listener.stop()
+
+    entry = json.loads(output.getvalue())
+    assert (entry['message'], entry['job_id']) == ('Job 7 failed', 7)
+    assert 'ZeroDivisionError' in entry['exception']
+
+def test_production_config():
+    app = create_app(production_conf=True)
+    assert not app.debug
+    assert app.config['SQLALCHEMY_ENGINE_OPTIONS']['pool_pre_ping']
+
+def test_metrics(app):
+    client = app.test_client()
+    client.get('/vessel')
+    client.get('/vessel?format=ndjson')
+
+    result = client.get('/metrics')
+    assert result.status_code == 200
+    assert result.mimetype == 'text/plain'
+    body = result.get_data(as_text=True)
+    assert 'api_requests_total{endpoint="vessels.list_vessel",method="GET",status="200"} 2' in body
+    assert 'api_request_duration_seconds_count{endpoint="vessels.list_vessel"} 2' in body
+    assert 'api_db_statements_bucket{endpoint="vessels.list_vessel",le="+Inf"} 2' in body
+    assert 'api_db_pool_wait_seconds_count' in body
+    assert 'api_cache_hits_total' in body
+
+def test_metrics_across_processes(tmp_path):
+    requests = ('api_requests_total', (('endpoint', 'vessels.list_vessel'),))
+    waits = ('api_db_pool_wait_seconds', ())
+    entries = ('api_cache_entries', ())
+    directory = MetricsDirectory(str(tmp_path), 60, lambda: {requests: 2, waits: [1] + [0] * 9 + [0.001], entries: 3})
+
+    exited = subprocess.Popen([sys.executable, '-c', ''])
+    exited.wait()
+    dump_series({requests: 5, waits: [2] + [0] * 9 + [0.002], entries: 7}, str(tmp_path / f'{exited.pid}-old.json'))
+
+    for _ in range(2):
+        series = directory.collect()
+        assert series[requests] == 7
+        assert series[waits] == [3] + [0] * 9 + [0.003]
+        # Gauges of exited processes are dropped, their counters archived.
+        assert series[entries] == 3
+    assert not list(tmp_path.glob('*-old.json'))
+
+def test_failed_statement_timing(app):
+    with app.app_context(), db.engine.connect() as connection:
+        with pytest.raises(DBAPIError):
+            connection.execute(text('SELECT no_such_column'))
+        assert 'statement_started' not in connection.info
+
+def test_apidocs_lazy(app):
+    client = app.test_client()
+    assert 'swagger' not in app.extensions
+    spec = client.get('/apispec_1.json').get_json()
+    assert 'swagger' in app.extensions
+    assert 'delete' in spec['paths']['/vessel/{vessel_id}']
+    assert client.get('/apidocs/').status_code == 200
+    assert client.get('/apidocs/index.html').status_code == 302
+    assert client.get('/flasgger_static/swagger-ui.css').status_code == 200
+
+def test_boot_pending_migrations(app):
+    with app.app_context():
+        with db.engine.connect() as connection:
+            # The test database is built with create_all, never stamped.
+            assert pending_migrations(connection)
@@ -0,0 +1,62 @@
+import os
+import sys
+
+import pytest
+from flask_migrate import Migrate
+
+sys.path.append(os.path.join(os.path.dirname(__file__),'../'))
+
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql
+
+from api.app import create_app
+from api.models.equipment import Equipment, Operation
+from api.models.vessel import Vessel
+from config import db
+
+
+@pytest.fixture(scope="module")
+def app():
+    app = create_app(test_config=True)
+    
+    with app.app_context():
+        db.create_all()
+        Migrate(app, db)
+
+    yield app
+
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+
+def seq_scans(query):
+    """Return the tables a query reads with a sequential scan when the planner
+    is told to avoid them, i.e. the tables no index can serve."""
+    sql = query.statement.compile(dialect=postgresql.dialect(), compile_kwargs={'literal_binds': True})
+    db.session.execute(text('SET LOCAL enable_seqscan = off'))
+    plan = db.session.execute(text(f'EXPLAIN (FORMAT JSON) {sql}')).scalar()
+    db.session.rollback()
+
+    tables, nodes = [], [plan[0]['Plan']]
+    while nodes:
+        node = nodes.pop()
+        if node['Node Type'] == 'Seq Scan':
+            tables.append(node['Relation Name'])
+        nodes.extend(node.get('Plans', []))
+    return tables
+
+@pytest.mark.parametrize('build_query', [
+    lambda: Vessel.query.filter_by(code='MV102'),
+    lambda: Equipment.query.filter_by(code='5310B9D7'),
+    lambda: Equipment.query.filter_by(name='compressor'),
+    lambda: Equipment.query.filter_by(vessel_id=1),
+    lambda: Equipment.query.filter_by(active=True).order_by(Equipment.id),
+    lambda: Operation.query.filter_by(equipment_id=1),
+    lambda: Operation.query.join(Equipment).filter(Equipment.code == '5310B9D7'),
+    lambda: Equipment.query.filter_by(location='brazil'),
+    lambda: Operation.query.filter_by(type='repair'),
+    lambda: Operation.query.filter(Operation.cost.between(2, 10)).order_by(Operation.cost, Operation.id),
+])
+def test_hot_query_uses_index(app, build_query):
+    with app.app_context():
+        assert seq_scans(build_query()) == []
@@ -0,0 +1,129 @@
+import os
+import sys
+import time
+
+import pytest
+from flask_migrate import Migrate
+
+sys.path.append(os.path.join(os.path.dirname(__file__),'../'))
+
+from sqlalchemy import text
+
+from api.app import create_app
+from api.jobs import claim, enqueue, handler, requeue_stale, run_next
+from api.models.equipment import Equipment
+from api.models.job import Job
+from api.models.vessel import Vessel
+from config import db
+
+
+@pytest.fixture(scope="module")
+def app():
+    app = create_app(test_config=True)
+
+    with app.app_context():
+        db.create_all()
+        Migrate(app, db)
+        vessel = Vessel(code='MV102')
+        db.session.add(vessel)
+        db.session.flush()
+        for index in range(3):
+            db.session.add(Equipment(vessel_id=vessel.id, code=f'JOB0000{index}', location='brazil', name='pump'))
+        db.session.commit()
+
+    yield app
+
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+
+def test_deactivate_async(app):
+    client = app.test_client()
+    result = client.put('/equipment/inactive?async=true', json={'equipments': ['JOB00000', 'JOB00001']})
+    assert result.status_code == 202
+    job_id = result.get_json()['job_id']
+    assert result.headers['Location'].endswith(f'/jobs/{job_id}')
+    assert client.get(f'/jobs/{job_id}').get_json()['status'] == 'queued'
+
+    with app.app_context():
+        assert run_next() == job_id
+        assert run_next() is None
+        assert Equipment.query.filter_by(active=False).count() == 2
+
+    job = client.get(f'/jobs/{job_id}').get_json()
+    assert (job['status'], job['progress'], job['result']) == ('succeeded', 1.0, {'updated': 2, 'missing': []})
+    assert job['finished_at'] is not None
+
+def test_deactivate_async_missing(app):
+    client = app.test_client()
+    job_id = client.put('/equipment/inactive?async=true', json={'equipments': ['JOB00002', 'UNKNOWN1']}).get_json()['job_id']
+    with app.app_context():
+        run_next()
+        assert Equipment.query.filter_by(code='JOB00002').one().active
+
+    job = client.get(f'/jobs/{job_id}').get_json()
+    assert (job['status'], job['error'], job['result']) == ('failed', '1 equipments not found.', {'missing': ['UNKNOWN1']})
+
+def test_vessel_costs_async(app):
+    client = app.test_client()
+    result = client.post('/vessel/operation/costs?fresh=true&since=2020-01-01')
+    assert result.status_code == 202
+    with app.app_context():
+        run_next()
+    job = client.get(f"/jobs/{result.get_json()['job_id']}").get_json()
+    assert job['status'] == 'succeeded'
+    assert job['result'] == client.get('/vessel/operation/costs?fresh=true&since=2020-01-01').get_json()
+
+def test_unknown_job(app):
+    client = app.test_client()
+    assert client.get('/jobs/999999').status_code == 404
+    with app.app_context():
+        job_id = enqueue('unknown', {}).id
+        run_next()
+        assert db.session.get(Job, job_id).status == 'failed'
+
+def test_claim_skips_locked(app):
+    with app.app_context():
+        first, second = enqueue('unknown', {}).id, enqueue('unknown', {}).id
+        with db.engine.connect() as other:
+            transaction = other.begin()
+            other.execute(text('SELECT id FROM jobs WHERE id = :id FOR UPDATE'), {'id': first})
+            assert claim().id == second
+            transaction.rollback()
+        assert claim().id == first
+
+def test_requeue_stale(app):
+    with app.app_context():
+        db.session.execute(text("UPDATE jobs SET updated_at = now() - interval '1 hour' WHERE status = 'running'"))
+        db.session.execute(text("UPDATE jobs SET attempts = 3 WHERE id = (SELECT max(id) FROM jobs)"))
+        db.session.commit()
+        stale = requeue_stale()
+        assert len(stale) == 2
+        statuses = [job.status for job in Job.query.filter(Job.id.in_(stale)).order_by(Job.id)]
+        assert statuses == ['queued', 'failed']
+
+def test_worker_command(app):
+    client = app.test_client()
+    job_id = client.put('/equipment/inactive?async=true', json={'equipments': ['JOB00002']}).get_json()['job_id']
+    result = app.test_cli_runner().invoke(args=['jobs', 'worker', '--processes', '2', '--burst'])
+    assert result.exit_code == 0
+    assert client.get(f'/jobs/{job_id}').get_json()['status'] == 'succeeded'
+    with app.app_context():
+        assert Job.query.filter(Job.status.in_(['queued', 'running'])).count() == 0
+
+def test_heartbeat_keeps_long_jobs(app):
+    @handler('test_sleep')
+    def sleep_job(payload, progress):
+        time.sleep(payload['seconds'])
+        return requeue_stale()
+
+    config = {key: app.config[key] for key in ('JOB_STALE_SECONDS', 'JOB_HEARTBEAT_SECONDS')}
+    app.config.update(JOB_STALE_SECONDS=1, JOB_HEARTBEAT_SECONDS=0.2)
+    try:
+        with app.app_context():
+            job_id = enqueue('test_sleep', {'seconds': 1.5}).id
+            assert run_next() == job_id
+            job = db.session.get(Job, job_id)
+            assert (job.status, job.attempts, job.result) == ('succeeded', 1, [])
+    finally:
+        app.config.update(config)
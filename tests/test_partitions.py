@@ -0,0 +1,110 @@
+import os
+import sys
+from datetime import date, datetime, timezone
+
+import pytest
+from flask_migrate import Migrate
+
+sys.path.append(os.path.join(os.path.dirname(__file__),'../'))
+
+from sqlalchemy import func, inspect, text
+
+from api.app import create_app
+from api.models.equipment import Equipment, Operation, OperationCost
+from api.models.vessel import Vessel
+from api.jobs import maintain_partitions
+from api.partitions import add_months, create_partition, create_partitions, detach_partitions, missing_partitions, month_start, partitions
+from config import db
+
+
+@pytest.fixture(scope="module")
+def app():
+    app = create_app(test_config=True)
+
+    with app.app_context():
+        db.create_all()
+        Migrate(app, db)
+        vessel = Vessel(code='MV102')
+        db.session.add(vessel)
+        db.session.flush()
+        db.session.add(Equipment(vessel_id=vessel.id, code='5310B9D7', location='brazil', name='compressor'))
+        db.session.commit()
+
+    yield app
+
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+
+def add_operations(*performed_at):
+    equipment_id = Equipment.query.filter_by(code='5310B9D7').one().id
+    for day in performed_at:
+        db.session.add(Operation(equipment_id=equipment_id, type='repair', cost=10, performed_at=day))
+    db.session.commit()
+
+def test_create_partitions(app):
+    with app.app_context():
+        add_operations(datetime(2020, 1, 5, tzinfo=timezone.utc), datetime(2020, 2, 5, tzinfo=timezone.utc))
+        assert partitions() == []
+        created = create_partitions(months_ahead=1, today=date(2020, 1, 10))
+        assert created == ['operations_2020_01', 'operations_2020_02']
+        assert create_partitions(months_ahead=1, today=date(2020, 1, 10)) == []
+        assert partitions() == [date(2020, 1, 1), date(2020, 2, 1)]
+
+        # The rows of those months left the default partition.
+        located = db.session.execute(text('SELECT tableoid::regclass::text FROM operations ORDER BY performed_at')).scalars()
+        assert list(located) == ['operations_2020_01', 'operations_2020_02']
+
+def test_missing_partitions(app):
+    with app.app_context(), db.engine.connect() as connection:
+        assert missing_partitions(0, today=date(2020, 2, 10), connection=connection) == []
+        assert missing_partitions(2, today=date(2020, 2, 10), connection=connection) == [date(2020, 3, 1), date(2020, 4, 1)]
+
+def test_period_prunes_partitions(app):
+    with app.app_context():
+        query = Operation.query.filter(
+            Operation.performed_at >= datetime(2020, 2, 1, tzinfo=timezone.utc),
+            Operation.performed_at < datetime(2020, 3, 1, tzinfo=timezone.utc)
+        )
+        statement = query.statement.compile(db.engine)
+        plan = '\n'.join(db.session.connection().exec_driver_sql(f'EXPLAIN {statement}', statement.params).scalars())
+        assert 'operations_2020_02' in plan
+        assert 'operations_2020_01' not in plan
+        assert 'operations_default' not in plan
+
+def test_detach_partitions(app):
+    with app.app_context():
+        add_operations(datetime(2020, 3, 5, tzinfo=timezone.utc))
+        assert detach_partitions(datetime(2020, 2, 15, tzinfo=timezone.utc)) == ['operations_2020_01_detached']
+        assert partitions() == [date(2020, 2, 1)]
+        assert inspect(db.engine).get_foreign_keys('operations_2020_01_detached') == []
+
+        rollup = OperationCost.query.filter_by(type='repair').one()
+        live = db.session.query(func.count(Operation.id), func.sum(Operation.cost)).one()
+        assert (rollup.count, rollup.total) == tuple(live) == (2, 20)
+
+        assert detach_partitions(datetime(2020, 3, 1, tzinfo=timezone.utc), drop=True) == ['operations_2020_02']
+        assert Operation.query.count() == 1
+
+        create_partition(date(2020, 1, 1))
+        db.session.commit()
+        assert detach_partitions(datetime(2020, 2, 1, tzinfo=timezone.utc)) == ['operations_2020_01_detached_2']
+        db.session.execute(text('DROP TABLE operations_2020_01_detached, operations_2020_01_detached_2'))
+        db.session.commit()
+
+def test_partitions_cli(app):
+    runner = app.test_cli_runner()
+    result = runner.invoke(args=['partitions', 'create', '--months-ahead', '0'])
+    assert result.exit_code == 0
+    result = runner.invoke(args=['partitions', 'list'])
+    assert result.output == f'{datetime.now(timezone.utc):%Y-%m}\n'
+    result = runner.invoke(args=['partitions', 'detach', '--before', 'soon'])
+    assert result.exit_code == 2
+
+def test_workers_create_partitions(app):
+    with app.app_context():
+        maintain_partitions()
+        current = month_start(datetime.now(timezone.utc))
+        upcoming = [add_months(current, offset) for offset in range(app.config['PARTITION_MONTHS_AHEAD'] + 1)]
+        assert set(upcoming) <= set(partitions())
+        assert missing_partitions(app.config['PARTITION_MONTHS_AHEAD']) == []
@@ -1,5 +1,6 @@
 import os
 import sys
+from datetime import datetime, timedelta, timezone
 
 import pytest
 from flask_migrate import Migrate
@@ -7,8 +8,12 @@ from flask_migrate import Migrate
 sys.path.append(os.path.join(os.path.dirname(__file__),'../'))
 
 from sqlalchemy import func
+from werkzeug.http import http_date
 
 from api.app import create_app
+from api.query_debug import assert_max_queries
+from api.models.equipment import Equipment, Operation, OperationCost
+from api.models.table_version import TableVersion
 from api.models.vessel import Vessel
 from config import db
 
@@ -48,3 +53,235 @@ def test_insert_replicated(app):
 def test_operation_check(app):
     result = app.test_client().get('/vessel/operation/costs')
     assert result.status_code == 200
+
+def test_list_pagination(app):
+    client = app.test_client()
+    client.post('/vessel', json={'code':'MV103'})
+
+    result = client.get('/vessel?limit=1')
+    assert result.status_code == 200
+    assert [vessel['code'] for vessel in result.get_json()] == ['MV102']
+    assert 'rel="next"' in result.headers['Link']
+
+    next_url = result.headers['Link'][1:result.headers['Link'].index('>')]
+    result = client.get(next_url)
+    assert [vessel['code'] for vessel in result.get_json()] == ['MV103']
+    assert 'Link' not in result.headers
+
+def test_list_invalid_limit(app):
+    result = app.test_client().get('/vessel?limit=0')
+    assert result.status_code == 400
+
+def test_list_ndjson(app):
+    result = app.test_client().get('/vessel?format=ndjson')
+    assert result.status_code == 200
+    assert result.mimetype == 'application/x-ndjson'
+    lines = result.get_data(as_text=True).splitlines()
+    assert len(lines) == 2
+
+def test_insert_batch(app):
+    client = app.test_client()
+    result = client.post('/vessel/batch', json={'vessels': [{'code': 'MV102'}, {'code': 'MV200'}, {'code': 'MV201'}]})
+    assert result.status_code == 201
+    assert result.get_json()['inserted'] == ['MV200', 'MV201']
+    assert result.get_json()['skipped'] == ['MV102']
+
+    result = client.post('/vessel/batch', json={'vessels': [{'code': 'MV200'}, {'code': 'MV202'}], 'on_conflict': 'update'})
+    assert result.get_json()['inserted'] == ['MV202']
+    assert (result.get_json()['updated'], result.get_json()['skipped']) == ([], ['MV200'])
+
+def test_insert_batch_invalid(app):
+    result = app.test_client().post('/vessel/batch', json={'vessels': [{'code': 'MV203'}, {'code': 'TOO-LONG-CODE'}]})
+    assert result.status_code == 400
+    assert result.get_json()['errors'][0]['row'] == 2
+    with app.app_context():
+        assert Vessel.query.filter_by(code='MV203').first() is None
+
+def test_view_cached(app):
+    client = app.test_client()
+    stats = client.get('/cache/stats').get_json()
+
+    assert client.get('/vessel/1').get_json()['code'] == 'MV102'
+    assert client.get('/vessel/1').get_json()['code'] == 'MV102'
+
+    after = client.get('/cache/stats').get_json()
+    assert after['misses'] == stats['misses'] + 1
+    assert after['hits'] == stats['hits'] + 1
+
+def test_delete_invalidates_cache(app):
+    client = app.test_client()
+    vessel_id = client.get('/vessel?limit=1000').get_json()[-1]['id']
+    assert client.get(f'/vessel/{vessel_id}').status_code == 200
+    assert client.delete(f'/vessel/{vessel_id}').status_code == 200
+    assert client.get(f'/vessel/{vessel_id}').status_code == 404
+
+def test_conditional_get(app):
+    client = app.test_client()
+    result = client.get('/vessel/1')
+    etag, last_modified = result.headers['ETag'], result.headers['Last-Modified']
+    assert 's-maxage' in result.headers['Cache-Control']
+
+    stats = client.get('/cache/stats').get_json()
+    result = client.get('/vessel/1', headers={'If-None-Match': etag})
+    assert result.status_code == 304
+    assert result.get_data() == b''
+    assert client.get('/cache/stats').get_json()['hits'] == stats['hits']
+
+    # The Last-Modified sent back revalidates, despite its lost fraction of a second.
+    assert client.get('/vessel/1', headers={'If-Modified-Since': last_modified}).status_code == 304
+    now = datetime.now(timezone.utc)
+    assert client.get('/vessel/1', headers={'If-Modified-Since': http_date(now)}).status_code == 304
+    earlier = http_date(now - timedelta(hours=1))
+    assert client.get('/vessel/1', headers={'If-Modified-Since': earlier}).status_code == 200
+    future = http_date(now + timedelta(hours=1))
+    assert client.get('/vessel/1', headers={'If-Modified-Since': future}).status_code == 200
+
+    client.post('/vessel', json={'code': 'MV300'})
+    result = client.get('/vessel/1', headers={'If-None-Match': etag})
+    assert result.status_code == 200
+    assert result.headers['ETag'] != etag
+
+def test_conditional_get_sees_other_process_writes(app):
+    client = app.test_client()
+    etag = client.get('/vessel/1').headers['ETag']
+
+    # Written as by another worker: the cache of this one is never told.
+    with app.app_context():
+        Vessel.query.filter_by(id=1).update({'code': 'MV109'})
+        db.session.commit()
+    result = client.get('/vessel/1', headers={'If-None-Match': etag})
+    assert result.status_code == 200
+    assert result.headers['ETag'] != etag
+    assert result.get_json()['code'] == 'MV109'
+    assert client.get('/vessel/1', headers={'If-None-Match': result.headers['ETag']}).status_code == 304
+
+    with app.app_context():
+        Vessel.query.filter_by(id=1).update({'code': 'MV102'})
+        db.session.commit()
+
+def test_writers_do_not_wait_on_versions(app):
+    with app.app_context():
+        version = db.session.get(TableVersion, 'vessels').version
+        db.session.remove()
+        with db.engine.connect() as connection:
+            # A writer still in its transaction holds no lock on table_versions.
+            transaction = connection.begin()
+            connection.execute(Vessel.__table__.insert().values(code='MV800'))
+            result = app.test_client().post('/vessel', json={'code': 'MV801'})
+            transaction.rollback()
+        assert result.status_code == 201
+        assert db.session.get(TableVersion, 'vessels').version == version + 1
+
+def test_conditional_get_list(app):
+    client = app.test_client()
+    etag = client.get('/vessel?limit=1').headers['ETag']
+    assert client.get('/vessel?limit=1', headers={'If-None-Match': etag}).status_code == 304
+    assert client.get('/vessel?limit=2', headers={'If-None-Match': etag}).status_code == 200
+
+    etag = client.get('/vessel/operation/costs').headers['ETag']
+    assert client.get('/vessel/operation/costs', headers={'If-None-Match': etag}).status_code == 304
+
+def test_read_query_counts(app):
+    client = app.test_client()
+    with assert_max_queries(2):
+        client.get('/vessel/1')
+    with assert_max_queries(2):
+        client.get('/vessel?limit=1000')
+    with assert_max_queries(2):
+        client.get('/vessel/operation/costs')
+
+def test_write_query_counts(app):
+    client = app.test_client()
+    # Every commit reads the tables it wrote, then bumps their versions.
+    with assert_max_queries(3):
+        client.post('/vessel', json={'code': 'MV400'})
+    vessels = [{'code': f'MV5{index:02}'} for index in range(50)]
+    with assert_max_queries(3):
+        client.post('/vessel/batch', json={'vessels': vessels})
+
+def test_delete_cascades(app):
+    client = app.test_client()
+    client.post('/vessel', json={'code': 'MV600'})
+    client.post('/equipment', json={'vessel_code': 'MV600', 'code': 'CASC0001', 'location': 'brazil', 'name': 'pump'})
+    client.post('/equipment/operation/batch', json=[{'code': 'CASC0001', 'type': 'repair', 'cost': cost} for cost in range(100)])
+    with app.app_context():
+        vessel_id = Vessel.query.filter_by(code='MV600').one().id
+        equipment_id = Equipment.query.filter_by(code='CASC0001').one().id
+    assert client.get(f'/equipment/{equipment_id}').status_code == 200
+
+    with assert_max_queries(3):
+        assert client.delete(f'/vessel/{vessel_id}').status_code == 200
+    assert client.get(f'/equipment/{equipment_id}').status_code == 404
+    with app.app_context():
+        assert Operation.query.filter_by(equipment_id=equipment_id).count() == 0
+        assert OperationCost.query.filter_by(equipment_id=equipment_id).count() == 0
+    assert client.delete(f'/vessel/{vessel_id}').status_code == 404
+
+def test_delete_batch(app):
+    client = app.test_client()
+    with app.app_context():
+        ids = [vessel.id for vessel in Vessel.query.filter(Vessel.code.like('MV5%'))]
+    result = client.delete('/vessel', json={'ids': ids + [999999]})
+    assert result.status_code == 400
+    assert result.get_json()['missing'] == [999999]
+
+    result = client.delete('/vessel', json={'ids': ids})
+    assert result.status_code == 200
+    assert result.get_json()['deleted'] == 50
+    with app.app_context():
+        assert Vessel.query.filter(Vessel.id.in_(ids)).count() == 0
+
+    assert client.delete('/vessel', json={'ids': ['MV101']}).status_code == 400
+    assert client.delete('/vessel', json={'ids': [True]}).status_code == 400
+
+def test_operation_stats(app):
+    client = app.test_client()
+    client.post('/vessel', json={'code': 'MV700'})
+    for code, location in (('STAT0001', 'brazil'), ('STAT0002', 'chile'), ('STAT0003', 'chile')):
+        client.post('/equipment', json={'vessel_code': 'MV700', 'code': code, 'location': location, 'name': 'pump'})
+    operations = [{'code': 'STAT0001', 'type': 'repair', 'cost': cost} for cost in (1, 2, 3, 4)]
+    operations += [{'code': 'STAT0002', 'type': 'survey', 'cost': 10}, {'code': 'STAT0002', 'type': 'survey', 'cost': 20}]
+    operations.append({'code': 'STAT0003', 'type': 'repair', 'cost': 5})
+    client.post('/equipment/operation/batch', json=operations)
+
+    result = client.get('/vessel/operation/stats?vessel_code=MV700&top=2')
+    assert result.status_code == 200
+    [group] = result.get_json()['groups']['vessel_code']
+    assert group.pop('vessel_code') == 'MV700'
+    assert group == pytest.approx({'count': 7, 'total': 45, 'average': 45 / 7, 'min': 1, 'max': 20, 'p50': 4, 'p90': 14, 'p99': 19.4})
+    top = result.get_json()['top_equipments']['MV700']
+    assert [(equipment['code'], equipment['total']) for equipment in top] == [('STAT0002', 30.0), ('STAT0001', 10.0)]
+
+    with assert_max_queries(2):
+        result = client.get('/vessel/operation/stats?vessel_code=MV700&group_by=type&group_by=vessel_code,location&percentiles=0.5&top=0')
+    groups = result.get_json()['groups']
+    assert 'top_equipments' not in result.get_json()
+    assert [(group['type'], group['count'], group['p50']) for group in groups['type']] == [('repair', 5, 3.0), ('survey', 2, 15.0)]
+    assert [(group['location'], group['total']) for group in groups['vessel_code,location']] == [('brazil', 10.0), ('chile', 35.0)]
+    assert set(groups['type'][0]) == {'type', 'count', 'total', 'average', 'min', 'max', 'p50'}
+
+    result = client.get('/vessel/operation/stats?vessel_code=MV700&group_by=type,location&group_by=location,type&top=0')
+    groups = result.get_json()['groups']
+    assert list(groups) == ['type,location']
+    assert [(group['type'], group['location'], group['count']) for group in groups['type,location']] == [
+        ('repair', 'brazil', 4), ('repair', 'chile', 1), ('survey', 'chile', 2)
+    ]
+
+    client.post('/vessel', json={'code': 'MV701'})
+    for code in ('STAT0011', 'STAT0012'):
+        client.post('/equipment', json={'vessel_code': 'MV701', 'code': code, 'location': 'peru', 'name': 'pump'})
+    assert client.post('/equipment/operation', json={'code': 'STAT0011', 'type': 'survey', 'cost': None}).status_code == 201
+    client.post('/equipment/operation', json={'code': 'STAT0012', 'type': 'repair', 'cost': 8})
+    result = client.get('/vessel/operation/stats?vessel_code=MV701&group_by=equipment_code&percentiles=0.5')
+    assert result.status_code == 200
+    groups = {group['equipment_code']: group for group in result.get_json()['groups']['equipment_code']}
+    assert (groups['STAT0011']['count'], groups['STAT0011']['p50']) == (0, None)
+    assert groups['STAT0012']['p50'] == 8
+    # Without any cost, an equipment never ranks ahead of the ones spending.
+    top = result.get_json()['top_equipments']['MV701']
+    assert [(equipment['code'], equipment['total']) for equipment in top] == [('STAT0012', 8.0)]
+
+    assert client.get('/vessel/operation/stats?group_by=vessel_code,color').status_code == 400
+    assert client.get('/vessel/operation/stats?percentiles=0.5,2').status_code == 400
+    assert client.get('/vessel/operation/stats?top=many').status_code == 400
+    assert client.get('/vessel/operation/stats?min_cost=cheap').status_code == 400